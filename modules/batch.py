@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from . import music_sequencer as ms
+except ImportError:
+    import music_sequencer as ms
+
+#Genre subclasses by name and by the letters used in interface.user_interface()
+GENRES = {'jazz': ms.Jazz, 'j': ms.Jazz, 'pop': ms.Pop, 'p': ms.Pop,
+          'country': ms.Country, 'c': ms.Country}
+
+def build_piece(spec, index = 0):
+    """Creates an unsequenced Genre instance from a piece spec.
+
+    Parameters
+    ----------
+    spec : dict
+      Piece spec with keys genre, key_chord, add_to_chord, variation and
+      optionally seed, name and change_key
+    index : int, default=0
+      Position of the spec, used for the default name
+
+    Returns
+    ----------
+    music_piece : Genre instance
+      Instance of the Jazz, Pop or Country subclass, or of a registered genre
+    """
+    genre = GENRES.get(str(spec['genre']).lower())
+    if genre is None:
+        #Genres registered as data with genres.register_genre()
+        genre = ms.genre_class(str(spec['genre']))
+    name = spec.get('name', f'Piece {index}')
+    return genre(name, spec['key_chord'], spec.get('add_to_chord', 'major'),
+                 int(spec['variation']), spec.get('seed'))
+
+def sequence_spec(spec, index = 0, render = False, output_dir = None):
+    """Builds and sequences one piece spec without any display.
+
+    Parameters
+    ----------
+    spec : dict
+      Piece spec, see build_piece()
+    index : int, default=0
+      Position of the spec, used for names of rendered files
+    render : bool, default=False
+      Whether to render the piece to audio
+    output_dir : str, optional
+      Folder for rendered files, the working directory by default
+
+    Returns
+    ----------
+    music_piece : Genre instance
+      Sequenced piece, holding compact note events
+    """
+    music_piece = build_piece(spec, index)
+    if isinstance(music_piece, (ms.Jazz, ms.DataGenre)):
+        music_piece.sequence(change_key = spec.get('change_key', False), compact = True,
+                             play = False)
+    else:
+        music_piece.sequence(compact = True, play = False)
+
+    if render == True:
+        name = os.path.join(output_dir or '.', f'piece_{index}')
+        music_piece.last_render = ms.render_music(music_piece.playback_tracks(), False,
+                                                  isinstance(music_piece, ms.Country), name)
+        music_piece.sequence_render = music_piece.last_render
+    return music_piece
+
+def _sequence_chunk(chunk, render, output_dir):
+    """Sequences a chunk of (index, spec) pairs inside a worker process."""
+    return [(index, sequence_spec(spec, index, render, output_dir)) for index, spec in chunk]
+
+def generate_batch(specs, workers = None, chunksize = None, render = False, output_dir = None):
+    """Sequences many piece specs across a process pool.
+
+    Parameters
+    ----------
+    specs : list
+      List of piece specs, see build_piece()
+    workers : int, optional
+      Number of worker processes, the number of CPUs by default
+    chunksize : int, optional
+      Number of specs sent to a worker at once, about four chunks per worker by default
+    render : bool, default=False
+      Whether workers also render every piece to audio
+    output_dir : str, optional
+      Folder for rendered files, the working directory by default
+
+    Returns
+    ----------
+    iterator
+      (index, Genre instance) pairs in order of completion
+
+    Notes
+    ----------
+    Pieces are sequenced with compact note events so that little data crosses
+    process boundaries; chord_tracks converts them on first access.
+    """
+    specs = list(specs)
+    if not specs:
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(specs) // (workers * 4))
+
+    indexed = list(enumerate(specs))
+    chunks = [indexed[i:i + chunksize] for i in range(0, len(indexed), chunksize)]
+
+    #Stream results back as soon as each chunk finishes
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(_sequence_chunk, chunk, render, output_dir)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    from . import render
+except ImportError:
+    import render
+
+def content_key(*parts):
+    """Hashes the parts of a render job into a content address.
+
+    Parameters
+    ----------
+    *parts : bytes or object
+      Raw bytes are hashed as they are, other objects through their repr()
+
+    Returns
+    ----------
+    str
+      Hexadecimal SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode()
+        #Length prefix so that different splits of the same bytes differ
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+class RenderCache():
+    """Content-addressed on-disk store of rendered MIDI and audio files.
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+      Folder holding the cached files
+    max_bytes : int
+      Total size above which least recently used files are evicted
+
+    Methods
+    ----------
+    lookup(key)
+      Returns the cached render of a key or None
+    store(key, result)
+      Copies the artifacts of a render into the cache
+    evict()
+      Removes least recently used files until the cache fits in max_bytes
+
+    Notes
+    ----------
+    The folder is scanned for its total size once, which is then kept up to
+    date as files are added, so that storing a render only walks the folder
+    again when files have to be evicted.
+    """
+    def __init__(self, directory, max_bytes = 512 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None #Total size of the cached files, None until scanned
+        self._lock = threading.Lock()
+
+    def path(self, key, suffix):
+        """Returns the content address of a key and file type."""
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get(self, key, suffix):
+        """Returns the path of a cached file and marks it as recently used.
+
+        Returns
+        ----------
+        str or None
+          Path of the cached file, None when it is not cached
+        """
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, suffix, source):
+        """Copies a file into the cache with an atomic rename.
+
+        Parameters
+        ----------
+        key : str
+          Content address of the file
+        suffix : str
+          File extension such as '.mid' or '.wav'
+        source : str or bytes
+          Path of the file to copy, or its contents
+
+        Returns
+        ----------
+        str
+          Path of the cached file
+        """
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        handle, temp_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = '.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    temp_file.write(source)
+                else:
+                    with open(source, 'rb') as source_file:
+                        shutil.copyfileobj(source_file, temp_file)
+                added = temp_file.tell()
+            try:
+                added -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            #Readers only ever see complete files
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+        return path
+
+    def lookup(self, key):
+        """Returns the cached render of a key.
+
+        Returns
+        ----------
+        render.RenderResult or None
+          Cached MIDI and audio files, None unless both are cached
+        """
+        audio_path = self.get(key, '.wav')
+        midi_path = self.get(key, '.mid')
+        if audio_path is None or midi_path is None:
+            return None
+        return render.RenderResult(midi_path, audio_path)
+
+    def store(self, key, result):
+        """Copies the artifacts of a render into the cache.
+
+        Parameters
+        ----------
+        key : str
+          Content address of the render job
+        result : render.RenderResult
+          Render whose files are copied
+
+        Returns
+        ----------
+        render.RenderResult
+          Result pointing at the cached files
+        """
+        midi_path = self.path(key, '.mid')
+        if os.path.abspath(result.midi_path) != os.path.abspath(midi_path):
+            midi_path = self.put(key, '.mid', result.midi_path)
+        audio_path = None
+        if result.audio_path is not None:
+            audio_path = self.put(key, '.wav', result.audio_path)
+        if self.size() > self.max_bytes:
+            self.evict()
+        return render.RenderResult(midi_path, audio_path, result.elapsed, result.log)
+
+    def size(self):
+        """Returns the total size of the cached files in bytes, scanned on first use."""
+        if self._size is None:
+            total = sum(entry[2] for entry in self._entries())
+            with self._lock:
+                if self._size is None:
+                    self._size = total
+        return self._size
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, folders, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Removes least recently used files until the cache fits in max_bytes.
+
+        Returns
+        ----------
+        int
+          Number of bytes removed
+        """
+        entries = sorted(self._entries())
+        total = sum(entry[2] for entry in entries)
+        removed = 0
+        for mtime, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += size
+        #The scan also corrects the size for files changed by other processes
+        with self._lock:
+            self._size = total
+        return removed
+
+    def clear(self):
+        """Removes every cached file."""
+        shutil.rmtree(self.directory, ignore_errors = True)
+        with self._lock:
+            self._size = 0
+
+#Environment variable naming the cache folder, set empty to disable caching
+CACHE_VARIABLE = 'MUSIC_SEQUENCER_CACHE'
+
+def default_directory():
+    """Returns the folder of the render cache used by the sequencer.
+
+    Returns
+    ----------
+    str or None
+      Folder named by the MUSIC_SEQUENCER_CACHE environment variable, None
+      when it is set empty, otherwise music_sequencer in the per-user cache
+      folder, $XDG_CACHE_HOME or ~/.cache, or %LOCALAPPDATA% on Windows
+    """
+    directory = os.environ.get(CACHE_VARIABLE)
+    if directory is not None:
+        return directory or None
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base and os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'music_sequencer')
+
+#Cache used by the sequencer, swappable through set_cache()
+_cache = RenderCache(default_directory()) if default_directory() is not None else None
+
+def get_cache():
+    """Returns the render cache used by the sequencer, None when disabled."""
+    return _cache
+
+def set_cache(render_cache):
+    """Swaps the render cache used by the sequencer.
+
+    Parameters
+    ----------
+    render_cache : RenderCache or None
+      Cache to use, None to disable caching
+
+    Returns
+    ----------
+    previous : RenderCache or None
+      Cache that was replaced
+    """
+    global _cache
+    previous = _cache
+    _cache = render_cache
+    return previous
@@ -0,0 +1,215 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+from time import perf_counter
+
+#Seconds spent importing each heavy module, filled in by timed_import()
+IMPORT_TIMES = {}
+
+def timed_import(name):
+    """Imports a module when it is first needed and records how long it took.
+
+    Parameters
+    ----------
+    name : str
+      Module name, relative to this package when it starts with a dot
+
+    Returns
+    ----------
+    module
+      The imported module
+    """
+    start = perf_counter()
+    if name.startswith('.') and not __package__:
+        #Run as a script from the modules folder
+        module = importlib.import_module(name[1:])
+    else:
+        module = importlib.import_module(name, __package__)
+    IMPORT_TIMES.setdefault(name.lstrip('.'), perf_counter() - start)
+    return module
+
+def parse_spec(text):
+    """Reads a piece spec written as GENRE:KEY[:MODE[:VARIATION[:SEED]]].
+
+    Parameters
+    ----------
+    text : str
+      Spec such as 'jazz:Db:minor:6:5'
+
+    Returns
+    ----------
+    spec : dict
+      Piece spec as taken by batch.build_piece()
+    """
+    fields = text.split(':')
+    if len(fields) < 2 or len(fields) > 5:
+        raise ValueError(f'Piece spec {text!r} is not GENRE:KEY[:MODE[:VARIATION[:SEED]]]')
+    spec = {'genre': fields[0], 'key_chord': fields[1],
+            'add_to_chord': fields[2] if len(fields) > 2 else 'major',
+            'variation': int(fields[3]) if len(fields) > 3 else 4}
+    if len(fields) > 4:
+        spec['seed'] = int(fields[4])
+    return spec
+
+def load_specs(path):
+    """Reads piece specs from a JSON or YAML file.
+
+    Parameters
+    ----------
+    path : str
+      File holding a list of specs, or a mapping with the list under 'pieces'
+
+    Returns
+    ----------
+    specs : list
+      Piece specs as taken by batch.build_piece()
+    """
+    with open(path) as spec_file:
+        text = spec_file.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError('Reading YAML spec files needs PyYAML installed')
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get('pieces', [data])
+    return list(data)
+
+def build_parser():
+    """Builds the argument parser of the command line."""
+    parser = argparse.ArgumentParser(
+        prog = 'music_sequencer',
+        description = 'Sequences music pieces without any prompts and writes their MIDI files.')
+    parser.add_argument('specs', nargs = '*', metavar = 'SPEC',
+                        help = 'piece spec GENRE:KEY[:MODE[:VARIATION[:SEED]]], ' +
+                               'such as jazz:Db:minor:6:5')
+    parser.add_argument('-f', '--file', action = 'append', default = [],
+                        help = 'JSON or YAML file holding a list of piece specs')
+    parser.add_argument('-o', '--output', default = '.', help = 'folder for the written files')
+    parser.add_argument('--render', action = 'append', metavar = 'FORMAT',
+                        choices = ['wav', 'mp3', 'ogg', 'flac'],
+                        help = 'also render audio in a format of wav, mp3, ogg or flac, ' +
+                               'repeated for several formats')
+    parser.add_argument('--skip-duplicates', type = float, metavar = 'SIMILARITY',
+                        help = 'with --render, do not render audio of pieces whose chords ' +
+                               'match an earlier piece in any key from this similarity, ' +
+                               'such as 0.9')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of worker processes sequencing pieces')
+    parser.add_argument('--import-times', action = 'store_true',
+                        help = 'report the time spent importing modules')
+    return parser
+
+def write_piece(music_piece, index, output, formats = None):
+    """Writes the MIDI file of a sequenced piece and optionally its audio.
+
+    Parameters
+    ----------
+    music_piece : Genre instance
+      Sequenced piece
+    index : int
+      Position of the piece, used for its file name
+    output : str
+      Folder for the written files
+    formats : list, optional
+      Audio formats to render, such as ['wav', 'mp3']
+
+    Returns
+    ----------
+    paths : list
+      Paths of the written files
+    """
+    ms = timed_import('.music_sequencer')
+    name = os.path.join(output, f'piece_{index}')
+    midi_data = ms.midi_bytes(music_piece.playback_tracks(), False,
+                              isinstance(music_piece, ms.Country))
+    with open(name + '.mid', 'wb') as midi_out:
+        midi_out.write(midi_data)
+    paths = [name + '.mid']
+    if formats:
+        export = timed_import('.export')
+        audio_paths = [f'{name}.{audio_format}' for audio_format in formats]
+        export.export_music(midi_data, audio_paths)
+        paths += audio_paths
+    return paths
+
+def main(argv = None):
+    """Runs the command line.
+
+    Parameters
+    ----------
+    argv : list, optional
+      Arguments, sys.argv[1:] by default
+
+    Returns
+    ----------
+    int
+      Exit status, 0 on success and 2 for invalid specs
+    """
+    start = perf_counter()
+    parser = build_parser()
+    #Specs may follow options, as every option takes exactly one value
+    args = parser.parse_intermixed_args(argv)
+    if args.skip_duplicates is not None and args.render is None:
+        #Duplicates are only ever skipped when rendering, so the option alone does nothing
+        parser.error('--skip-duplicates requires --render')
+    try:
+        specs = [parse_spec(text) for text in args.specs]
+        for path in args.file:
+            specs += load_specs(path)
+    except (OSError, ValueError) as error:
+        print(f'error: {error}', file = sys.stderr)
+        return 2
+    if not specs:
+        print('error: no piece specs given', file = sys.stderr)
+        return 2
+
+    #Heavy modules are only imported once there is something to sequence,
+    #NumPy and musicpy first so that their share is reported apart
+    timed_import('numpy')
+    timed_import('musicpy')
+    timed_import('.music_sequencer')
+    batch = timed_import('.batch')
+    formats = args.render
+    os.makedirs(args.output, exist_ok = True)
+
+    try:
+        if args.workers > 1:
+            pieces = batch.generate_batch(specs, workers = args.workers)
+        else:
+            pieces = ((index, batch.sequence_spec(spec, index)) for index, spec in enumerate(specs))
+        if args.skip_duplicates is not None:
+            fingerprints = timed_import('.fingerprint').FingerprintIndex()
+        else:
+            fingerprints = None
+        for index, music_piece in pieces:
+            piece_formats = formats
+            if fingerprints is not None:
+                #Near-duplicates keep their MIDI file but are not rendered again
+                match = fingerprints.duplicate_of(music_piece, args.skip_duplicates)
+                if match is None:
+                    fingerprints.add(index, music_piece)
+                else:
+                    print(f'piece_{index} repeats piece_{match}, audio not rendered',
+                          file = sys.stderr)
+                    piece_formats = None
+            for path in write_piece(music_piece, index, args.output, piece_formats):
+                print(path)
+    except (KeyError, ValueError) as error:
+        print(f'error: invalid piece spec, {error}', file = sys.stderr)
+        return 2
+
+    if args.import_times:
+        print('import times:', file = sys.stderr)
+        for name, seconds in IMPORT_TIMES.items():
+            print(f'  {name:<20}{seconds:.3f} s', file = sys.stderr)
+        print(f'  {"total run":<20}{perf_counter() - start:.3f} s', file = sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
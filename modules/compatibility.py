@@ -0,0 +1,233 @@
+import numpy as np
+from musicpy import N
+
+try:
+    from . import events
+except ImportError:
+    import events
+
+#Weights of chord matches, pitch-class overlap and key closeness in scores
+WEIGHTS = (0.5, 0.3, 0.2)
+
+#Number of set bits of every 12-bit mask
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(4096)], dtype = np.int64)
+
+def chord_masks(music_piece):
+    """Returns the pitch-class mask of every raw chord of a piece.
+
+    Returns
+    ----------
+    numpy.ndarray
+      int64 masks position by position, repeated patterns tiled without
+      expanding their notes
+    """
+    stored = music_piece.raw_events
+    if isinstance(stored, events.PatternEvents):
+        return np.tile(stored.pattern.pitch_class_masks(), stored.times).astype(np.int64)
+    if not music_piece.is_sequenced():
+        return np.zeros(0, dtype = np.int64)
+    return music_piece.note_events(raw = True).pitch_class_masks().astype(np.int64)
+
+def key_distance(first, second):
+    """Returns the steps between key chords around the circle of fifths, from 0 to 6."""
+    steps = (np.asarray(first) - np.asarray(second)) * 7 % 12
+    return np.minimum(steps, 12 - steps)
+
+def _rotate(masks, semitones):
+    #Masks moved up by a number of semitones, per row when semitones is an array
+    semitones = np.asarray(semitones) % 12
+    return ((masks << semitones) | (masks >> (12 - semitones))) & 0xFFF
+
+class CompatibilityMatrix():
+    """Harmonic compatibility of every pair of pieces of a session.
+
+    ...
+
+    Attributes
+    ----------
+    change_key : bool
+      Whether pieces are compared moved to the key chord of the first piece,
+      as mix_pieces() does with change_key
+    names : list
+      Names of the pieces, in the order of the rows
+    match : numpy.ndarray
+      Fraction of positions where two pieces hold the same pitch classes, the
+      chords on which switch_on_match() hands over
+    overlap : numpy.ndarray
+      Mean Jaccard similarity of the pitch classes of chords at the same position
+    key_distance : numpy.ndarray
+      Steps between key chords around the circle of fifths
+
+    Methods
+    ----------
+    add(name, music_piece)
+      Scores a piece against every piece already in the matrix
+    remove(name)
+      Removes a piece from the matrix
+    update(pieces)
+      Brings the matrix in line with a dictionary of pieces
+    scores()
+      Returns the weighted score of every pair
+    partners(name, limit = 5)
+      Ranks the best mixing partners of a piece
+    best_pairs(limit = 5)
+      Ranks the best pairs of pieces to mix
+
+    Notes
+    ----------
+    Positions are compared up to the end of the shorter piece, as mix_pieces()
+    truncates. Adding a piece compares it with all others in one vectorized
+    pass, so keeping the matrix updated costs one row per new piece instead
+    of walking every pair of chords again.
+    """
+    def __init__(self, change_key = True):
+        self.change_key = change_key
+        self.names = []
+        self.match = np.zeros((0, 0))
+        self.overlap = np.zeros((0, 0))
+        self.key_distance = np.zeros((0, 0), dtype = np.int64)
+        self._masks = np.zeros((0, 0), dtype = np.int64) #Padded with -1
+        self._lengths = np.zeros(0, dtype = np.int64)
+        self._keys = np.zeros(0, dtype = np.int64)
+        self._tokens = {} #Piece, seed and sequenced flag scored for every name
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._tokens
+
+    def add(self, name, music_piece):
+        """Scores a piece against every piece already in the matrix.
+
+        Parameters
+        ----------
+        name : str
+          Name of the piece, replacing any piece of the same name
+        music_piece : Genre instance
+          Piece to score, unsequenced pieces scoring no chord matches
+        """
+        if name in self._tokens:
+            self.remove(name)
+        masks = chord_masks(music_piece)
+        key = N(music_piece.key_chord).degree % 12
+        count = len(self.names)
+
+        #Widen the padded masks when the new piece is the longest
+        width = max(self._masks.shape[1], len(masks))
+        padded = np.full((count + 1, width), -1, dtype = np.int64)
+        padded[:count, :self._masks.shape[1]] = self._masks
+        padded[count, :len(masks)] = masks
+
+        #New piece moved against every other piece, all pairs at once
+        if self.change_key == True:
+            shifts = self._keys - key
+        else:
+            shifts = np.zeros(count, dtype = np.int64)
+        moved = _rotate(masks[None, :], shifts[:, None])
+        others = padded[:count, :len(masks)]
+        valid = np.arange(len(masks))[None, :] < np.minimum(self._lengths, len(masks))[:, None]
+        lengths = np.maximum(valid.sum(axis = 1), 1)
+        match = ((moved == others) & valid).sum(axis = 1) / lengths
+        union = POPCOUNT[(moved | others) & 0xFFF]
+        shared = POPCOUNT[(moved & others) & 0xFFF]
+        overlap = np.where(valid, shared / np.maximum(union, 1), 0.0).sum(axis = 1) / lengths
+        distance = key_distance(self._keys, key)
+
+        self.match = self._grow(self.match, match, 1.0 if len(masks) else 0.0)
+        self.overlap = self._grow(self.overlap, overlap, 1.0 if len(masks) else 0.0)
+        self.key_distance = self._grow(self.key_distance, distance, 0)
+        self._masks = padded
+        self._lengths = np.append(self._lengths, len(masks))
+        self._keys = np.append(self._keys, key)
+        self.names.append(name)
+        self._tokens[name] = (music_piece, music_piece.seed, music_piece.is_sequenced())
+
+    @staticmethod
+    def _grow(matrix, row, diagonal):
+        #Symmetric matrix with one more row and column
+        count = len(row)
+        grown = np.zeros((count + 1, count + 1), dtype = matrix.dtype)
+        grown[:count, :count] = matrix
+        grown[count, :count] = row
+        grown[:count, count] = row
+        grown[count, count] = diagonal
+        return grown
+
+    def remove(self, name):
+        """Removes a piece from the matrix."""
+        row = self.names.index(name)
+        del self.names[row]
+        del self._tokens[name]
+        for attribute in ('match', 'overlap', 'key_distance'):
+            matrix = getattr(self, attribute)
+            setattr(self, attribute, np.delete(np.delete(matrix, row, 0), row, 1))
+        self._masks = np.delete(self._masks, row, 0)
+        self._lengths = np.delete(self._lengths, row)
+        self._keys = np.delete(self._keys, row)
+
+    def update(self, pieces):
+        """Brings the matrix in line with a dictionary of pieces.
+
+        Parameters
+        ----------
+        pieces : dict
+          Genre instances by name, such as list_pieces
+
+        Returns
+        ----------
+        int
+          Number of pieces scored again, only those added, replaced,
+          sequenced or reseeded since the last update
+        """
+        for name in [name for name in self.names if name not in pieces]:
+            self.remove(name)
+        scored = 0
+        for name, music_piece in pieces.items():
+            token = self._tokens.get(name)
+            if token is None or token[0] is not music_piece or \
+                    token[1:] != (music_piece.seed, music_piece.is_sequenced()):
+                self.add(name, music_piece)
+                scored += 1
+        return scored
+
+    def scores(self):
+        """Returns the weighted score of every pair.
+
+        Returns
+        ----------
+        numpy.ndarray
+          Symmetric matrix of scores from 0 to 1 weighted by WEIGHTS, with
+          -1 on the diagonal
+        """
+        match_weight, overlap_weight, key_weight = WEIGHTS
+        scores = (match_weight * self.match + overlap_weight * self.overlap +
+                  key_weight * (1 - self.key_distance / 6))
+        np.fill_diagonal(scores, -1)
+        return scores
+
+    def partners(self, name, limit = 5):
+        """Ranks the best mixing partners of a piece.
+
+        Returns
+        ----------
+        list
+          (name, score) pairs sorted by decreasing score
+        """
+        scores = self.scores()[self.names.index(name)]
+        order = np.argsort(-scores, kind = 'stable')
+        return [(self.names[k], float(scores[k])) for k in order[:limit] if scores[k] >= 0]
+
+    def best_pairs(self, limit = 5):
+        """Ranks the best pairs of pieces to mix.
+
+        Returns
+        ----------
+        list
+          (name, name, score) triples sorted by decreasing score
+        """
+        scores = self.scores()
+        first, second = np.triu_indices(len(self.names), 1)
+        order = np.argsort(-scores[first, second], kind = 'stable')[:limit]
+        return [(self.names[first[k]], self.names[second[k]], float(scores[first[k], second[k]]))
+                for k in order]
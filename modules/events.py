@@ -0,0 +1,463 @@
+import numpy as np
+
+#Columns of one note event, times are in bars as in musicpy
+NOTE_DTYPE = np.dtype([('pitch', np.uint8), ('start', np.float32),
+                       ('duration', np.float32), ('velocity', np.uint8),
+                       ('channel', np.int8)])
+
+class NoteEvents():
+    """Compact array-backed representation of a list of musicpy chords.
+
+    ...
+
+    Attributes
+    ----------
+    notes : numpy.ndarray
+      Structured array of pitch, start, duration, velocity and channel per note,
+      with channel -1 for notes without a channel of their own
+    bounds : numpy.ndarray
+      Index of the first note of every segment, followed by the number of notes
+    ends : numpy.ndarray
+      Time at which every segment ends and the next one starts
+
+    Methods
+    ----------
+    from_chords(chords)
+      Builds note events from a list of musicpy chords
+    to_chords()
+      Converts every segment back to a musicpy chord
+    to_chord()
+      Converts all segments to one concatenated musicpy chord
+    repeat(times)
+      Repeats all segments one after another
+    segments(start, stop)
+      Cuts out a range of segments
+    transpose(semitones)
+      Moves every note by a number of semitones
+    pitch_class_masks()
+      Returns the pitch classes of every segment as a 12-bit mask
+
+    Notes
+    ----------
+    Every segment corresponds to one entry of Genre.chord_tracks or raw_chords
+    and segments follow each other as in musicpy concat()
+    """
+    def __init__(self, notes, bounds, ends):
+        self.notes = notes
+        self.bounds = bounds
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.notes)
+
+    @property
+    def segment_count(self):
+        """Number of segments, equal to the length of the chord list."""
+        return len(self.bounds) - 1
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays in bytes."""
+        return self.notes.nbytes + self.bounds.nbytes + self.ends.nbytes
+
+    @property
+    def duration(self):
+        """Time at which the last segment ends."""
+        return float(self.ends[-1]) if len(self.ends) else 0.0
+
+    @classmethod
+    def from_chords(cls, chords):
+        """Builds note events from a list of musicpy chords.
+
+        Parameters
+        ----------
+        chords : list
+          List of musicpy.structures.chord arranged chronologically
+
+        Returns
+        ----------
+        NoteEvents
+          One segment per chord
+        """
+        notes = np.zeros(sum(len(c) for c in chords), dtype = NOTE_DTYPE)
+        bounds = np.zeros(len(chords) + 1, dtype = np.int64)
+        ends = np.zeros(len(chords), dtype = np.float64)
+        index = 0
+        time = 0.0
+
+        #Loop to place each chord after the end of the previous one
+        for k, c in enumerate(chords):
+            count = len(c)
+            steps = np.array(c.interval, dtype = np.float64)
+            starts = time + c.start_time + np.concatenate(([0.0], np.cumsum(steps)[:-1]))
+            block = notes[index:index + count]
+            block['pitch'] = [n.degree for n in c.notes]
+            block['start'] = starts
+            block['duration'] = [n.duration for n in c.notes]
+            block['velocity'] = [n.volume for n in c.notes]
+            block['channel'] = [-1 if n.channel is None else n.channel for n in c.notes]
+            time += c.start_time + steps.sum()
+            index += count
+            bounds[k + 1] = index
+            ends[k] = time
+        return cls(notes, bounds, ends)
+
+    def _segment_chord(self, k):
+        from musicpy import chord, degree_to_note
+        block = self.notes[self.bounds[k]:self.bounds[k + 1]]
+        begin = float(self.ends[k - 1]) if k > 0 else 0.0
+        starts = block['start'].astype(np.float64)
+        intervals = np.diff(np.append(starts, self.ends[k])).tolist()
+        notes = [degree_to_note(int(n['pitch']), float(n['duration']), int(n['velocity']),
+                                None if n['channel'] < 0 else int(n['channel']))
+                 for n in block]
+        start_time = float(starts[0]) - begin if len(starts) else 0
+        return chord(notes, interval = intervals, start_time = start_time)
+
+    def to_chords(self):
+        """Converts every segment back to a musicpy chord.
+
+        Returns
+        ----------
+        list
+          List of musicpy.structures.chord arranged chronologically
+        """
+        return [self._segment_chord(k) for k in range(self.segment_count)]
+
+    def to_chord(self):
+        """Converts all segments to one concatenated musicpy chord.
+
+        Returns
+        ----------
+        musicpy.structures.chord
+          Chord equivalent to concat() of to_chords()
+        """
+        from musicpy import chord, degree_to_note
+        starts = self.notes['start'].astype(np.float64)
+        intervals = np.diff(np.append(starts, self.duration)).tolist()
+        notes = [degree_to_note(int(n['pitch']), float(n['duration']), int(n['velocity']),
+                                None if n['channel'] < 0 else int(n['channel']))
+                 for n in self.notes]
+        return chord(notes, interval = intervals)
+
+    def repeat(self, times):
+        """Repeats all segments one after another.
+
+        Parameters
+        ----------
+        times : int
+          Number of repetitions
+
+        Returns
+        ----------
+        NoteEvents
+          Events equivalent to multiplying the chord list by times
+        """
+        length = self.duration
+        notes = np.tile(self.notes, times)
+        offsets = np.repeat(np.arange(times, dtype = np.float64) * length, len(self.notes))
+        notes['start'] = notes['start'] + offsets
+        bounds = np.concatenate([[0]] + [self.bounds[1:] + r * len(self.notes)
+                                         for r in range(times)])
+        ends = (self.ends[None, :] + np.arange(times)[:, None] * length).ravel()
+        return NoteEvents(notes, bounds.astype(np.int64), ends)
+
+    def segments(self, start, stop):
+        """Cuts out a range of segments.
+
+        Parameters
+        ----------
+        start, stop : int
+          First segment and the segment after the last one
+
+        Returns
+        ----------
+        NoteEvents
+          Events of the segments timed from the start of the first one
+        """
+        begin = float(self.ends[start - 1]) if start > 0 else 0.0
+        notes = self.notes[self.bounds[start]:self.bounds[stop]].copy()
+        notes['start'] -= begin
+        bounds = self.bounds[start:stop + 1] - self.bounds[start]
+        return NoteEvents(notes, bounds, self.ends[start:stop] - begin)
+
+    def transpose(self, semitones):
+        """Moves every note by a number of semitones.
+
+        Returns
+        ----------
+        NoteEvents
+          Events equal to musicpy up() or down() on every chord
+        """
+        notes = self.notes.copy()
+        notes['pitch'] = notes['pitch'].astype(np.int64) + semitones
+        return NoteEvents(notes, self.bounds, self.ends)
+
+    def pitch_class_masks(self):
+        """Returns the pitch classes of every segment as a 12-bit mask.
+
+        Returns
+        ----------
+        numpy.ndarray
+          Bit p of entry k is set when segment k holds pitch class p, with C as 0
+        """
+        bits = np.left_shift(1, self.notes['pitch'].astype(np.int64) % 12)
+        segment = np.repeat(np.arange(self.segment_count), np.diff(self.bounds))
+        masks = np.zeros(self.segment_count, dtype = np.int64)
+        np.bitwise_or.at(masks, segment, bits)
+        return masks.astype(np.uint16)
+
+class PatternEvents():
+    """Note events of a pattern played a number of times in a row.
+
+    ...
+
+    Attributes
+    ----------
+    pattern : NoteEvents
+      Note events of one repetition
+    times : int
+      Number of repetitions
+
+    Methods
+    ----------
+    expand()
+      Builds the note events of all repetitions
+    to_chords()
+      Converts every segment to a musicpy chord, sharing chords between repetitions
+    to_chord()
+      Converts all segments to one concatenated musicpy chord
+    segments(start, stop)
+      Cuts out a range of segments
+
+    Notes
+    ----------
+    Memory stays proportional to the pattern whatever the number of
+    repetitions, and midi.encode_midi() writes one repetition and repeats
+    its bytes.
+    """
+    def __init__(self, pattern, times):
+        self.pattern = pattern
+        self.times = times
+
+    def __len__(self):
+        return len(self.pattern) * self.times
+
+    @property
+    def segment_count(self):
+        """Number of segments of all repetitions."""
+        return self.pattern.segment_count * self.times
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays of the pattern in bytes."""
+        return self.pattern.nbytes
+
+    @property
+    def duration(self):
+        """Time at which the last repetition ends."""
+        return self.pattern.duration * self.times
+
+    def expand(self):
+        """Builds the note events of all repetitions.
+
+        Returns
+        ----------
+        NoteEvents
+          Events equal to repeating the pattern
+        """
+        return self.pattern.repeat(self.times)
+
+    def to_chords(self):
+        """Converts every segment to a musicpy chord.
+
+        Returns
+        ----------
+        list
+          Chords of the pattern repeated, every repetition holding the same objects
+        """
+        return self.pattern.to_chords() * self.times
+
+    def to_chord(self):
+        """Converts all segments to one concatenated musicpy chord."""
+        return self.expand().to_chord()
+
+    def repeat(self, times):
+        """Repeats all repetitions one after another."""
+        return PatternEvents(self.pattern, self.times * times)
+
+    def segments(self, start, stop):
+        """Cuts out a range of segments, expanding only the repetitions it covers.
+
+        Returns
+        ----------
+        NoteEvents
+          Events of the segments timed from the start of the first one
+        """
+        count = self.pattern.segment_count
+        if count == 0 or start >= stop:
+            return self.pattern.segments(0, 0)
+        first = start // count
+        last = (stop - 1) // count + 1
+        return self.pattern.repeat(last - first).segments(start - first * count,
+                                                          stop - first * count)
+
+def concat_events(parts):
+    """Concatenates note events one after another.
+
+    Parameters
+    ----------
+    parts : list
+      List of NoteEvents arranged chronologically
+
+    Returns
+    ----------
+    NoteEvents
+      Events with the segments of all parts
+    """
+    notes = []
+    bounds = [np.zeros(1, dtype = np.int64)]
+    ends = []
+    index = 0
+    time = 0.0
+    for part in parts:
+        shifted = part.notes.copy()
+        shifted['start'] += time
+        notes.append(shifted)
+        bounds.append(part.bounds[1:] + index)
+        ends.append(part.ends + time)
+        index += len(part.notes)
+        time += part.duration
+    if not notes:
+        return NoteEvents(np.zeros(0, dtype = NOTE_DTYPE), bounds[0], np.zeros(0))
+    return NoteEvents(np.concatenate(notes), np.concatenate(bounds), np.concatenate(ends))
+
+def take_segments(parts, sources, segments):
+    """Builds note events from segments chosen across any number of sources.
+
+    Parameters
+    ----------
+    parts : list
+      List of NoteEvents to take segments from
+    sources, segments : array_like
+      Source and segment index of every segment of the result
+
+    Returns
+    ----------
+    NoteEvents
+      Events equal to the chosen chords placed one after another
+    """
+    sources = np.asarray(sources, dtype = np.int64)
+    segments = np.asarray(segments, dtype = np.int64)
+    notes = np.concatenate([part.notes for part in parts])
+
+    #Flat per-segment tables of all parts, indexed through the first segment of each part
+    note_offsets = np.concatenate(([0], np.cumsum([len(part.notes) for part in parts])))
+    segment_offsets = np.concatenate(([0], np.cumsum([part.segment_count for part in parts])))
+    begins = np.concatenate([np.concatenate(([0.0], part.ends))[:part.segment_count]
+                             for part in parts])
+    ends = np.concatenate([part.ends for part in parts])
+    firsts = np.concatenate([part.bounds[:-1] + note_offsets[k] for k, part in enumerate(parts)])
+    sizes = np.concatenate([np.diff(part.bounds) for part in parts])
+    chosen_segments = segment_offsets[sources] + segments
+    begins = begins[chosen_segments]
+    lengths = ends[chosen_segments] - begins
+    sizes = sizes[chosen_segments]
+
+    #Gather the chosen notes and move every segment to its new position
+    bounds = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    segment = np.repeat(np.arange(len(chosen_segments)), sizes)
+    chosen = notes[firsts[chosen_segments][segment] + np.arange(bounds[-1]) - bounds[segment]]
+    new_ends = np.cumsum(lengths)
+    chosen['start'] = chosen['start'] + (new_ends - lengths - begins)[segment]
+    return NoteEvents(chosen, bounds, new_ends)
+
+def select_segments(first, second, use_second):
+    """Builds note events taking every segment from one of two sources.
+
+    Parameters
+    ----------
+    first, second : NoteEvents
+      Sources with at least len(use_second) segments
+    use_second : array_like
+      Whether segment k is taken from second instead of first
+
+    Returns
+    ----------
+    NoteEvents
+      Events equal to the chosen chords placed one after another
+    """
+    use_second = np.asarray(use_second, dtype = np.int64)
+    return take_segments([first, second], use_second, np.arange(len(use_second)))
+
+def arpeggiate(chords, starts, stops, durations = 1 / 4, intervals = 1 / 32,
+               second_half = False):
+    """Arpeggiates a whole progression of chords in one vectorized pass.
+
+    Parameters
+    ----------
+    chords : list or NoteEvents
+      List of musicpy.structures.chord to arpeggiate, or note events with one
+      segment per chord
+    starts, stops : array_like
+      Range of octaves every arpeggio climbs through
+    durations, intervals : float or array_like
+      Duration of every note and time between consecutive notes, per chord
+    second_half : bool or array_like
+      Whether every arpeggio descends again after climbing
+
+    Returns
+    ----------
+    NoteEvents
+      One segment per chord, each equal to musicpy arp() with the same arguments
+    """
+    if isinstance(chords, NoteEvents):
+        count = chords.segment_count
+        sizes = np.diff(chords.bounds)
+        pitches = chords.notes['pitch'].astype(np.int64)
+        #Octave number of the first note, as musicpy note.num
+        roots = pitches[chords.bounds[:-1]] // 12 - 1
+    else:
+        count = len(chords)
+        sizes = np.array([len(c) for c in chords], dtype = np.int64)
+        pitches = np.array([n.degree for c in chords for n in c.notes], dtype = np.int64)
+        roots = np.array([c.notes[0].num for c in chords], dtype = np.int64)
+    starts = np.broadcast_to(np.asarray(starts, dtype = np.int64), count)
+    stops = np.broadcast_to(np.asarray(stops, dtype = np.int64), count)
+    durations = np.broadcast_to(np.asarray(durations, dtype = np.float64), count)
+    intervals = np.broadcast_to(np.asarray(intervals, dtype = np.float64), count)
+    second_half = np.broadcast_to(np.asarray(second_half, dtype = bool), count)
+
+    #Length of the climbing part and of the whole arpeggio of every chord
+    climbs = sizes * np.maximum(stops - starts, 0)
+    lengths = climbs + np.where(second_half, np.maximum(climbs - 1, 0), 0)
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    ends = np.cumsum(lengths * intervals)
+
+    #Position of every note inside its arpeggio, folded back on the descent
+    segment = np.repeat(np.arange(count), lengths)
+    position = np.arange(bounds[-1]) - bounds[segment]
+    climb_index = np.where(position < climbs[segment], position,
+                           2 * climbs[segment] - 2 - position)
+    octave = climb_index // sizes[segment]
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    base = pitches[offsets[segment] + climb_index % sizes[segment]]
+
+    notes = np.zeros(bounds[-1], dtype = NOTE_DTYPE)
+    notes['pitch'] = base + 12 * (starts[segment] + octave - roots[segment])
+    notes['start'] = (ends - lengths * intervals)[segment] + position * intervals[segment]
+    notes['duration'] = durations[segment]
+    notes['velocity'] = 100
+    notes['channel'] = -1
+    return NoteEvents(notes, bounds.astype(np.int64), ends)
+
+def arpeggio_events(chord_type, start = 3, stop = 7, durations = 1 / 4, intervals = 1 / 32,
+                    second_half = False):
+    """Builds the note events of musicpy arp() for a single chord.
+
+    Returns
+    ----------
+    NoteEvents
+      One segment equal to arp() with the same arguments
+    """
+    return arpeggiate([chord_type], start, stop, durations, intervals, second_half)
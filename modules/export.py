@@ -0,0 +1,334 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from . import midi
+    from . import render
+    from . import synth
+except ImportError:
+    import midi
+    import render
+    import synth
+
+#ffmpeg codec arguments of the compressed formats export_music() can write
+FFMPEG_CODECS = {'mp3': ['-codec:a', 'libmp3lame', '-q:a', '2'],
+                 'ogg': ['-codec:a', 'libvorbis', '-q:a', '5'],
+                 'flac': ['-codec:a', 'flac']}
+
+class WaveEncoder():
+    """Encoder writing 16-bit waveform audio with the wave module.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+      Path of the file to write
+
+    Methods
+    ----------
+    available()
+      Always True, the encoder needs nothing outside the standard library
+    open(sample_rate, channels)
+      Starts the file
+    write(chunk)
+      Appends int16 frames to the file
+    close()
+      Finishes the file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.audio = None
+
+    def available(self):
+        """Returns True, the encoder needs nothing outside the standard library."""
+        return True
+
+    def open(self, sample_rate, channels):
+        """Starts the file."""
+        self.audio = wave.open(self.path, 'wb')
+        self.audio.setnchannels(channels)
+        self.audio.setsampwidth(2)
+        self.audio.setframerate(sample_rate)
+
+    def write(self, chunk):
+        """Appends int16 frames to the file."""
+        self.audio.writeframes(chunk.tobytes())
+
+    def close(self):
+        """Finishes the file."""
+        if self.audio is not None:
+            self.audio.close()
+            self.audio = None
+
+class CommandEncoder():
+    """Encoder piping raw 16-bit frames into an external encoder process.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+      Path of the file to write
+    codec : list
+      ffmpeg arguments selecting the codec, such as FFMPEG_CODECS['mp3']
+    binary : str
+      Name or path of the ffmpeg executable
+
+    Methods
+    ----------
+    available()
+      Checks whether the encoder executable can be found
+    command(sample_rate, channels)
+      Builds the command line reading frames from standard input
+    open(sample_rate, channels)
+      Starts the encoder process
+    write(chunk)
+      Sends int16 frames to the encoder
+    close()
+      Waits for the encoder to finish the file
+    """
+    def __init__(self, path, codec, binary = 'ffmpeg'):
+        self.path = path
+        self.codec = codec
+        self.binary = binary
+        self.process = None
+
+    def available(self):
+        """Checks whether the encoder executable can be found."""
+        return shutil.which(self.binary) is not None
+
+    def command(self, sample_rate, channels):
+        """Builds the command line reading frames from standard input.
+
+        Returns
+        ----------
+        list
+          Arguments for subprocess
+        """
+        return [self.binary, '-hide_banner', '-loglevel', 'error', '-y', '-f', 's16le',
+                '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+                *self.codec, self.path]
+
+    def open(self, sample_rate, channels):
+        """Starts the encoder process."""
+        try:
+            self.process = subprocess.Popen(self.command(sample_rate, channels),
+                                            stdin = subprocess.PIPE,
+                                            stderr = subprocess.PIPE)
+        except FileNotFoundError:
+            raise render.RenderError(f'{self.binary} executable not found')
+
+    def write(self, chunk):
+        """Sends int16 frames to the encoder."""
+        try:
+            self.process.stdin.write(chunk.astype('<i2', copy = False).tobytes())
+        except BrokenPipeError:
+            self.close()
+            raise render.RenderError(f'{self.binary} stopped reading before the end')
+
+    def close(self):
+        """Waits for the encoder to finish the file."""
+        if self.process is None:
+            return
+        process = self.process
+        self.process = None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        log = process.stderr.read().decode(errors = 'replace')
+        process.stderr.close()
+        if process.wait() != 0:
+            raise render.RenderError(f'{self.binary} exited with code {process.returncode}: {log}')
+
+def encoder_for(path, binary = 'ffmpeg'):
+    """Chooses the encoder of a file from its extension.
+
+    Parameters
+    ----------
+    path : str
+      Path of the file to write, ending in .wav or a key of FFMPEG_CODECS
+    binary : str, default='ffmpeg'
+      Executable used for compressed formats
+
+    Returns
+    ----------
+    WaveEncoder or CommandEncoder
+      Encoder writing the file
+    """
+    suffix = os.path.splitext(path)[1].lower().lstrip('.')
+    if suffix == 'wav':
+        return WaveEncoder(path)
+    if suffix not in FFMPEG_CODECS:
+        raise ValueError(f'Unknown audio format {suffix!r}')
+    return CommandEncoder(path, FFMPEG_CODECS[suffix], binary)
+
+def pcm_chunks(midi_data, renderer = None, chunk_frames = 8192):
+    """Renders a MIDI file to int16 chunks as synthesis progresses.
+
+    Parameters
+    ----------
+    midi_data : bytes
+      Contents of the MIDI file
+    renderer : object, optional
+      Renderer to use, render.get_renderer() by default
+    chunk_frames : int, default=8192
+      Number of frames per chunk for renderers that only write files
+
+    Returns
+    ----------
+    iterator
+      (sample_rate, channels) followed by int16 arrays of frames by channels
+
+    Notes
+    ----------
+    NumpySynth, SynthPool and FluidSynthRenderer stream chunks while they
+    synthesize. Other renderers render to a temporary file whose frames are
+    then memory-mapped chunk by chunk.
+    """
+    if renderer is None:
+        renderer = render.get_renderer()
+    if isinstance(renderer, synth.NumpySynth):
+        tracks, bpm = midi.decode_midi(midi_data)
+        yield renderer.sample_rate, 2
+        yield from renderer.stream(tracks, bpm)
+    elif hasattr(renderer, 'stream'):
+        chunks = renderer.stream(midi_data)
+        channels, sample_width, sample_rate = next(chunks)
+        yield sample_rate, channels
+        for chunk in chunks:
+            yield np.frombuffer(chunk, dtype = '<i2').reshape(-1, channels)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            midi_path = os.path.join(folder, 'export.mid')
+            with open(midi_path, 'wb') as midi_file:
+                midi_file.write(midi_data)
+            result = renderer.render(midi_path, os.path.join(folder, 'export.wav'))
+            sample_rate, frames = render.map_audio(result.audio_path)
+            yield sample_rate, frames.shape[1]
+            for start in range(0, len(frames), chunk_frames):
+                yield np.array(frames[start:start + chunk_frames])
+            #Release the memory map before the folder is removed
+            del frames
+
+def _consume(encoder, chunks, errors):
+    #Encoder thread, draining its queue until the end marker
+    chunk = True
+    try:
+        #Close the encoder and its file also when a write fails partway
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                encoder.write(chunk)
+        finally:
+            encoder.close()
+    except Exception as error:
+        errors.append(error)
+        #Keep draining so that the producer is never blocked on a dead consumer
+        while chunk is not None:
+            chunk = chunks.get()
+
+def export_stream(chunks, encoders, queue_size = 8):
+    """Encodes audio chunks to several files while they are being produced.
+
+    Parameters
+    ----------
+    chunks : iterable
+      (sample_rate, channels) followed by int16 frame arrays, see pcm_chunks()
+    encoders : list
+      Encoders such as WaveEncoder or CommandEncoder, one per output file
+    queue_size : int, default=8
+      Number of chunks an encoder may fall behind before synthesis waits
+
+    Returns
+    ----------
+    stats : dict
+      Number of frames, wall time of the export and seconds the producer
+      spent waiting on full queues
+
+    Notes
+    ----------
+    Every encoder runs in its own thread behind a bounded queue, so memory
+    stays bounded and the export takes about as long as the slower of
+    synthesis and encoding rather than their sum.
+    """
+    start = perf_counter()
+    chunks = iter(chunks)
+    sample_rate, channels = next(chunks)
+    for i, encoder in enumerate(encoders):
+        try:
+            encoder.open(sample_rate, channels)
+        except Exception:
+            #Close the encoders already started before giving up
+            for started in encoders[:i]:
+                started.close()
+            raise
+
+    errors = []
+    queues = [queue.Queue(maxsize = queue_size) for encoder in encoders]
+    threads = [threading.Thread(target = _consume, args = (encoder, chunk_queue, errors),
+                                daemon = True)
+               for encoder, chunk_queue in zip(encoders, queues)]
+    for thread in threads:
+        thread.start()
+
+    #Produce every chunk once and hand it to all encoders
+    frames = 0
+    waited = 0.0
+    try:
+        for chunk in chunks:
+            frames += len(chunk)
+            for chunk_queue in queues:
+                if chunk_queue.full():
+                    wait_start = perf_counter()
+                    chunk_queue.put(chunk)
+                    waited += perf_counter() - wait_start
+                else:
+                    chunk_queue.put(chunk)
+    finally:
+        for chunk_queue in queues:
+            chunk_queue.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return {'frames': frames, 'elapsed': perf_counter() - start, 'waited': waited}
+
+def export_music(midi_data, paths, renderer = None, queue_size = 8, binary = 'ffmpeg'):
+    """Renders a MIDI file once and encodes it to every requested format.
+
+    Parameters
+    ----------
+    midi_data : bytes
+      Contents of the MIDI file, such as from music_sequencer.midi_bytes()
+    paths : list
+      Paths of the files to write, whose extensions choose the formats
+    renderer : object, optional
+      Renderer to use, render.get_renderer() by default
+    queue_size : int, default=8
+      Number of chunks an encoder may fall behind before synthesis waits
+    binary : str, default='ffmpeg'
+      Executable used for compressed formats
+
+    Returns
+    ----------
+    stats : dict
+      See export_stream()
+    """
+    encoders = [encoder_for(path, binary) for path in paths]
+    for encoder in encoders:
+        if not encoder.available():
+            raise render.RenderError(f'{encoder.binary} executable not found, ' +
+                                     f'cannot write {encoder.path}')
+    return export_stream(pcm_chunks(midi_data, renderer), encoders, queue_size)
@@ -0,0 +1,250 @@
+import numpy as np
+
+try:
+    from . import events
+except ImportError:
+    import events
+
+#Chords per n-gram, number of MinHash functions and bands of the index
+NGRAM = 3
+NUM_HASHES = 64
+BANDS = 16
+
+def _rotations(masks):
+    #Every 12-bit mask moved up by 0 to 11 semitones, one row per transposition
+    shift = np.arange(12, dtype = np.uint64)[:, None]
+    masks = masks.astype(np.uint64)[None, :]
+    return ((masks << shift) | (masks >> ((12 - shift) % 12))) & np.uint64(0xFFF)
+
+def pitch_class_ngrams(masks, n = NGRAM):
+    """Returns the transposition-invariant n-grams of a sequence of chords.
+
+    Parameters
+    ----------
+    masks : numpy.ndarray
+      12-bit pitch-class mask of every chord, see events.NoteEvents.pitch_class_masks()
+    n : int, default=3
+      Number of consecutive chords per n-gram, at most 5
+
+    Returns
+    ----------
+    numpy.ndarray
+      Sorted distinct uint64 n-grams, every one packed from its masks moved
+      to the transposition with the smallest packed value
+    """
+    if not 1 <= n <= 5:
+        raise ValueError(f'N-grams of {n} chords do not fit in 64 bits')
+    if len(masks) == 0:
+        return np.zeros(0, dtype = np.uint64)
+    n = min(n, len(masks))
+    rotated = _rotations(np.asarray(masks))
+    count = rotated.shape[1] - n + 1
+
+    #Pack n consecutive masks into 12 bits each, for all transpositions at once
+    grams = np.zeros((12, count), dtype = np.uint64)
+    for k in range(n):
+        grams |= rotated[:, k:k + count] << np.uint64(12 * k)
+    return np.unique(grams.min(axis = 0))
+
+def _hash_parameters(num_hashes, seed):
+    #Odd multipliers and offsets of multiply-shift hashing
+    generator = np.random.default_rng(seed)
+    a = generator.integers(0, 2 ** 63, num_hashes, dtype = np.uint64) * np.uint64(2) + np.uint64(1)
+    b = generator.integers(0, 2 ** 63, num_hashes, dtype = np.uint64)
+    return a[:, None], b[:, None]
+
+def minhash(grams, num_hashes = NUM_HASHES, seed = 0):
+    """Returns the MinHash signature of a set of n-grams.
+
+    Parameters
+    ----------
+    grams : numpy.ndarray
+      Distinct uint64 n-grams, see pitch_class_ngrams()
+    num_hashes : int, default=64
+      Length of the signature
+    seed : int, default=0
+      Seed of the hash functions, equal for signatures that are compared
+
+    Returns
+    ----------
+    numpy.ndarray
+      uint64 signature, the fraction of equal entries of two signatures
+      estimating the Jaccard similarity of their n-gram sets
+    """
+    if len(grams) == 0:
+        return np.full(num_hashes, np.iinfo(np.uint64).max, dtype = np.uint64)
+    a, b = _hash_parameters(num_hashes, seed)
+    with np.errstate(over = 'ignore'):
+        hashes = (a * grams[None, :] + b) >> np.uint64(16)
+    return hashes.min(axis = 1)
+
+def piece_masks(music_piece, n = NGRAM):
+    """Returns the pitch-class masks of the raw chords of a sequenced piece.
+
+    Notes
+    ----------
+    A repeated pattern is tiled only as often as needed for the n-grams
+    spanning repetitions, which gives the same n-gram set as expanding it.
+    """
+    stored = music_piece.raw_events
+    if isinstance(stored, events.PatternEvents):
+        masks = stored.pattern.pitch_class_masks()
+        if len(masks) == 0:
+            return masks
+        return np.tile(masks, min(stored.times, 1 + -(-(n - 1) // len(masks))))
+    return music_piece.note_events(raw = True).pitch_class_masks()
+
+def fingerprint(music_piece, n = NGRAM, num_hashes = NUM_HASHES, seed = 0):
+    """Returns the MinHash signature of the chord n-grams of a sequenced piece.
+
+    Parameters
+    ----------
+    music_piece : Genre instance
+      Sequenced piece, in either stored form
+    n, num_hashes, seed : int, optional
+      See pitch_class_ngrams() and minhash()
+
+    Returns
+    ----------
+    numpy.ndarray
+      uint64 signature, equal for pieces whose progressions only differ in key
+    """
+    return minhash(pitch_class_ngrams(piece_masks(music_piece, n), n), num_hashes, seed)
+
+class FingerprintIndex():
+    """Index of piece fingerprints answering similarity queries.
+
+    ...
+
+    Attributes
+    ----------
+    n : int
+      Chords per n-gram
+    num_hashes : int
+      Length of the signatures
+    bands : int
+      Number of bands signatures are bucketed by, dividing num_hashes
+    seed : int
+      Seed of the hash functions
+
+    Methods
+    ----------
+    add(name, music_piece)
+      Adds the fingerprint of a sequenced piece
+    remove(name)
+      Removes a piece from the index
+    query(music_piece, limit = 10, threshold = 0.0)
+      Finds the indexed pieces most similar to a piece
+    duplicate_of(music_piece, threshold = 0.9)
+      Returns the name of the most similar indexed piece above a threshold
+
+    Notes
+    ----------
+    Signatures are cut into bands and every band is hashed into a bucket, so
+    a query only compares signatures sharing a bucket with it instead of the
+    whole library. Pieces whose estimated similarity is s share a bucket
+    with probability 1 - (1 - s ** r) ** bands for r hashes per band.
+    """
+    def __init__(self, n = NGRAM, num_hashes = NUM_HASHES, bands = BANDS, seed = 0):
+        if num_hashes % bands != 0:
+            raise ValueError(f'{bands} bands do not divide {num_hashes} hashes')
+        self.n = n
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.seed = seed
+        self.names = []
+        self.signatures = np.zeros((0, num_hashes), dtype = np.uint64)
+        self._count = 0 #Rows of signatures in use
+        self._rows = {} #Row of every indexed name
+        self._buckets = [{} for band in range(bands)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def signature(self, music_piece):
+        """Returns the fingerprint of a piece with the settings of the index."""
+        return fingerprint(music_piece, self.n, self.num_hashes, self.seed)
+
+    def _band_keys(self, signature):
+        return [band.tobytes() for band in signature.reshape(self.bands, -1)]
+
+    def add(self, name, music_piece):
+        """Adds the fingerprint of a sequenced piece, replacing any piece of the same name.
+
+        Parameters
+        ----------
+        name : str
+          Name of the piece in the index
+        music_piece : Genre instance or numpy.ndarray
+          Sequenced piece, or its signature
+        """
+        signature = music_piece if isinstance(music_piece, np.ndarray) else \
+            self.signature(music_piece)
+        if name in self._rows:
+            self.remove(name)
+
+        #Grow the signature table geometrically
+        if self._count == len(self.signatures):
+            grown = np.zeros((max(16, 2 * self._count), self.num_hashes), dtype = np.uint64)
+            grown[:self._count] = self.signatures[:self._count]
+            self.signatures = grown
+        row = self._count
+        self.signatures[row] = signature
+        self.names.append(name)
+        self._count += 1
+        self._rows[name] = row
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(key, []).append(row)
+
+    def remove(self, name):
+        """Removes a piece from the index."""
+        row = self._rows.pop(name)
+        for buckets, key in zip(self._buckets, self._band_keys(self.signatures[row])):
+            buckets[key].remove(row)
+            if not buckets[key]:
+                del buckets[key]
+
+    def query(self, music_piece, limit = 10, threshold = 0.0):
+        """Finds the indexed pieces most similar to a piece.
+
+        Parameters
+        ----------
+        music_piece : Genre instance or numpy.ndarray
+          Sequenced piece, or its signature
+        limit : int, default=10
+          Largest number of pieces returned
+        threshold : float, default=0.0
+          Smallest estimated similarity of returned pieces
+
+        Returns
+        ----------
+        list
+          (name, similarity) pairs sorted by decreasing similarity, only
+          over pieces sharing at least one band with the query
+        """
+        signature = music_piece if isinstance(music_piece, np.ndarray) else \
+            self.signature(music_piece)
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(key, ()))
+        if not candidates:
+            return []
+        rows = np.fromiter(candidates, dtype = np.int64, count = len(candidates))
+        similarity = (self.signatures[rows] == signature).mean(axis = 1)
+        order = np.lexsort((rows, -similarity))
+        return [(self.names[rows[k]], float(similarity[k])) for k in order[:limit]
+                if similarity[k] >= threshold]
+
+    def duplicate_of(self, music_piece, threshold = 0.9):
+        """Returns the name of the most similar indexed piece above a threshold.
+
+        Returns
+        ----------
+        str or None
+          Name of the closest piece, None when no piece reaches threshold
+        """
+        matches = self.query(music_piece, 1, threshold)
+        return matches[0][0] if matches else None
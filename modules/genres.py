@@ -0,0 +1,295 @@
+import numpy as np
+
+#Chord types and alterations of compiled tables, index 0 of QUALITIES
+#standing for the current mode of the piece and index 0 of ALTERATIONS for none
+QUALITIES = [None, 'major', 'minor', 'M7', 'm7', 'm6', 'dim7', '7', 'maj7', 'sus4']
+ALTERATIONS = [None, 'b9', 'b5', '#5', '#9']
+
+#Rows of compiled tables, modes other than minor using the major row
+MODES = ['major', 'minor']
+
+#Scale degrees a progression can hold
+DEGREES = 7
+
+#Rules of the built-in genres
+JAZZ = {
+    'progressions': {'major': [[5, 1], [2, 5], [2, 5, 1], [4, 5, 1], [1, 6, 2, 5]],
+                     'minor': [[5, 1], [2, 5], [2, 5, 1]]},
+    'qualities': {'major': {5: 'M7', 2: 'm7'},
+                  'minor': {5: ('M7', 'b9'), 2: ('m7', 'b5'), 1: 'm6'}},
+    'stop_low': 4,
+    #Every third progression each chord may switch between major and minor,
+    #through a chord on the fourth degree in the previous mode
+    'mode_change': {'every': 3, 'modes': ['major', 'minor'], 'degree': 4, 'stop_low': 5},
+    #Key scale moved down a tone two progressions before the end with change_key
+    'key_change': {'before_end': 2, 'transpose': -2},
+    'arp_intervals': 0.0625,
+    'arp_second_half': True,
+    'symph': ([1, 2, 3, 12, 26, 52], [27, 32, 40, 56, 57, 64, 65, 66], [85, 75, 70, 65, 55]),
+}
+
+POP = {
+    'progressions': [[1, 5, 6, 4], [1, 6, 4, 5], [1, 4, 5], [1, 4, 6, 5], [6, 4, 1, 5], [1, 4, 1]],
+    'qualities': {6: 'minor'},
+    'stop_low': 5,
+    #One progression repeated for the whole piece
+    'single': True,
+    'arp_intervals': 0.125,
+    'arp_second_half': False,
+    'symph': ([1, 2, 3, 24, 25, 12, 26, 40, 54, 56, 57, 72, 73, 78, 80, 81, 85, 106, 107, 110],
+              [5, 9, 27, 28, 32, 33, 34, 35, 41, 42, 52, 53, 64, 65, 66, 67, 91, 92, 95, 104],
+              [90, 75, 65, 55, 55]),
+}
+
+COUNTRY = {
+    'progressions': [[1, 4, 5], [1, 5, 4], [1, 5, 4, 6], [1, 4, 6, 5], [1, 2, 4]],
+    'qualities': {6: 'minor', 2: 'minor'},
+    #Diminished seventh a semitone below the second degree leading into it
+    'leading': {2: ('dim7', -1)},
+    'stop_low': 4,
+    'arp_intervals': 0.125,
+    'arp_second_half': False,
+    'symph': ([1, 2, 21, 22, 24, 25, 72, 73, 78, 79, 105, 106, 107, 110],
+              [9, 19, 27, 31, 32, 35, 36, 37, 64, 65, 66, 67], [90, 80, 65, 55, 55]),
+}
+
+def _by_mode(value):
+    #Rules given per mode or for all modes, as one entry per row of MODES
+    if isinstance(value, dict) and set(value) <= set(MODES) and value:
+        return [value.get(mode, value.get('major')) for mode in MODES]
+    return [value] * len(MODES)
+
+def _index(vocabulary, value, kind):
+    if value not in vocabulary:
+        raise ValueError(f'Unknown {kind} {value!r}, expected one of {vocabulary[1:]}')
+    return vocabulary.index(value)
+
+def _degree(value):
+    degree = int(value)
+    if not 1 <= degree <= DEGREES:
+        raise ValueError(f'Scale degree {value!r} is outside 1-{DEGREES}')
+    return degree
+
+class GenreRules():
+    """Progression rules of a genre compiled into integer lookup tables.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+      Name the rules are registered under
+    progressions : numpy.ndarray
+      Scale degrees of every distinct progression, padded with 0
+    lengths : numpy.ndarray
+      Number of chords of every progression
+    choices : numpy.ndarray
+      Progressions allowed in every mode of MODES, padded
+    counts : numpy.ndarray
+      Number of progressions allowed in every mode of MODES
+    quality, alteration : numpy.ndarray
+      Index in QUALITIES and ALTERATIONS by mode and scale degree
+    leading_quality, leading_shift : numpy.ndarray
+      Index in QUALITIES of the chord leading into every scale degree, 0 for
+      none, and the semitones its root is moved by
+    stop_low : int
+      Lowest octave arpeggios stop at
+    mode_change, key_change : dict or None
+      Settings of mode and key changes within the sequence
+    single : bool
+      Whether one progression is repeated for the whole piece
+    arp_intervals : float
+      Time between consecutive notes of the arpeggios
+    arp_second_half : bool
+      Whether arpeggios descend again after climbing
+    symph : tuple or None
+      Lead instruments, rhythm instruments and volumes of generate_symph()
+
+    Methods
+    ----------
+    plan(generator, variation, mode, start = 0, stop = None, state = None, change_key = False)
+      Samples a range of progressions and yields the chords to voice
+
+    Notes
+    ----------
+    Degrees and chord types are resolved when the rules are compiled, so
+    sampling draws every random number of a range of progressions at once
+    and then only indexes tables.
+    """
+    def __init__(self, name, rules):
+        self.name = name
+        progression_rows = [[[_degree(x) for x in prog] for prog in progs]
+                            for progs in _by_mode(rules['progressions'])]
+        if not all(progression_rows):
+            raise ValueError(f'Genre {name!r} has a mode without progressions')
+
+        #Every distinct progression once, padded with degree 0
+        distinct = []
+        for progs in progression_rows:
+            for prog in progs:
+                if prog not in distinct:
+                    distinct.append(prog)
+        self.lengths = np.array([len(prog) for prog in distinct], dtype = np.int64)
+        self.progressions = np.zeros((len(distinct), self.lengths.max()), dtype = np.int64)
+        for i, prog in enumerate(distinct):
+            self.progressions[i, :len(prog)] = prog
+        self.counts = np.array([len(progs) for progs in progression_rows], dtype = np.int64)
+        self.choices = np.zeros((len(MODES), self.counts.max()), dtype = np.int64)
+        for row, progs in enumerate(progression_rows):
+            self.choices[row, :len(progs)] = [distinct.index(prog) for prog in progs]
+
+        #Chord type and alteration of every degree in every mode
+        self.quality = np.zeros((len(MODES), DEGREES + 1), dtype = np.int64)
+        self.alteration = np.zeros((len(MODES), DEGREES + 1), dtype = np.int64)
+        for row, qualities in enumerate(_by_mode(rules.get('qualities', {}))):
+            for degree, value in qualities.items():
+                quality, alteration = value if isinstance(value, tuple) else (value, None)
+                self.quality[row, _degree(degree)] = _index(QUALITIES, quality, 'chord type')
+                self.alteration[row, _degree(degree)] = _index(ALTERATIONS, alteration,
+                                                               'alteration')
+
+        #Chords played before a degree, such as passing diminished chords
+        self.leading_quality = np.zeros(DEGREES + 1, dtype = np.int64)
+        self.leading_shift = np.zeros(DEGREES + 1, dtype = np.int64)
+        for degree, (quality, shift) in rules.get('leading', {}).items():
+            self.leading_quality[_degree(degree)] = _index(QUALITIES, quality, 'chord type')
+            self.leading_shift[_degree(degree)] = shift
+
+        self.stop_low = rules.get('stop_low', 4)
+        self.mode_change = rules.get('mode_change')
+        if self.mode_change is not None:
+            self.mode_change = dict(self.mode_change)
+            self.mode_change['degree'] = _degree(self.mode_change['degree'])
+        self.key_change = rules.get('key_change')
+        self.single = rules.get('single', False)
+        self.arp_intervals = rules.get('arp_intervals', 0.125)
+        self.arp_second_half = rules.get('arp_second_half', False)
+        self.symph = rules.get('symph')
+
+    @property
+    def stateful(self):
+        """Whether progressions carry a mode or key into the next one."""
+        return self.mode_change is not None or self.key_change is not None
+
+    def plan(self, generator, variation, mode, start = 0, stop = None, state = None,
+             change_key = False):
+        """Samples a range of progressions and yields the chords to voice.
+
+        Parameters
+        ----------
+        generator : numpy.random.Generator
+          Random number generator of the piece
+        variation : int
+          Number of variations of the piece, progressions 0 to variation
+          being sequenced unless single is set
+        mode : str
+          Mode of the key scale of the piece
+        start, stop : int, optional
+          Range of progressions to sample, all of them by default
+        state : tuple, optional
+          Mode and key transposition entering progression start, the mode of
+          the piece untransposed by default
+        change_key : bool, default=False
+          Whether to apply key_change
+
+        Returns
+        ----------
+        iterator
+          (chords, stop_lows, transpose, state) per progression, chords being
+          (degree, chord type, alteration, root shift) tuples, state None
+          unless the rules are stateful
+        """
+        if stop is None:
+            stop = start + 1 if self.single else variation + 1
+        if not self.single:
+            stop = min(stop, variation + 1)
+        if stop <= start:
+            return
+        current, transpose = state if state is not None else (mode, 0)
+
+        #One draw for the choice of progression and possible mode changes of every chord
+        draws = generator.random((stop - start, 1 + self.progressions.shape[1]))
+        picks = (draws[:, :1] * self.counts).astype(np.int64)
+        if self.mode_change is not None:
+            modes = self.mode_change['modes']
+            new_modes = (draws[:, 1:] * len(modes)).astype(np.int64)
+
+        for i, count in enumerate(range(start, stop)):
+            if self.single and i > 0:
+                yield chords, stop_lows, transpose, None
+                continue
+            row = 1 if current == 'minor' else 0
+            prog = self.choices[row, picks[i, row]]
+            if change_key == True and self.key_change is not None and \
+                    variation - count == self.key_change['before_end']:
+                transpose = self.key_change['transpose']
+            chords = []
+            stop_lows = []
+
+            #Loop over degrees of the progression, looking up their chord types
+            for j, degree in enumerate(self.progressions[prog, :self.lengths[prog]].tolist()):
+                if self.mode_change is not None and count % self.mode_change['every'] == 0:
+                    new_mode = modes[new_modes[i, j]]
+                    if new_mode != current:
+                        degree = self.mode_change['degree']
+                        chords.append((degree, current, None, 0))
+                        stop_lows.append(self.mode_change['stop_low'])
+                        current = new_mode
+                        row = 1 if current == 'minor' else 0
+                if self.leading_quality[degree] != 0:
+                    chords.append((degree, QUALITIES[self.leading_quality[degree]], None,
+                                   int(self.leading_shift[degree])))
+                    stop_lows.append(self.stop_low)
+                quality = self.quality[row, degree]
+                chords.append((degree, current if quality == 0 else QUALITIES[quality],
+                               ALTERATIONS[self.alteration[row, degree]], 0))
+                stop_lows.append(self.stop_low)
+            yield chords, stop_lows, transpose, (current, transpose) if self.stateful else None
+
+    def transition(self, state, next_state):
+        """Returns the chords leading from one mode into another.
+
+        Returns
+        ----------
+        chords, stop_lows : list
+          (degree, chord type, alteration, root shift) tuples and the lowest
+          octave each arpeggio stops at, empty when the modes are the same
+        """
+        if self.mode_change is None or state is None or state[0] == next_state[0]:
+            return [], []
+        return [(self.mode_change['degree'], state[0], None, 0)], [self.mode_change['stop_low']]
+
+#Compiled rules by genre name
+REGISTRY = {}
+
+def register_genre(name, rules):
+    """Compiles the rules of a genre and registers them under its name.
+
+    Parameters
+    ----------
+    name : str
+      Name of the genre, case-insensitive
+    rules : dict
+      Rules such as JAZZ, with progressions of scale degrees and optionally
+      qualities, leading, stop_low, mode_change, key_change, single,
+      arp_intervals, arp_second_half and symph
+
+    Returns
+    ----------
+    GenreRules
+      The compiled rules
+    """
+    compiled = GenreRules(name.lower(), rules)
+    REGISTRY[name.lower()] = compiled
+    return compiled
+
+def get_rules(name):
+    """Returns the compiled rules registered under a genre name."""
+    try:
+        return REGISTRY[name.lower()]
+    except KeyError:
+        raise ValueError(f'Unknown genre {name!r}') from None
+
+register_genre('jazz', JAZZ)
+register_genre('pop', POP)
+register_genre('country', COUNTRY)
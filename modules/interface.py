@@ -1,9 +1,41 @@
 from time import sleep
 import music_sequencer as ms
-from musicpy import *
-from IPython.display import Audio, display, FileLink
+import compatibility
 import random
 
+#Compatibility of session pieces, with and without harmonizing keys,
+#kept between calls so that only new or changed pieces are scored
+mix_scores = {True: compatibility.CompatibilityMatrix(True),
+              False: compatibility.CompatibilityMatrix(False)}
+
+def update_scores(list_pieces, change_key):
+    """Brings the compatibility of session pieces in line with the session.
+
+    Returns
+    ----------
+    scores : compatibility.CompatibilityMatrix
+      Matrix of the pieces, for mixing with or without harmonizing keys
+
+    Notes
+    ----------
+    Only pieces new to the matrix are read and scored, pieces changed in
+    advanced_interface() are scored again by rescore_piece(). Other pieces
+    are never read, so that pieces of a session file stay on disk.
+    """
+    scores = mix_scores[change_key]
+    for name in [name for name in scores.names if name not in list_pieces]:
+        scores.remove(name)
+    for name in list_pieces:
+        if name not in scores:
+            scores.add(name, list_pieces[name])
+    return scores
+
+def rescore_piece(name, music_piece):
+    """Scores a changed piece again wherever its compatibility is kept."""
+    for scores in mix_scores.values():
+        if name in scores:
+            scores.add(name, music_piece)
+
 def take_user_input(statement, acceptable_inputs, notation_bool = False):
     """Validates user input with customisable notation option.
   
@@ -146,7 +178,7 @@ def advanced_interface(list_pieces):
       Generates audio playback for all options
     """
     #Conditional to check whether list_pieces is empty
-    if list_pieces == {}:
+    if len(list_pieces) == 0:
         print('Sorry, please return to normal settings and create a musical piece first!')
         return None
     else:
@@ -168,7 +200,22 @@ def advanced_interface(list_pieces):
             user_piece = take_user_input('Enter piece name: ', music_list)
       
             if user_choice == 'R':
-                list_pieces[user_piece].sequence(rerun = True) #Run sequencing
+                music_piece = list_pieces[user_piece]
+                #Conditional to offer rerunning only some progressions of sequenced pieces
+                if music_piece.progression_bounds is not None:
+                    total = len(music_piece.progression_bounds) - 1
+                    print(f'This piece has {total} progression(s). Would you like to rerun ' +
+                          'all of them, or only some while keeping the rest?')
+                    if take_user_input('All or Some? [A/S]: ', ['A', 'S']) == 'S':
+                        progressions = [str(i) for i in range(1, total + 1)]
+                        start = int(take_user_input('First progression to rerun: ', progressions))
+                        stop = int(take_user_input('Last progression to rerun: ',
+                                                   progressions[start - 1:]))
+                        music_piece.regenerate(start - 1, stop) #Run partial sequencing
+                        rescore_piece(user_piece, music_piece)
+                        return None
+                music_piece.sequence(rerun = True) #Run sequencing
+                rescore_piece(user_piece, music_piece)
             else:
                 list_pieces[user_piece].generate_symph() #Generate symphony
       
@@ -188,6 +235,12 @@ def advanced_interface(list_pieces):
             print('Time to choose your pieces! Note that the key chord will be defined' +
                   'by the first piece unless specified!')
             user_piece1 = take_user_input('Enter piece 1 name: ', music_list)
+      
+            #Recommend partners from the compatibility of the pieces before mixing
+            partners = update_scores(list_pieces, change_key).partners(user_piece1, 3)
+            if partners:
+                print('Pieces that mix best with it: ' +
+                      ', '.join(f'{name} ({score:.0%})' for name, score in partners))
             user_piece2 = take_user_input('Enter piece 2 name: ', music_list)
             piece_to_add = ms.mix_pieces(list_pieces[user_piece1], list_pieces[user_piece2],
                                       change_key)
@@ -0,0 +1,416 @@
+import numpy as np
+
+try:
+    from . import events
+except ImportError:
+    import events
+
+#General MIDI channel of percussion, the one channel that changes how notes sound
+DRUM_CHANNEL = 9
+
+class MidiTrack():
+    """Note events of one MIDI track with their playback settings.
+
+    ...
+
+    Attributes
+    ----------
+    events : events.NoteEvents or events.PatternEvents
+      Note events of the track
+    instrument : int
+      MIDI instrument number, starting at 1 as in musicpy
+    channel : int
+      MIDI channel of notes without a channel of their own
+    volume : int or None
+      Channel volume from 0 to 127, None to leave the synthesizer default
+    start_time : float
+      Time in bars at which the track starts
+    """
+    def __init__(self, events, instrument = 1, channel = 0, volume = None, start_time = 0):
+        self.events = events
+        self.instrument = instrument
+        self.channel = channel
+        self.volume = volume
+        self.start_time = start_time
+
+def _var_len(values):
+    """Encodes delta times as variable-length quantities.
+
+    Returns
+    ----------
+    data : numpy.ndarray
+      Bytes of every quantity, most significant group first
+    lengths : numpy.ndarray
+      Number of bytes of every quantity
+    """
+    values = np.asarray(values, dtype = np.int64)
+    lengths = (1 + (values >= 0x80) + (values >= 0x4000) + (values >= 0x200000)).astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    data = np.zeros(int(lengths.sum()), dtype = np.uint8)
+    #Loop over byte positions, at most four for delta times below 2 ** 28
+    for position in range(4):
+        mask = lengths > position
+        shift = 7 * (lengths[mask] - 1 - position)
+        group = (values[mask] >> shift) & 0x7F
+        continued = np.where(position < lengths[mask] - 1, 0x80, 0)
+        data[offsets[mask] + position] = group | continued
+    return data, lengths
+
+def _note_arrays(track, ticks_per_bar):
+    notes = track.events.notes
+    count = len(notes)
+    channels = np.where(notes['channel'] < 0, track.channel, notes['channel']).astype(np.int64)
+
+    #Note-on and note-off ticks interleaved in the order musicpy appends them
+    begin = track.start_time * ticks_per_bar
+    starts = begin + notes['start'].astype(np.float64) * ticks_per_bar
+    ticks = np.empty(2 * count, dtype = np.int64)
+    ticks[0::2] = starts.astype(np.int64)
+    ticks[1::2] = (starts + notes['duration'].astype(np.float64) * ticks_per_bar).astype(np.int64)
+    order = np.argsort(ticks, kind = 'stable')
+    ticks = ticks[order]
+    note = order // 2
+    is_on = order % 2 == 0
+
+    #Note-offs are note-ons with velocity 0 so that running status covers every note
+    status = (0x90 | channels[note]).astype(np.uint8)
+    pitch = notes['pitch'][note]
+    velocity = np.where(is_on, notes['velocity'][note], 0).astype(np.uint8)
+    return ticks, status, pitch, velocity
+
+def _event_bytes(ticks, status, pitch, velocity, last_tick = 0, last_status = None):
+    """Encodes sorted note messages with delta times and running status.
+
+    Parameters
+    ----------
+    ticks, status, pitch, velocity : numpy.ndarray
+      Absolute tick, status byte and data bytes of every message
+    last_tick : int, default=0
+      Tick of the message written before these ones
+    last_status : int, optional
+      Status byte in effect before these messages
+
+    Returns
+    ----------
+    bytes
+      Encoded messages
+    """
+    if len(ticks) == 0:
+        return b''
+    deltas = np.diff(np.concatenate(([last_tick], ticks)))
+    delta_data, delta_lengths = _var_len(deltas)
+
+    #Running status drops the status byte whenever it repeats the previous one
+    repeated = np.concatenate(([status[0] == last_status], status[1:] == status[:-1]))
+    lengths = delta_lengths + np.where(repeated, 0, 1) + 2
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    data = np.zeros(int(lengths.sum()), dtype = np.uint8)
+
+    delta_offsets = np.concatenate(([0], np.cumsum(delta_lengths)[:-1]))
+    positions = np.repeat(offsets, delta_lengths) + (np.arange(len(delta_data)) -
+                                                     np.repeat(delta_offsets, delta_lengths))
+    data[positions] = delta_data
+    cursor = offsets + delta_lengths
+    data[cursor[~repeated]] = status[~repeated]
+    cursor = cursor + np.where(repeated, 0, 1)
+    data[cursor] = pitch
+    data[cursor + 1] = velocity
+    return data.tobytes()
+
+def _track_header(track, index, bpm):
+    header = bytearray()
+    #Tempo is written to the first track only, as in musicpy
+    if index == 0:
+        tempo = int(round(60000000 / bpm))
+        header += b'\x00\xff\x51\x03' + tempo.to_bytes(3, 'big')
+    header += bytes([0, 0xC0 | track.channel, track.instrument - 1])
+    if track.volume is not None:
+        header += bytes([0, 0xB0 | track.channel, 7, track.volume])
+    return bytes(header)
+
+def _pattern_bytes(track, ticks_per_bar):
+    """Encodes a repeated pattern by repeating the bytes of one steady repetition.
+
+    Returns
+    ----------
+    bytes or None
+      Encoded messages, None when the repetitions cannot be repeated bytewise
+    """
+    pattern = track.events.pattern
+    times = track.events.times
+    period = pattern.duration * ticks_per_bar
+    begin = track.start_time * ticks_per_bar
+    if period <= 0 or period != int(period) or begin != int(begin):
+        return None
+    period = int(period)
+    begin = int(begin)
+
+    #Number of following repetitions the notes of one repetition sound into
+    ticks = _note_arrays(MidiTrack(pattern, channel = track.channel), ticks_per_bar)[0]
+    spill = int(ticks[-1]) // period
+    if times < spill + 2:
+        return None
+
+    #Every repetition after the first spill + 1 ones encodes to the same bytes
+    sample = MidiTrack(pattern.repeat(spill + 2), channel = track.channel,
+                       start_time = track.start_time)
+    ticks, status, pitch, velocity = _note_arrays(sample, ticks_per_bar)
+    head_end = int(np.searchsorted(ticks, begin + (spill + 1) * period))
+    steady_end = int(np.searchsorted(ticks, begin + (spill + 2) * period))
+    if head_end == 0 or steady_end == head_end:
+        return None
+    head = _event_bytes(ticks[:head_end], status[:head_end], pitch[:head_end],
+                        velocity[:head_end])
+    steady = _event_bytes(ticks[head_end:steady_end], status[head_end:steady_end],
+                          pitch[head_end:steady_end], velocity[head_end:steady_end],
+                          int(ticks[head_end - 1]), int(status[head_end - 1]))
+    tail = _event_bytes(ticks[steady_end:], status[steady_end:], pitch[steady_end:],
+                        velocity[steady_end:], int(ticks[steady_end - 1]),
+                        int(status[steady_end - 1]))
+    return head + steady * (times - spill - 1) + tail
+
+def _encode_track(track, index, bpm, ticks_per_bar):
+    header = _track_header(track, index, bpm)
+    if len(track.events) == 0:
+        return header + b'\x00\xff\x2f\x00'
+    data = None
+    if isinstance(track.events, events.PatternEvents):
+        data = _pattern_bytes(track, ticks_per_bar)
+        if data is None:
+            track = MidiTrack(track.events.expand(), track.instrument, track.channel,
+                              track.volume, track.start_time)
+    if data is None:
+        data = _event_bytes(*_note_arrays(track, ticks_per_bar))
+    return header + data + b'\x00\xff\x2f\x00'
+
+def encode_midi(tracks, bpm = 120, ticks_per_beat = 960):
+    """Serializes note events straight into a Standard MIDI File.
+
+    Parameters
+    ----------
+    tracks : list
+      List of MidiTrack, one MIDI track each
+    bpm : float, default=120
+      Tempo of the piece
+    ticks_per_beat : int, default=960
+      Time resolution, musicpy's default
+
+    Returns
+    ----------
+    bytes
+      Contents of a format 1 MIDI file
+    """
+    ticks_per_bar = ticks_per_beat * 4
+    chunks = [b'MThd', (6).to_bytes(4, 'big'), (1).to_bytes(2, 'big'),
+              len(tracks).to_bytes(2, 'big'), ticks_per_beat.to_bytes(2, 'big')]
+    for index, track in enumerate(tracks):
+        data = _encode_track(track, index, bpm, ticks_per_bar)
+        chunks += [b'MTrk', len(data).to_bytes(4, 'big'), data]
+    return b''.join(chunks)
+
+def _read_var_len(data, position):
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, position
+
+def decode_midi(data):
+    """Reads a Standard MIDI File back into note events per track.
+
+    Parameters
+    ----------
+    data : bytes
+      Contents of a MIDI file with a ticks-per-beat time division
+
+    Returns
+    ----------
+    tracks : list
+      List of MidiTrack, with note events timed in bars of four beats and the
+      last program change and channel volume of every track
+    bpm : float
+      First tempo of the file, 120 when it sets none
+
+    Notes
+    ----------
+    Tempo changes after the first tempo are ignored.
+    """
+    if data[:4] != b'MThd':
+        raise ValueError('Not a Standard MIDI File')
+    header_length = int.from_bytes(data[4:8], 'big')
+    count = int.from_bytes(data[10:12], 'big')
+    ticks_per_bar = int.from_bytes(data[12:14], 'big') * 4
+    position = 8 + header_length
+    bpm = None
+    tracks = []
+
+    #Loop over track chunks, pairing note-ons and note-offs first in first out
+    for k in range(count):
+        length = int.from_bytes(data[position + 4:position + 8], 'big')
+        position += 8
+        end = position + length
+        tick = 0
+        status = 0
+        instrument = 1
+        channel = None
+        volume = None
+        sounding = {}
+        rows = []
+        while position < end:
+            delta, position = _read_var_len(data, position)
+            tick += delta
+            byte = data[position]
+            if byte == 0xFF:
+                kind = data[position + 1]
+                size, position = _read_var_len(data, position + 2)
+                if kind == 0x51 and bpm is None:
+                    bpm = 60000000 / int.from_bytes(data[position:position + 3], 'big')
+                position += size
+                continue
+            if byte in (0xF0, 0xF7):
+                size, position = _read_var_len(data, position + 1)
+                position += size
+                continue
+            if byte & 0x80:
+                status = byte
+                position += 1
+            kind = status & 0xF0
+            message_channel = status & 0x0F
+            if kind in (0xC0, 0xD0):
+                if kind == 0xC0:
+                    instrument = data[position] + 1
+                position += 1
+                continue
+            data_1 = data[position]
+            data_2 = data[position + 1]
+            position += 2
+            if kind == 0x90 and data_2 > 0:
+                sounding.setdefault((message_channel, data_1), []).append((tick, data_2, len(rows)))
+                rows.append(None)
+                if channel is None:
+                    channel = message_channel
+            elif kind == 0x80 or kind == 0x90:
+                started = sounding.get((message_channel, data_1))
+                if started:
+                    start, velocity, index = started.pop(0)
+                    rows[index] = (data_1, start / ticks_per_bar, (tick - start) / ticks_per_bar,
+                                   velocity, message_channel)
+            elif kind == 0xB0 and data_1 == 7:
+                volume = data_2
+        position = end
+
+        notes = np.array([row for row in rows if row is not None], dtype = events.NOTE_DTYPE)
+        duration = float((notes['start'] + notes['duration']).max()) if len(notes) else 0.0
+        note_events = events.NoteEvents(notes, np.array([0, len(notes)], dtype = np.int64),
+                                        np.array([duration]))
+        tracks.append(MidiTrack(note_events, instrument, channel or 0, volume))
+    return tracks, bpm or 120.0
+
+class MidiStreamWriter():
+    """Writes a single-track MIDI file block by block as note events arrive.
+
+    ...
+
+    Attributes
+    ----------
+    file : file object
+      Seekable binary file the MIDI data is written to
+    track : MidiTrack
+      Playback settings of the track, its events are replaced by every block
+    bpm : float
+      Tempo of the piece
+    ticks_per_beat : int
+      Time resolution, musicpy's default
+    time : float
+      Time in bars at which the next block starts
+
+    Methods
+    ----------
+    write(block)
+      Appends the note events of one block after the previous blocks
+    close()
+      Writes the remaining notes and finalizes the track length
+
+    Notes
+    ----------
+    Messages after the end of the latest block are held back until the next
+    block arrives, so the file equals encode_midi() of all blocks concatenated.
+    """
+    def __init__(self, file, instrument = 1, channel = 0, volume = None, bpm = 120,
+                 ticks_per_beat = 960):
+        self.file = file
+        self.track = MidiTrack(None, instrument, channel, volume)
+        self.bpm = bpm
+        self.ticks_per_beat = ticks_per_beat
+        self.time = 0.0
+        self._pending = None
+        self._last_tick = 0
+        self._last_status = None
+        self._length = 0
+
+        header = _track_header(self.track, 0, bpm)
+        self.file.write(b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big') +
+                        (1).to_bytes(2, 'big') + ticks_per_beat.to_bytes(2, 'big'))
+        #Track length is patched in by close()
+        self._length_offset = self.file.tell() + 4
+        self.file.write(b'MTrk' + bytes(4))
+        self._emit(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _emit(self, data):
+        self.file.write(data)
+        self._length += len(data)
+
+    def _flush(self, until = None):
+        if self._pending is None:
+            return
+        ticks, status, pitch, velocity = self._pending
+        count = len(ticks) if until is None else int(np.searchsorted(ticks, until))
+        self._emit(_event_bytes(ticks[:count], status[:count], pitch[:count],
+                                velocity[:count], self._last_tick, self._last_status))
+        if count:
+            self._last_tick = int(ticks[count - 1])
+            self._last_status = int(status[count - 1])
+        self._pending = tuple(column[count:] for column in self._pending)
+
+    def write(self, block):
+        """Appends the note events of one block after the previous blocks.
+
+        Parameters
+        ----------
+        block : events.NoteEvents
+          Note events timed from the start of the block
+        """
+        ticks_per_bar = self.ticks_per_beat * 4
+        self.track.events = block
+        self.track.start_time = self.time
+        arrays = _note_arrays(self.track, ticks_per_bar)
+        if self._pending is not None:
+            #Held back messages go first so equal ticks keep musicpy order
+            arrays = tuple(np.concatenate(pair) for pair in zip(self._pending, arrays))
+            order = np.argsort(arrays[0], kind = 'stable')
+            arrays = tuple(column[order] for column in arrays)
+        self._pending = arrays
+        self.time += block.duration
+
+        #Later blocks only add messages from the end of this block onwards
+        self._flush(int(self.time * ticks_per_bar))
+
+    def close(self):
+        """Writes the remaining notes and finalizes the track length."""
+        if self.file is None:
+            return
+        self._flush()
+        self._emit(b'\x00\xff\x2f\x00')
+        end = self.file.tell()
+        self.file.seek(self._length_offset)
+        self.file.write(self._length.to_bytes(4, 'big'))
+        self.file.seek(end)
+        self.file = None
@@ -1,46 +1,765 @@
 from musicpy import *
-from IPython.display import Audio, display, FileLink
+import itertools
+import numpy as np
+import os
 import random
-from time import sleep
+import shutil
+import tempfile
+import warnings
+import wave
+from concurrent.futures import ThreadPoolExecutor
 
-def play_music(midi_file, settings, country = False):
-    """Generates audio playback within output.
+try:
+    from . import cache, events, genres, midi, playback, render, voicings
+except ImportError:
+    import cache
+    import events
+    import genres
+    import midi
+    import playback
+    import render
+    import voicings
+
+#Peak of a mixed render from render_tracks(), as a fraction of full scale
+MIX_PEAK = 0.9
+
+class EventChord(chord):
+    """Musicpy chord holding note events, built from them only when first used.
+  
+    ...
+  
+    Attributes
+    ----------
+    events : events.NoteEvents or events.PatternEvents
+      Note events of the chord, a pattern staying a pattern
+    notes, interval : list
+      Notes and intervals of the chord, converted from events on first access
+  
+    Notes
+    ----------
+    piece_tracks() and the MIDI writer read events directly while the notes
+    were never built, so a repeated pattern is encoded once per pattern.
+    Musicpy operations such as repr() or musicpy.write() build the notes.
+    """
+    def __init__(self, note_events):
+        self.events = note_events
+        self._notes = None
+        self._interval = None
+        self.start_time = 0
+        self.other_messages = []
+        self.tempos = []
+        self.pitch_bends = []
+  
+    def _build(self):
+        built = self.events.to_chord()
+        if self._notes is None:
+            self._notes = built.notes
+        if self._interval is None:
+            self._interval = built.interval
+  
+    def is_built(self):
+        """Checks whether the notes were built from the events."""
+        return self._notes is not None or self._interval is not None
+  
+    @property
+    def notes(self):
+        if self._notes is None:
+            self._build()
+        return self._notes
+  
+    @notes.setter
+    def notes(self, value):
+        self._notes = value
+  
+    @property
+    def interval(self):
+        if self._interval is None:
+            self._build()
+        return self._interval
+  
+    @interval.setter
+    def interval(self, value):
+        self._interval = value
+  
+    def __eq__(self, other):
+        #musicpy compares exact chord types, which would exclude this subclass
+        return isinstance(other, chord) and self.notes == other.notes and \
+            self.interval == other.interval
+
+def track_events(track):
+    """Returns the note events of a chord, list of chords or note events."""
+    if isinstance(track, (events.NoteEvents, events.PatternEvents)):
+        return track
+    #Built notes may have been changed in place, so only unbuilt chords use their events
+    if isinstance(track, EventChord) and not track.is_built():
+        return track.events
+    if isinstance(track, chord):
+        track = [track]
+    return events.NoteEvents.from_chords(track)
+
+def midi_bytes(midi_file, settings, country = False):
+    """Encodes a musical structure as a Standard MIDI File in memory.
   
     Parameters
     ----------
-    midi_file : musicpy.structures
-      Musical structure to generate audio playback with
+    midi_file : musicpy.structures or events.NoteEvents or events.PatternEvents
+      Musical structure to encode, pieces may hold note events as tracks
+    settings : bool
+      Whether settings are determined or not
+    country : bool, default=False
+      Whether music is country music
+  
+    Returns
+    ----------
+    bytes
+      Contents of the MIDI file
+    """
+    tracks, bpm = midi_tracks(midi_file, settings, country)
+    return midi.encode_midi(tracks, bpm = bpm)
+
+def default_instrument(country = False):
+    """Returns the MIDI program of sequences without determined settings.
+  
+    Parameters
+    ----------
+    country : bool, default=False
+      Whether music is country music
+  
+    Returns
+    ----------
+    instrument : int
+      25 for the acoustic guitar of country music, 1 for the piano otherwise
+    """
+    if country == True:
+        return 25
+    return 1
+
+def midi_tracks(midi_file, settings, country = False):
+    """Converts a musical structure to MIDI tracks and their tempo.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures or events.NoteEvents or events.PatternEvents
+      Musical structure to convert, see midi_bytes()
     settings : bool
       Whether settings are determined or not
     country : bool, default=False
       Whether music is country music
+  
+    Returns
+    ----------
+    tracks : list
+      List of midi.MidiTrack
+    bpm : float
+      Tempo of the piece
     """
-    #Conditional to add settings and create midi file if settings are not determined
+    #Conditional to add settings if settings are not determined
     if settings == False:
-        if country == True:
-            write(midi_file, bpm = 100, instrument = 25, name = 'output.mid')
-        else:
-            write(midi_file, bpm = 100, instrument = 1, name = 'output.mid')
+        return [midi.MidiTrack(track_events(midi_file), default_instrument(country))], 100
+  
+    return piece_tracks(midi_file), midi_file.bpm
+
+def piece_tracks(midi_file):
+    """Converts the tracks of a musicpy piece to MIDI tracks.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures.piece
+      Piece with instruments, channels and volumes per track
+  
+    Returns
+    ----------
+    tracks : list
+      List of midi.MidiTrack, tracks holding the same object sharing one
+      conversion to note events
+    """
+    #Loop to carry instruments, channels and volumes of every track of the piece
+    tracks = []
+    shared = {}
+    for i, track in enumerate(midi_file.tracks):
+        if id(track) not in shared:
+            shared[id(track)] = track_events(track)
+        channel = midi_file.channels[i] if midi_file.channels else i
+        volume = midi_file.volume[i][-1].value if midi_file.volume[i] else None
+        start_time = midi_file.start_times[i] + getattr(track, 'start_time', 0)
+        tracks.append(midi.MidiTrack(shared[id(track)], midi_file.instruments[i], channel,
+                                     volume, start_time))
+    return tracks
+
+def render_key(midi_data, renderer = None):
+    """Computes the content address of a render job.
+  
+    Parameters
+    ----------
+    midi_data : bytes
+      Contents of the MIDI file, holding note events, bpm, instruments and volumes
+    renderer : object, optional
+      Renderer whose settings affect the audio, given by its cache_identity()
+      method when it has one
+  
+    Returns
+    ----------
+    key : str
+      Hash of the MIDI file and renderer settings
+    """
+    if hasattr(renderer, 'cache_identity'):
+        identity = renderer.cache_identity()
     else:
-        write(midi_file, name = 'output.mid')
+        identity = (getattr(renderer, 'soundfont', None), getattr(renderer, 'sample_rate', None))
+    return cache.content_key(type(renderer).__name__, identity, midi_data)
+
+def render_music(midi_file, settings, country = False, name = None, in_memory = False):
+    """Writes a MIDI file and renders it to audio without any display.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures or events.NoteEvents
+      Musical structure to render
+    settings : bool
+      Whether settings are determined or not
+    country : bool, default=False
+      Whether music is country music
+    name : str, optional
+      File name used for the MIDI and waveform audio files, files in a new
+      subfolder of render.output_folder(), removed when the process exits,
+      by default so that concurrent renders never collide
+    in_memory : bool, default=False
+      Whether to also hold the audio in memory as result.pcm
+  
+    Returns
+    ----------
+    result : render.RenderResult
+      Paths of the MIDI and waveform audio files, whose frames
+      result.samples() returns without reading the whole file
+  
+    Notes
+    ----------
+    Only the MIDI file is written when no renderer is available.
+    Renders found in the render cache are returned without synthesis. Named
+    renders always write their files at name, cached or not, the render
+    cache keeping its own copies.
+    Renderers providing render_pcm() write no audio file when in_memory is
+    set and the render cache is disabled.
+    """
+    midi_data = midi_bytes(midi_file, settings, country)
+  
+    #Skip synthesis entirely when the same job was rendered before
+    renderer = render.get_renderer()
+    render_cache = cache.get_cache()
+    key = render_key(midi_data, renderer)
+    cached = _lookup_render(render_cache, key, name)
+    if cached is not None:
+        return _load_pcm(cached) if in_memory == True else cached
+  
+    #Cached renders keep their own copy, so unnamed output files are scratch files then
+    with render.output_paths(name, render_cache is not None) as (midi_path, audio_path):
+        midi_path = _write_midi(midi_path, midi_data, render_cache, key, name)
+    
+        #Generate waveform audio from midi file through the current renderer
+        if not renderer.available():
+            warnings.warn('No synthesizer available, only the MIDI file was written.')
+            return render.RenderResult(midi_path, None)
+        if in_memory == True and render_cache is None and hasattr(renderer, 'render_pcm'):
+            return render.RenderResult(midi_path, None, pcm = renderer.render_pcm(midi_data),
+                                       sample_rate = renderer.sample_rate)
+        result = renderer.render(midi_path, audio_path)
+        result = _store_render(render_cache, key, result, name)
+    return _load_pcm(result) if in_memory == True else result
+
+def _lookup_render(render_cache, key, name):
+    #Returns a cached render or None, copied to the named files if a name is given
+    if render_cache is None:
+        return None
+    cached = render_cache.lookup(key)
+    if cached is None or name is None:
+        return cached
+    with render.output_paths(name) as (midi_path, audio_path):
+        shutil.copyfile(cached.midi_path, midi_path)
+        shutil.copyfile(cached.audio_path, audio_path)
+    return render.RenderResult(midi_path, audio_path)
+
+def _store_render(render_cache, key, result, name):
+    #Copies a render into the render cache if enabled, named renders keeping
+    #their own files and unnamed ones pointing at the cached copies
+    if render_cache is None:
+        return result
+    stored = render_cache.store(key, result)
+    return stored if name is None else result
+
+def _write_midi(midi_path, midi_data, render_cache, key, name):
+    #Writes the MIDI file of a render, the cached copy doubling as renderer
+    #input for unnamed renders when the render cache is enabled
+    if render_cache is not None and name is None:
+        return render_cache.put(key, '.mid', midi_data)
+    with open(midi_path, 'wb') as midi_out:
+        midi_out.write(midi_data)
+    return midi_path
+
+def _open_wave(path, params):
+    #Opens a 16-bit waveform audio file for writing in the format of params
+    audio_out = wave.open(path, 'wb')
+    audio_out.setnchannels(params.nchannels)
+    audio_out.setsampwidth(2)
+    audio_out.setframerate(params.framerate)
+    return audio_out
+
+def _to_frames(audio):
+    #Rounds and clips float samples to 16-bit audio frames
+    return np.clip(np.round(audio), -32768, 32767).astype(np.int16)
+
+def _write_render(name, midi_data, render_cache, key, params, audio):
+    #Writes the MIDI file and the audio of a render computed in NumPy and
+    #stores them in the render cache if enabled
+    with render.output_paths(name, render_cache is not None) as (midi_path, audio_path):
+        midi_path = _write_midi(midi_path, midi_data, render_cache, key, name)
+        with _open_wave(audio_path, params) as audio_out:
+            audio_out.writeframes(_to_frames(audio).tobytes())
+        result = render.RenderResult(midi_path, audio_path)
+        result = _store_render(render_cache, key, result, name)
+    return result
+
+def _load_pcm(result):
+    #Copies the rendered frames into memory
+    sample_rate, frames = result.samples()
+    result.pcm = np.array(frames)
+    result.sample_rate = sample_rate
+    return result
+
+def _render_content(track):
+    #Track moved to channel 0 unless it plays drums, so that identical content
+    #on different channels of a piece is rendered and cached once
+    channel = track.channel if track.channel == midi.DRUM_CHANNEL else 0
+    return midi.MidiTrack(track.events, track.instrument, channel, track.volume,
+                          track.start_time)
+
+def _render_track(track_data, renderer, render_cache, path):
+    #Renders the MIDI file of one track, reusing the render cache
+    if render_cache is not None:
+        key = render_key(track_data, renderer)
+        cached = render_cache.lookup(key)
+        if cached is not None:
+            return cached.audio_path
+    with open(path + '.mid', 'wb') as track_out:
+        track_out.write(track_data)
+    result = renderer.render(path + '.mid', path + '.wav')
+    if render_cache is not None:
+        result = render_cache.store(key, result)
+    return result.audio_path
+
+def render_tracks(midi_file, name = None, workers = None):
+    """Renders every track of a piece on its own worker and mixes them.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures.piece
+      Piece with instruments, channels and volumes per track
+    name : str, optional
+      File name used for the MIDI and waveform audio files, files in a new
+      subfolder of render.output_folder(), removed when the process exits,
+      by default
+    workers : int, optional
+      Number of tracks rendered at once, one per track up to the number of
+      CPUs by default
+  
+    Returns
+    ----------
+    result : render.RenderResult
+      Paths of the MIDI file of the whole piece and of the mixed audio
+  
+    Notes
+    ----------
+    Every track is written as its own MIDI file with its instrument and volume
+    and rendered through the current renderer. Track renders are keyed by
+    content with render_key() like whole pieces, on one channel except for
+    drums, so a track whose instrument, volume and notes are unchanged or
+    equal to another track's is not rendered again. The mix is the sum of the tracks, scaled to a peak of MIX_PEAK.
+    Falls back to render_music() when no renderer is available.
+    """
+    renderer = render.get_renderer()
+    if not renderer.available():
+        return render_music(midi_file, True, name = name)
+  
+    midi_data = midi_bytes(midi_file, True)
+    render_cache = cache.get_cache()
+    key = cache.content_key('mix', MIX_PEAK, render_key(midi_data, renderer))
+    cached = _lookup_render(render_cache, key, name)
+    if cached is not None:
+        return cached
+  
+    #Identical tracks are rendered once whatever their channel, renderers run
+    #their synthesis out of process or in NumPy, so threads are enough to keep
+    #every core busy
+    track_data = [midi.encode_midi([_render_content(track)], bpm = midi_file.bpm)
+                  for track in piece_tracks(midi_file)]
+    unique = list(dict.fromkeys(track_data))
+    if workers is None:
+        workers = min(len(unique), os.cpu_count() or 1)
+    with tempfile.TemporaryDirectory() as folder:
+        with ThreadPoolExecutor(max_workers = max(workers, 1)) as executor:
+            jobs = {data: executor.submit(_render_track, data, renderer, render_cache,
+                                          os.path.join(folder, f'track_{i}'))
+                    for i, data in enumerate(unique)}
+            audio = {data: read_audio(job.result()) for data, job in jobs.items()}
+  
+    #Sum the tracks and normalize the mix in one pass over each track
+    params = audio[unique[0]][0]
+    if any(track_params[:3] != params[:3] for track_params, track_audio in audio.values()):
+        raise render.RenderError('Tracks were rendered in different audio formats')
+    mix = np.zeros((max(len(audio[data][1]) for data in unique), params.nchannels),
+                   dtype = np.float32)
+    for data in track_data:
+        mix[:len(audio[data][1])] += audio[data][1]
+    peak = np.abs(mix).max() if len(mix) else 0.0
+    if peak > 0:
+        mix *= MIX_PEAK * 32767 / peak
+  
+    return _write_render(name, midi_data, render_cache, key, params, mix)
+
+def arp_chords(chords, stop_low, intervals, second_half, generator):
+    """Arpeggiates all chords of a progression in one vectorized pass.
   
-    #Command to generate waveform audio file from midi file via Fluidsynth
-    get_ipython().system('fluidsynth -F output.wav output.mid')
+    Parameters
+    ----------
+    chords : list or events.NoteEvents
+      List of musicpy.structures.chord unarpeggiated, or note events with one
+      segment per chord
+    stop_low : int or list
+      Lowest octave at which arpeggios stop, per chord or for all chords
+    intervals : float
+      Time between consecutive notes of the arpeggios
+    second_half : bool
+      Whether arpeggios descend again after climbing
+    generator : numpy.random.Generator
+      Random number generator drawing the octave ranges
   
-    #Play waveform audio file
-    display(Audio('output.wav', autoplay=True))
-    print('Loading')
-    sleep(10)
-    print('The file is now ready for download. Would you like to download it,' +
-          ' or would you prefer to do so later?')
+    Returns
+    ----------
+    events.NoteEvents
+      One arpeggio per chord, equal to arp(chord, randrange(2, 4),
+      randrange(stop_low, 7), durations = 0.5, ...) for every chord
   
-    #Conditional to allow download of files
-    if take_user_input('Download now? [Y/N]: ', ['Y', 'N']) == 'Y':
-        display(FileLink('output.wav'))
+    Notes
+    ----------
+    Octave ranges are drawn chord by chord, so arpeggiating a progression in
+    several calls on the same generator gives the same arpeggios as one call.
+    """
+    if isinstance(chords, events.NoteEvents):
+        count = chords.segment_count
     else:
-        print('Do remember: if you do not like the sequenced song,' +
-              ' you can rerun sequencing through the Advanced Menu.')
+        count = len(chords)
+    lows = np.column_stack((np.full(count, 2), np.broadcast_to(stop_low, count)))
+    highs = np.broadcast_to([4, 7], (count, 2))
+    octaves = generator.integers(lows, highs)
+    return events.arpeggiate(chords, octaves[:, 0], octaves[:, 1], durations = 0.5,
+                             intervals = intervals, second_half = second_half)
+
+def in_notebook():
+    """Checks whether a live IPython shell is available for display."""
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return False
+    return get_ipython() is not None
+
+def play_music(midi_file, settings, country = False, interactive = None):
+    """Generates audio playback within output.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures or events.NoteEvents
+      Musical structure to generate audio playback with
+    settings : bool
+      Whether settings are determined or not
+    country : bool, default=False
+      Whether music is country music
+    interactive : bool, optional
+      Whether to display the audio and prompt for download, defaults to
+      whether a live IPython shell is running
+  
+    Returns
+    ----------
+    result : render.RenderResult
+      Paths of the MIDI and waveform audio files
+    """
+    return show_music(render_music(midi_file, settings, country), interactive)
+
+def play_live(midi_file, settings, sink, country = False, **options):
+    """Plays a musical structure in real time through a MIDI sink.
+  
+    Parameters
+    ----------
+    midi_file : musicpy.structures or events.NoteEvents
+      Musical structure to play, such as Genre.chord_tracks or the piece
+      returned by generate_symph()
+    settings : bool
+      Whether settings are determined or not
+    sink : object
+      Destination of MIDI messages, such as playback.MidoSink or
+      playback.SocketSink
+    country : bool, default=False
+      Whether music is country music
+    **options
+      Arguments of playback.Scheduler such as lookahead
+  
+    Returns
+    ----------
+    stats : dict
+      Start latency, jitter and late-message statistics, see
+      playback.Scheduler.stats()
+    """
+    messages = playback.schedule(*midi_tracks(midi_file, settings, country))
+    return playback.Scheduler(sink, **options).play(messages)
 
+def show_music(result, interactive = None):
+    """Displays a rendered piece and prompts for download.
+  
+    Parameters
+    ----------
+    result : render.RenderResult
+      Paths of the MIDI and waveform audio files
+    interactive : bool, optional
+      Whether to display the audio and prompt for download, defaults to
+      whether a live IPython shell is running
+  
+    Returns
+    ----------
+    result : render.RenderResult
+      The result passed in
+  
+    Notes
+    ----------
+    The download link points at a copy in the working directory through a
+    relative path, see download_copy(), as Jupyter only serves files below
+    the notebook folder.
+    """
+    if interactive is None:
+        interactive = in_notebook()
+  
+    #Display and download prompt as front-end on top of the headless render
+    if interactive == True and (result.audio_path is not None or result.pcm is not None):
+        from IPython.display import Audio, display, FileLink
+        try:
+            from .interface import take_user_input
+        except ImportError:
+            from interface import take_user_input
+    
+        #Play waveform audio file, or the rendered frames when they are held in memory
+        if result.pcm is not None:
+            display(Audio(result.pcm.T, rate = result.sample_rate, autoplay=True))
+        else:
+            display(Audio(result.audio_path, autoplay=True))
+        print('The file is now ready for download. Would you like to download it,' +
+              ' or would you prefer to do so later?')
+    
+        #Conditional to allow download of files
+        if take_user_input('Download now? [Y/N]: ', ['Y', 'N']) == 'Y':
+            display(FileLink(download_copy(result.audio_path or result.midi_path)))
+        else:
+            print('Do remember: if you do not like the sequenced song,' +
+                  ' you can rerun sequencing through the Advanced Menu.')
+  
+    return result
+
+def download_copy(path):
+    """Copies a rendered file into the working directory for download.
+  
+    Parameters
+    ----------
+    path : str
+      Path of the MIDI or waveform audio file
+  
+    Returns
+    ----------
+    str
+      Path relative to the working directory, of the file itself when it is
+      already below the working directory, otherwise of a copy with a unique
+      name such as output_1a2b3c.wav
+    """
+    folder = os.getcwd()
+    if os.path.abspath(path).startswith(os.path.join(folder, '')):
+        return os.path.relpath(path)
+    handle, copy_path = tempfile.mkstemp(suffix = os.path.splitext(path)[1], prefix = 'output_',
+                                         dir = folder)
+    os.close(handle)
+    shutil.copyfile(path, copy_path)
+    return os.path.relpath(copy_path)
+
+def read_audio(path):
+    """Reads a 16-bit waveform audio file.
+  
+    Returns
+    ----------
+    params : wave._wave_params
+      Channels, sample width and frame rate of the file
+    audio : numpy.ndarray
+      Frames as float32, one column per audio channel
+    """
+    with wave.open(path, 'rb') as audio_in:
+        params = audio_in.getparams()
+        audio = np.frombuffer(audio_in.readframes(params.nframes), dtype = np.int16)
+    return params, audio.reshape(-1, params.nchannels).astype(np.float32)
+
+def render_splice(midi_file, previous, old_region, new_region, start, country = False,
+                  name = None):
+    """Renders only a replaced region of a sequence and splices it into a previous render.
+  
+    Parameters
+    ----------
+    midi_file : list or events.NoteEvents
+      Whole sequence after the replacement
+    previous : render.RenderResult or None
+      Render of the sequence before the replacement
+    old_region, new_region : events.NoteEvents
+      Replaced arpeggios and the arpeggios replacing them
+    start : float
+      Time in bars at which both regions start
+    country : bool, default=False
+      Whether music is country music
+    name : str, optional
+      File name used for the MIDI and waveform audio files, files in a new
+      subfolder of render.output_folder(), removed when the process exits,
+      by default
+  
+    Returns
+    ----------
+    result : render.RenderResult
+      Paths of the MIDI and waveform audio files
+  
+    Notes
+    ----------
+    Synthesis is treated as linear: the old region rendered on its own is
+    subtracted from the previous audio, the new region added in its place and
+    the audio after the region moved to where the new region ends.
+    Falls back to render_music() when the previous audio is missing or the
+    region is shorter than the tail of its notes.
+    """
+    renderer = render.get_renderer()
+    if (previous is None or previous.audio_path is None or not renderer.available() or
+            not os.path.exists(previous.audio_path)):
+        return render_music(midi_file, False, country, name)
+  
+    midi_data = midi_bytes(midi_file, False, country)
+    render_cache = cache.get_cache()
+    key = render_key(midi_data, renderer)
+    cached = _lookup_render(render_cache, key, name)
+    if cached is not None:
+        return cached
+  
+    #Render both regions on their own with the settings of the whole sequence
+    instrument = default_instrument(country)
+    regions = []
+    with tempfile.TemporaryDirectory() as folder:
+        for i, region in enumerate([old_region, new_region]):
+            region_midi = os.path.join(folder, f'region_{i}.mid')
+            with open(region_midi, 'wb') as region_out:
+                region_out.write(midi.encode_midi([midi.MidiTrack(region, instrument)],
+                                                  bpm = 100))
+            result = renderer.render(region_midi, os.path.join(folder, f'region_{i}.wav'))
+            regions.append(read_audio(result.audio_path))
+    params, audio = read_audio(previous.audio_path)
+    (old_params, old_audio), (new_params, new_audio) = regions
+  
+    frames_per_bar = 4 * 60 / 100 * params.framerate
+    begin = int(round(start * frames_per_bar))
+    old_end = int(round((start + old_region.duration) * frames_per_bar))
+    new_end = int(round((start + new_region.duration) * frames_per_bar))
+    tail = len(old_audio) - (old_end - begin)
+    if (old_params[:3] != params[:3] or new_params[:3] != params[:3] or
+            tail > old_end - begin or len(audio) < begin + len(old_audio)):
+        return render_music(midi_file, False, country, name)
+  
+    #Remove the old region, keeping the audio before it and the audio after it apart
+    audio = audio.copy()
+    audio[begin:begin + len(old_audio)] -= old_audio
+    head = audio[:old_end]
+    after = audio[old_end:]
+    spliced = np.zeros((max(len(head), begin + len(new_audio), new_end + len(after)),
+                        params.nchannels), dtype = np.float32)
+    spliced[:len(head)] += head
+    spliced[begin:begin + len(new_audio)] += new_audio
+    spliced[new_end:new_end + len(after)] += after
+  
+    return _write_render(name, midi_data, render_cache, key, params, spliced)
+
+def render_stream(blocks, country = False, name = None):
+    """Writes and renders streamed note events window by window.
+  
+    Parameters
+    ----------
+    blocks : iterable
+      events.NoteEvents per window, such as Genre.stream()
+    country : bool, default=False
+      Whether music is country music
+    name : str, optional
+      File name used for the MIDI and waveform audio files, by default
+      scratch files removed once the stream ends, only the yielded frames
+      being kept
+  
+    Returns
+    ----------
+    iterator
+      numpy.ndarray of finished 16-bit audio frames per window, one column per
+      audio channel, followed by the tail of the last window
+  
+    Notes
+    ----------
+    The MIDI file is written incrementally through midi.MidiStreamWriter.
+    Every window is rendered on its own and overlapped with the tails of the
+    windows before, so playback can begin once the first window is rendered.
+    Only the MIDI file is written when no renderer is available.
+    """
+    instrument = default_instrument(country)
+    bpm = 100
+    renderer = render.get_renderer()
+    can_render = renderer.available()
+    if not can_render:
+        warnings.warn('No synthesizer available, only the MIDI file was written.')
+  
+    audio_out = None
+    pending = None #Audio from the start of the current window onwards
+    #Without a name only the yielded frames are kept, so the files are scratch files
+    with render.output_paths(name, True) as (midi_path, audio_path):
+        try:
+            with open(midi_path, 'wb') as midi_out, tempfile.TemporaryDirectory() as folder:
+                writer = midi.MidiStreamWriter(midi_out, instrument, bpm = bpm)
+                window_midi = os.path.join(folder, 'window.mid')
+                window_audio = os.path.join(folder, 'window.wav')
+          
+                #Loop to write and render every window as soon as it arrives
+                for block in blocks:
+                    writer.write(block)
+                    if not can_render:
+                        continue
+                    with open(window_midi, 'wb') as window_out:
+                        window_out.write(midi.encode_midi([midi.MidiTrack(block, instrument)],
+                                                          bpm = bpm))
+                    result = renderer.render(window_midi, window_audio)
+                    params, audio = read_audio(result.audio_path)
+            
+                    if audio_out is None:
+                        audio_out = _open_wave(audio_path, params)
+                        pending = np.zeros((0, params.nchannels), dtype = np.float32)
+            
+                    #Overlap the window with the tails of earlier windows
+                    frames = int(round(block.duration * 4 * 60 / bpm * params.framerate))
+                    mixed = np.zeros((max(len(pending), len(audio), frames), params.nchannels),
+                                     dtype = np.float32)
+                    mixed[:len(pending)] += pending
+                    mixed[:len(audio)] += audio
+                    finished = _to_frames(mixed[:frames])
+                    pending = mixed[frames:]
+                    audio_out.writeframes(finished.tobytes())
+                    yield finished
+          
+                writer.close()
+                if pending is not None and len(pending):
+                    finished = _to_frames(pending)
+                    audio_out.writeframes(finished.tobytes())
+                    yield finished
+        finally:
+            if audio_out is not None:
+                audio_out.close()
+  
 class Genre():
     """Superclass to represent default musical instance.
   
@@ -58,68 +777,480 @@ class Genre():
       Scale of the key chord arranged normally
     variation : int
       Number of variations and repetitions of progressions
+    seed : int
+      Seed that sequencing and symphony generation are deterministic in
     chord_tracks : list
       List of chord arpeggios arranged chronologically
     raw_chords : list
       List of chords unarpeggiated arranged chronologically
+    track_events, raw_events : events.NoteEvents or events.PatternEvents or None
+      Compact representation of chord_tracks and raw_chords, converted to
+      musicpy chords only when chord_tracks or raw_chords is accessed
+    last_render : render.RenderResult
+      Audio artifacts of the most recent playback
+    sequence_render : render.RenderResult or None
+      Audio of the current sequence alone, which regenerate() splices into,
+      None when the sequence changed since it was last played
+    progression_bounds : numpy.ndarray or None
+      Index of the first chord of every progression, followed by the number
+      of chords, None when chord_tracks was not built by sequence()
+    progression_states : list or None
+      State entering every progression, followed by the final state
+    sequence_options : dict
+      Options sequence() was called with, reused by regenerate()
+    rules : genres.GenreRules or None
+      Compiled progression rules of the genre, None for mixed pieces
   
     Methods
     ----------
     generate_symph(inst_list_lead = range(1, 100), inst_list_rhyth, = range(1, 100).
     volumes = [80, 80, 70, 70, 70])
       Generates multi-instrumental playback.
+    stream(window = 1)
+      Yields arpeggios block by block as progressions are chosen
+    regenerate(start, stop = None)
+      Regenerates a range of progressions in place
     """
-    def __init__(self, name, key_chord, add_to_chord, variation):
+    #Pieces without progression rules cannot be sequenced or regenerated
+    rules = None
+  
+    def __init__(self, name, key_chord, add_to_chord, variation, seed = None):
         self.name = name
         self.key_chord = key_chord
         self.add_to_chord = add_to_chord
         self.key_scale = scale(key_chord, add_to_chord)
         self.variation = variation
+        #Draw a seed when none is given so every piece can be reproduced
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
         self.chord_tracks = []
         self.raw_chords = []
+        self.last_render = None
+        self.sequence_options = {}
+  
+    @property
+    def chord_tracks(self):
+        #Lazy conversion of compact note events back to musicpy chords
+        if self._chord_tracks is None:
+            self._chord_tracks = self.track_events.to_chords()
+        return self._chord_tracks
+  
+    @chord_tracks.setter
+    def chord_tracks(self, value):
+        self._chord_tracks = value
+        self.track_events = None
+        self.sequence_render = None
+        #Progressions are unknown unless stored by store_sequence()
+        self.progression_bounds = None
+        self.progression_states = None
+  
+    @property
+    def raw_chords(self):
+        if self._raw_chords is None:
+            self._raw_chords = self.raw_events.to_chords()
+        return self._raw_chords
+  
+    @raw_chords.setter
+    def raw_chords(self, value):
+        self._raw_chords = value
+        self.raw_events = None
+  
+    def rng(self, purpose = 'sequence'):
+        """Returns a random number generator seeded by the piece seed.
+    
+        Parameters
+        ----------
+        purpose : str, default='sequence'
+          Name of the random stream, so that different stages draw independently
+    
+        Returns
+        ----------
+        random.Random
+          Generator private to the piece and purpose
+        """
+        return random.Random(f'{self.seed}:{purpose}')
+  
+    def reseed(self, seed = None):
+        """Replaces the seed, deriving the next one from the current seed by default."""
+        if seed is None:
+            seed = self.rng('reseed').randrange(2 ** 32)
+        self.seed = seed
+  
+    def is_sequenced(self):
+        """Checks whether the instance holds a sequence without converting it."""
+        return self.track_events is not None or self._chord_tracks != []
+  
+    def store_sequence(self, raw_chords, track_events, compact = False, repeat = 1,
+                       progressions = None):
+        """Stores sequenced chords as musicpy lists or compact note events.
+    
+        Parameters
+        ----------
+        raw_chords : list or events.NoteEvents
+          List of musicpy.structures.chord unarpeggiated, or their note events
+        track_events : events.NoteEvents
+          Arpeggios of raw_chords, one segment per chord
+        compact : bool, default=False
+          Whether to keep the sequence as compact note events
+        repeat : int, default=1
+          Number of repetitions of the whole sequence, kept as one pattern
+          with a repeat count
+        progressions : list, optional
+          (number of chords, state after) per progression, as yielded by
+          sequence_blocks(), needed by regenerate()
+        """
+        if compact == True or repeat != 1:
+            if isinstance(raw_chords, events.NoteEvents):
+                raw_events = raw_chords
+            else:
+                raw_events = events.NoteEvents.from_chords(raw_chords)
+            if repeat != 1:
+                #Repetitions share the events of the pattern
+                raw_events = events.PatternEvents(raw_events, repeat)
+                track_events = events.PatternEvents(track_events, repeat)
+            self.raw_events = raw_events
+            self.track_events = track_events
+            self._raw_chords = None
+            self._chord_tracks = None
+            self.sequence_render = None
+            self.progression_bounds = None
+            self.progression_states = None
+        else:
+            if isinstance(raw_chords, events.NoteEvents):
+                raw_chords = raw_chords.to_chords()
+            self.raw_chords = raw_chords * repeat
+            self.chord_tracks = track_events.to_chords() * repeat
+    
+        #Record where every progression starts for regenerate()
+        if progressions is not None:
+            sizes = [size for size, state in progressions] * repeat
+            self.progression_bounds = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+            self.progression_states = ([None] + [state for size, state in progressions]
+                                       * repeat)
+  
+    def note_events(self, raw = False):
+        """Returns the sequence as events.NoteEvents without building musicpy chords.
+    
+        Parameters
+        ----------
+        raw : bool, default=False
+          Whether to return the unarpeggiated chords instead of the arpeggios
+    
+        Returns
+        ----------
+        events.NoteEvents
+          One segment per chord, repetitions of patterns expanded
+        """
+        stored = self.raw_events if raw == True else self.track_events
+        if stored is None:
+            return events.NoteEvents.from_chords(self.raw_chords if raw == True
+                                                 else self.chord_tracks)
+        if isinstance(stored, events.PatternEvents):
+            return stored.expand()
+        return stored
+  
+    def play_sequence(self, country = False):
+        """Generates audio playback of the sequence without determined settings.
+    
+        Returns
+        ----------
+        result : render.RenderResult
+          Render of the sequence, kept as sequence_render apart from
+          symphonies so that regenerate() splices into the right audio
+        """
+        self.sequence_render = play_music(self.playback_tracks(), False, country)
+        self.last_render = self.sequence_render
+        return self.sequence_render
   
-    def generate_symph(self, inst_list_leads = random.sample(range(1, 70), 5),
-                       inst_list_rhythm = random.sample(range(1, 70), 5),
+    def sequence_output(self, compact = False):
+        """Returns the sequence in the form sequence() was asked for.
+    
+        Parameters
+        ----------
+        compact : bool, default=False
+          Whether to return note events instead of musicpy chords
+    
+        Returns
+        ----------
+        list or events.NoteEvents or events.PatternEvents
+          The stored note events, or note events converted from the stored
+          chords when the sequence was last stored as lists
+        """
+        if compact == True:
+            if self.track_events is not None:
+                return self.track_events
+            return self.note_events()
+        return self.chord_tracks
+  
+    def playback_tracks(self):
+        """Returns the sequence in its stored form for playback."""
+        if self.track_events is not None:
+            return self.track_events
+        return self.chord_tracks
+  
+    def progression_stream(self, rng, start = 0, stop = None, state = None, **options):
+        """Yields the chords of every progression, sampled from the genre rules.
+    
+        Parameters
+        ----------
+        rng : random.Random
+          Random number generator of the piece
+        start, stop : int, optional
+          Range of progressions to generate, all of them by default
+        state : object, optional
+          State entering progression start, the initial state by default
+        **options
+          Options of genres.GenreRules.plan(), such as change_key for jazz
+    
+        Returns
+        ----------
+        iterator
+          (chords, stop_lows, state) per progression, the unarpeggiated chords,
+          the lowest octave each arpeggio stops at and the state after it
+    
+        Notes
+        ----------
+        All random choices of the range are drawn at once from the compiled
+        rules, and chords come from the shared voicing cache.
+        """
+        if self.rules is None:
+            raise NotImplementedError(f'{type(self).__name__} has no chord progressions')
+        generator = np.random.default_rng(rng.getrandbits(64))
+        for plan, stop_lows, transpose, state in self.rules.plan(
+                generator, self.variation, self.add_to_chord, start, stop, state, **options):
+            chords = [voicings.voicing_chord(self.key_chord, self.add_to_chord, degree, quality,
+                                             alteration, transpose = transpose,
+                                             root_shift = shift)
+                      for degree, quality, alteration, shift in plan]
+            yield chords, stop_lows, state
+  
+    def sequence_blocks(self, window = None, **options):
+        """Yields raw chords and their arpeggios window by window.
+    
+        Parameters
+        ----------
+        window : int, optional
+          Number of progressions per block, all progressions in one block by default
+        **options
+          Options of progression_stream(), such as change_key for jazz
+    
+        Returns
+        ----------
+        iterator
+          (raw_chords, track_events, progressions) per block of progressions,
+          with (number of chords, state after) per progression
+        """
+        rng = self.rng()
+        generator = np.random.default_rng(rng.getrandbits(64))
+        raw_chords = []
+        stop_lows = []
+        progressions = []
+    
+        #Loop to arpeggiate progressions as soon as a window of them is chosen
+        for chords, chord_stop_lows, state in self.progression_stream(rng, **options):
+            raw_chords += chords
+            stop_lows += chord_stop_lows
+            progressions.append((len(chords), state))
+            if window is not None and len(progressions) == window:
+                yield raw_chords, arp_chords(raw_chords, stop_lows, self.arp_intervals,
+                                             self.arp_second_half, generator), progressions
+                raw_chords = []
+                stop_lows = []
+                progressions = []
+    
+        if progressions or window is None:
+            yield raw_chords, arp_chords(raw_chords, stop_lows, self.arp_intervals,
+                                         self.arp_second_half, generator), progressions
+  
+    def stream(self, window = 1, **options):
+        """Yields the arpeggios of the sequence as progressions are chosen.
+    
+        Parameters
+        ----------
+        window : int, default=1
+          Number of progressions per block
+        **options
+          Options of progression_stream(), such as change_key for jazz
+    
+        Returns
+        ----------
+        iterator
+          events.NoteEvents per block, timed from the start of the block
+    
+        Notes
+        ----------
+        Blocks concatenated equal the track_events sequence() stores for the
+        same seed, while only one window is held in memory at a time.
+        Nothing is stored on the instance.
+        """
+        for raw_chords, block, progressions in self.sequence_blocks(window, **options):
+            yield block
+  
+    def transition_chords(self, state, next_state):
+        """Returns chords leading from one progression state into another.
+    
+        Returns
+        ----------
+        chords, stop_lows : list
+          Unarpeggiated chords and the lowest octave each arpeggio stops at,
+          empty unless the genre changes mode between progressions
+        """
+        if self.rules is None:
+            return [], []
+        plan, stop_lows = self.rules.transition(state, next_state)
+        chords = [voicings.voicing_chord(self.key_chord, self.add_to_chord, degree, quality,
+                                         alteration, transpose = state[1], root_shift = shift)
+                  for degree, quality, alteration, shift in plan]
+        return chords, stop_lows
+  
+    def regenerate(self, start, stop = None, play = True):
+        """Regenerates a range of progressions in place, keeping the rest.
+    
+        Parameters
+        ----------
+        start : int
+          First progression to regenerate, counting from 0
+        stop : int, optional
+          Progression after the last one to regenerate, start + 1 by default
+        play : bool, default=True
+          Whether to generate audio playback
+    
+        Returns
+        ----------
+        self.chord_tracks : list or events.NoteEvents
+          Sequence in its stored form
+    
+        Notes
+        ----------
+        The seed is replaced as in sequence(rerun = True). Chords lead back into
+        the progression after the range when its state differs, and only the
+        range is re-rendered and spliced into the previous audio.
+        """
+        if self.progression_bounds is None:
+            raise ValueError('Only pieces sequenced with sequence() can be regenerated')
+        total = len(self.progression_bounds) - 1
+        if stop is None:
+            stop = start + 1
+        if not 0 <= start < stop <= total:
+            raise ValueError(f'Progressions {start}:{stop} are outside 0:{total}')
+    
+        self.reseed()
+        previous = self.sequence_render
+        rng = self.rng()
+        generator = np.random.default_rng(rng.getrandbits(64))
+        raw_chords = []
+        stop_lows = []
+        sizes = []
+        states = []
+        for chords, chord_stop_lows, state in self.progression_stream(
+                rng, start, stop, self.progression_states[start], **self.sequence_options):
+            raw_chords += chords
+            stop_lows += chord_stop_lows
+            sizes.append(len(chords))
+            states.append(state)
+    
+        #Lead back into the state the kept progressions were built in
+        if stop < total:
+            chords, chord_stop_lows = self.transition_chords(states[-1],
+                                                             self.progression_states[stop])
+            raw_chords += chords
+            stop_lows += chord_stop_lows
+            sizes[-1] += len(chords)
+            states[-1] = self.progression_states[stop]
+        new_region = arp_chords(raw_chords, stop_lows, self.arp_intervals,
+                                self.arp_second_half, generator)
+    
+        #Splice the region into the stored sequence
+        first = int(self.progression_bounds[start])
+        last = int(self.progression_bounds[stop])
+        if self.track_events is not None:
+            track_events = self.track_events
+            raw_events = self.raw_events
+            old_region = track_events.segments(first, last)
+            region_start = track_events.segments(0, first).duration
+            self.track_events = events.concat_events([
+                track_events.segments(0, first), new_region,
+                track_events.segments(last, track_events.segment_count)])
+            self.raw_events = events.concat_events([
+                raw_events.segments(0, first), events.NoteEvents.from_chords(raw_chords),
+                raw_events.segments(last, raw_events.segment_count)])
+            self._raw_chords = None
+            self._chord_tracks = None
+        else:
+            old_region = events.NoteEvents.from_chords(self._chord_tracks[first:last])
+            region_start = sum(c.start_time + sum(c.interval) for c in self._chord_tracks[:first])
+            self._chord_tracks[first:last] = new_region.to_chords()
+            self._raw_chords[first:last] = raw_chords
+    
+        old_sizes = np.diff(self.progression_bounds)
+        sizes = np.concatenate((old_sizes[:start], sizes, old_sizes[stop:]))
+        self.progression_bounds = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        self.progression_states[start + 1:stop + 1] = states
+    
+        #Re-render only the region and splice it into the previous audio
+        if play == True:
+            result = render_splice(self.playback_tracks(), previous, old_region,
+                                   new_region, region_start, isinstance(self, Country))
+            self.sequence_render = show_music(result)
+            self.last_render = self.sequence_render
+        else:
+            self.sequence_render = None
+    
+        return self.playback_tracks()
+  
+    def generate_symph(self, inst_list_leads = None, inst_list_rhythm = None,
                        volumes = [80, 80, 70, 70, 70]):
         """Generates multi-instrumental playback.
     
         Parameters
         ----------
         inst_list_leads, inst_list_rhythm : list, optional
-          List of MIDI numbers of possible lead and rhythm instruments
+          List of MIDI numbers of possible lead and rhythm instruments,
+          five instruments from range(1, 70) drawn from the piece seed by default
         volumes : list, optional
           List of percentage values of instrument  volumes
     
         Returns
         ----------
         symph : musicpy.structures.piece
-          Multi-instrumental MIDI piece
+          Multi-instrumental MIDI piece, whose tracks all share one
+          EventChord of the whole sequence
     
         Notes
         ----------
-        Generates audio playback in output through play_music()
+        Generates audio playback in output through render_tracks()
+        All tracks reference the same EventChord holding the stored note
+        events, so a repeated pattern is carried into MIDI writing as a
+        pattern. Its musicpy notes are only built when asked for, such as
+        by repr() or musicpy.write().
         """
-        #Converts list of musicpy.structures.chord to construct tracklist
-        chord_list = concat(self.chord_tracks)
-        track_list = [chord_list, chord_list, chord_list, chord_list, chord_list]
+        #Shares the stored events between tracks, lists of chords converted once
+        if self.track_events is not None:
+            chord_list = EventChord(self.track_events)
+        else:
+            chord_list = EventChord(events.NoteEvents.from_chords(self.chord_tracks))
+        track_list = [chord_list] * len(volumes)
     
         #Choose random acceptable instruments for playback and create list
-        lead_inst = random.sample(inst_list_leads, 2)
-        bg_inst = random.sample(inst_list_rhythm, 3)
+        rng = self.rng('symph')
+        if inst_list_leads is None:
+            inst_list_leads = rng.sample(range(1, 70), 5)
+        if inst_list_rhythm is None:
+            inst_list_rhythm = rng.sample(range(1, 70), 5)
+        lead_inst = rng.sample(inst_list_leads, 2)
+        bg_inst = rng.sample(inst_list_rhythm, 3)
         chosen_inst = [*lead_inst, *bg_inst]
     
-        #Build pieces and add volume controls
-        symph = piece(tracks = track_list, instruments = chosen_inst,
-                      bpm = 120, start_times = [0, 0, 0, 0, 0])
+        #Build pieces with per-track instruments, channels and volume controls
+        symph = piece(tracks = track_list, instruments = chosen_inst, bpm = 120,
+                      start_times = [0] * len(track_list),
+                      channels = list(range(len(track_list))))
+        for i, value in enumerate(volumes):
+            symph.add_volume(value, i, mode = 'percentage', start_time = 0)
     
-        symph.add_volume(volumes[0], 0, mode = 'percentage', start_time = 0)
-        symph.add_volume(volumes[1], 1, mode = 'percentage', start_time = 0)
-        symph.add_volume(volumes[2], 2, mode = 'percentage', start_time = 0)
-        symph.add_volume(volumes[3], 3, mode = 'percentage', start_time = 0)
-        symph.add_volume(volumes[4], 4, mode = 'percentage', start_time = 0)
-    
-        #Plays music with pre-determined musical settings
-        play_music(symph, True)
+        #Renders every instrument on its own worker and plays the mix
+        self.last_render = show_music(render_tracks(symph))
     
         return symph #musicpy.structures.piece returned
                        
@@ -140,19 +1271,33 @@ class Jazz(Genre):
       Scale of the key chord arranged normally
     variation : int
       Number of variations and repetitions of progressions
+    seed : int
+      Seed that sequencing and symphony generation are deterministic in
     chord_tracks : list
       List of chord arpeggios arranged chronologically
     raw_chords : list
       List of chords unarpeggiated arranged chronologically
+    track_events, raw_events : events.NoteEvents or None
+      Compact representation of chord_tracks and raw_chords, converted to
+      musicpy chords only when chord_tracks or raw_chords is accessed
+    last_render : render.RenderResult
+      Audio artifacts of the most recent playback
   
     Methods
     ----------
     sequence(rerun = False, change_key = False)
       Generates MIDI sequence of jazz
+    stream(window = 1, change_key = False)
+      Yields the jazz sequence block by block
     generate_symph()
       Calls superclass generate_symph() method with instruments and volumes
     """
-    def sequence(self, rerun = False, change_key = False):
+    #Compiled progression rules and arpeggio settings of jazz
+    rules = genres.get_rules('jazz')
+    arp_intervals = rules.arp_intervals
+    arp_second_half = rules.arp_second_half
+  
+    def sequence(self, rerun = False, change_key = False, compact = False, play = True):
         """Generates MIDI sequence of jazz
     
         Parameters
@@ -161,98 +1306,42 @@ class Jazz(Genre):
           Whether to overwrite previous instance sequence
         change_key : bool, default=False
           Whether to change key scale within sequence
+        compact : bool, default=False
+          Whether to store and return the sequence as events.NoteEvents
+        play : bool, default=True
+          Whether to generate audio playback
     
         Returns
         ----------
-        self.chord_tracks : list
+        self.chord_tracks : list or events.NoteEvents
           List of musicpy.structures.chord arranged chronologically
     
         Notes
         ----------
         Generates audio playback in output through play_music()
         """
-    
-        progressions = [['5', '1'], ['2', '5'], ['2', '5', '1'],
-         ['4', '5', '1'], ['1', '6', '2', '5']] #List of Jazz progressions
-        count = 0 #initialise counter variable
-    
-        #Create local variables from instance attributes
-        add_chord = self.add_to_chord
-        key_scale = self.key_scale
-    
         #Conditional to ensure callback on chord_tracks without overwriting original
-        if self.chord_tracks == [] or rerun == True:
+        if not self.is_sequenced() or rerun == True:
             #In case user wishes to overwrite musical piece
-            self.chord_tracks = []
-            self.raw_chords = []
-      
-          #Loop to add chord progressions in sets until count equals variation
-            while count <= self.variation:
-    
-                #Divides acceptable progressions by 'minor' and 'major'
-                if add_chord == 'minor':
-                    prog = random.choice(progressions[0:3])
-                else:
-                    prog = random.choice(progressions)
-      
-                #Changes key of scale when 2 progressions are left
-                if change_key == True and self.variation - count == 2:
-                    key_scale = key_scale.down(2)
-      
-                #Loop to add chords from numbers listed in chord progressions
-                for x in prog:
-      
-                    #Add characteristic unpredictability to jazz
-                    if count%3 == 0:
-                        add_chord_new = random.choice(['major', 'minor'])
-        
-                      #Sub-progression to transition to new chord type
-                        if add_chord_new != add_chord:
-                            x = '4'
-                            self.raw_chords.append(get_chord(
-                              key_scale.get_note_from_degree(int(x)), add_chord))
-                            self.chord_tracks.append(arp(get_chord(
-                              key_scale.get_note_from_degree(int(x)), add_chord),
-                              random.randrange(2, 4), random.randrange(5, 7),
-                              durations = 0.5, intervals = 0.0625, second_half = True))
-                            add_chord = add_chord_new
-        
-                    #Conditional to add chords based on specified degree
-                    if int(x) == 5:
-                        chord_x = get_chord(key_scale.get_note_from_degree(int(x)), 'M7')
-                        if add_chord == 'minor':
-                            chord_x = chord_x('b9')
-                    elif int(x) == 2:
-                        chord_x = get_chord(key_scale.get_note_from_degree(int(x)), 'm7')
-                        if add_chord == 'minor':
-                            chord_x = chord_x('b5')
-                    elif int(x) == 1 and add_chord == 'minor':
-                        chord_x = get_chord(key_scale.get_note_from_degree(int(x)), 'm6')
-                    else:
-                        chord_x = get_chord(
-                            key_scale.get_note_from_degree(int(x)), add_chord)
-        
-                    #Provide finger-based inversion to chords randomly
-                    chord_x.inv(random.randrange(1, 3))
-        
-                    #Add chord to raw_chords and chord_tracks
-                    self.raw_chords.append(chord_x)
-                    self.chord_tracks.append(arp(chord_x,
-                              random.randrange(2, 4), random.randrange(4, 7),
-                              durations = 0.5, intervals = 0.0625, second_half = True))
+            if self.is_sequenced():
+                self.reseed()
       
-                count += 1
+            #Arpeggiate the whole progression at once for chord_tracks
+            self.sequence_options = {'change_key': change_key}
+            raw_chords, track_events, progressions = next(self.sequence_blocks(
+                change_key = change_key))
+            self.store_sequence(raw_chords, track_events, compact, 1, progressions)
     
         #Generate audio playback inside output without determined settings
-        play_music(self.chord_tracks, False)
+        if play == True:
+            self.play_sequence()
     
-        return self.chord_tracks #return list of musicpy.structures.chord
+        return self.sequence_output(compact) #return list of musicpy.structures.chord
   
     def generate_symph(self):
         """Calls superclass generate_symph() method with instruments and volumes
         """
-        super().generate_symph([1, 2, 3, 12, 26, 52],
-             [27, 32, 40, 56, 57, 64, 65, 66], [85, 75, 70, 65, 55])
+        return super().generate_symph(*self.rules.symph)
 
 class Pop(Genre):
     """Subclass of Genre to represent all pop instances.
@@ -271,77 +1360,92 @@ class Pop(Genre):
       Scale of the key chord arranged normally
     variation : int
       Number of variations and repetitions of progressions
+    seed : int
+      Seed that sequencing and symphony generation are deterministic in
     chord_tracks : list
       List of chord arpeggios arranged chronologically
     raw_chords : list
       List of chords unarpeggiated arranged chronologically
+    track_events, raw_events : events.NoteEvents or None
+      Compact representation of chord_tracks and raw_chords, converted to
+      musicpy chords only when chord_tracks or raw_chords is accessed
+    last_render : render.RenderResult
+      Audio artifacts of the most recent playback
   
     Methods
     ----------
     sequence(rerun = False)
       Generates MIDI sequence of jazz
+    stream(window = 1)
+      Yields the pop sequence once per repetition
     generate_symph()
       Calls superclass generate_symph() method with instruments and volumes
     """
   
-    def sequence(self, rerun = False):
+    #Compiled progression rules and arpeggio settings of pop
+    rules = genres.get_rules('pop')
+    arp_intervals = rules.arp_intervals
+    arp_second_half = rules.arp_second_half
+  
+    def stream(self, window = 1):
+        """Yields the arpeggios of the progression once per repetition.
+    
+        Parameters
+        ----------
+        window : int, default=1
+          Number of progressions per block
+    
+        Returns
+        ----------
+        iterator
+          events.NoteEvents per repetition, see Genre.stream()
+        """
+        for block in super().stream(window):
+            for i in range(self.variation):
+                yield block
+  
+    def sequence(self, rerun = False, compact = False, play = True):
         """Generates MIDI sequence of pop.
     
         Parameters
         ----------
         rerun : bool, default=False
           Whether to overwrite previous instance sequence
+        compact : bool, default=False
+          Whether to return the sequence as events.PatternEvents
+        play : bool, default=True
+          Whether to generate audio playback
     
         Returns
         ----------
-        self.chord_tracks : list
+        self.chord_tracks : list or events.PatternEvents
           List of musicpy.structures.chord arranged chronologically
     
         Notes
         ----------
+        The progression is stored once with variation as its repeat count,
+        so memory does not grow with the number of repetitions.
         Generates audio playback in output through play_music()
         """
-        progressions = [['1', '5', '6', '4'], ['1', '6', '4', '5'],
-        ['1', '4', '5'], ['1', '4', '6', '5'],
-        ['6', '4', '1', '5'], ['1', '4', '1']] #List of pop progressions
-    
         #Conditional to check whether to overwrite prior pop sequence
-        if self.chord_tracks == [] or rerun == True:
-            self.chord_tracks = []
-            self.raw_chords = []
-      
-            #Choose a progression for the pop sequence
-            prog = random.choice(progressions)
-      
-            #Loop to add chords based on degree in scale from progression
-            for x in prog:
-                add_chord = self.add_to_chord #reset local variable to instance value
-        
-                #Conditional to change add_chord based on degree from scale
-                if int(x) == 6:
-                    add_chord = 'minor'
-        
-                #Add chord to raw_chords and chord_tracks
-                chord_x = get_chord(self.key_scale.get_note_from_degree(int(x)), add_chord)
-                self.raw_chords.append(chord_x)
-                self.chord_tracks.append(arp(chord_x,
-                                random.randrange(2, 4), random.randrange(5, 7),
-                                durations = 0.5, intervals = 0.125, second_half = False))
+        if not self.is_sequenced() or rerun == True:
+            if self.is_sequenced():
+                self.reseed()
         
-            #Repeat chord progression by variation
-            self.chord_tracks = self.chord_tracks * self.variation
-            self.raw_chords = self.raw_chords * self.variation
+            #Arpeggiate the progression and repeat it by variation
+            raw_chords, track_events, progressions = next(self.sequence_blocks())
+            self.store_sequence(raw_chords, track_events, compact, self.variation, progressions)
     
         #Generate audio playback in output without determined settings
-        play_music(self.chord_tracks, False)
+        if play == True:
+            self.play_sequence()
     
-        return self.chord_tracks #Returns list of musicpy.structures.chord
+        return self.sequence_output(compact) #Returns list of musicpy.structures.chord
     
     def generate_symph(self):
         """Calls superclass generate_symph() method with instruments and volumes.
         """
-        super().generate_symph([1, 2, 3, 24, 25, 12, 26, 40, 54, 56, 57, 72, 73, 78, 80, 81, 85, 106, 107, 110],
-         [5, 9, 27, 28, 32, 33, 34, 35, 41, 42, 52, 53, 64, 65, 66, 67, 91, 92, 95, 104], [90, 75, 65, 55, 55])
+        return super().generate_symph(*self.rules.symph)
 
 class Country(Genre):
     """Subclass of Genre to represent all country music instances.
@@ -360,90 +1464,279 @@ class Country(Genre):
       Scale of the key chord arranged normally
     variation : int
       Number of variations and repetitions of progressions
+    seed : int
+      Seed that sequencing and symphony generation are deterministic in
     chord_tracks : list
       List of chord arpeggios arranged chronologically
     raw_chords : list
       List of chords unarpeggiated arranged chronologically
+    track_events, raw_events : events.NoteEvents or None
+      Compact representation of chord_tracks and raw_chords, converted to
+      musicpy chords only when chord_tracks or raw_chords is accessed
+    last_render : render.RenderResult
+      Audio artifacts of the most recent playback
   
     Methods
     ----------
     sequence(rerun = False)
       Generates MIDI sequence of country music
+    stream(window = 1)
+      Yields the country music sequence block by block
     generate_symph()
       Calls superclass generate_symph() method with instruments and volumes
     """
   
-    def sequence(self, rerun = False):
+    #Compiled progression rules and arpeggio settings of country music
+    rules = genres.get_rules('country')
+    arp_intervals = rules.arp_intervals
+    arp_second_half = rules.arp_second_half
+  
+    def sequence(self, rerun = False, compact = False, play = True):
         """Generates MIDI sequence of country music.
     
         Parameters
         ----------
         rerun : bool, default=False
           Whether to overwrite previous instance sequence
+        compact : bool, default=False
+          Whether to store and return the sequence as events.NoteEvents
+        play : bool, default=True
+          Whether to generate audio playback
     
         Returns
         ----------
-        self.chord_tracks : list
+        self.chord_tracks : list or events.NoteEvents
           List of musicpy.structures.chord arranged chronologically
     
         Notes
         ----------
         Generates audio playback in output through play_music()
         """
-        progressions = [['1', '4', '5'], ['1', '5', '4'], ['1', '5', '4', '6'],
-         ['1', '4', '6', '5'], ['1', '2', '4']] #List of country music progressions
-    
-        count = 0 #Initialise counter variable
-    
         #Conditional to check whether to overwrite country music sequence
-        if self.chord_tracks == [] or rerun == True:
-            self.chord_tracks = []
-            self.raw_chords = []
+        if not self.is_sequenced() or rerun == True:
+            if self.is_sequenced():
+                self.reseed()
       
-            #Loop to add progressions to chord_tracks through random choice
-            while count <= self.variation:
-                prog = random.choice(progressions)
-        
-                #Loop to add chords based on degree of progression to scale
-                for x in prog:
-                    add_chord = self.add_to_chord
-          
-                    #Conditional to change chord types based on degree from scale
-                    if x == '6':
-                        add_chord = 'minor'
-                    elif x == '2':
-                        prior_chord = get_chord(
-                            self.key_scale.get_note_from_degree(int(x)).down(), 'dim7')
-                        self.raw_chords.append(prior_chord)
-                        self.chord_tracks.append(arp(prior_chord,
-                                  random.randrange(2, 4), random.randrange(4, 7),
-                                  durations = 0.5, intervals = 0.125, second_half = False))
-                        add_chord = 'minor'
-          
-                    chord_x = get_chord(self.key_scale.get_note_from_degree(int(x)),
-                                        add_chord)
-          
-                    #Perform random finger-based chord inversions
-                    chord_x.inv(random.randrange(1, 3))
-          
-                    #Add to raw_chords and chord_tracks
-                    self.raw_chords.append(chord_x)
-                    self.chord_tracks.append(arp(chord_x,
-                                random.randrange(2, 4), random.randrange(4, 7),
-                                durations = 0.5, intervals = 0.125, second_half = False))
-          
-                count += 1
+            #Arpeggiate the whole progression at once for chord_tracks
+            raw_chords, track_events, progressions = next(self.sequence_blocks())
+            self.store_sequence(raw_chords, track_events, compact, 1, progressions)
     
         #Generate audio playback in output without settings for country music
-        play_music(self.chord_tracks, False, True)
+        if play == True:
+            self.play_sequence(True)
     
-        return self.chord_tracks #Returns list of musicpy.structures.chord
+        return self.sequence_output(compact) #Returns list of musicpy.structures.chord
     
     def generate_symph(self):
         """Calls superclass generate_symph() method with instruments and volumes.
         """
-        super().generate_symph([1, 2, 21, 22, 24, 25, 72, 73, 78, 79, 105, 106, 107, 110],
-         [9, 19, 27, 31, 32, 35, 36, 37, 64, 65, 66, 67], [90, 80, 65, 55, 55])
+        return super().generate_symph(*self.rules.symph)
+
+class DataGenre(Genre):
+    """Subclass of Genre for genres defined only by registered rules.
+  
+    ...
+  
+    Attributes
+    ----------
+    rules : genres.GenreRules
+      Compiled progression rules registered with genres.register_genre()
+  
+    Methods
+    ----------
+    sequence(rerun = False, change_key = False, compact = False, play = True)
+      Generates MIDI sequence from the rules
+    generate_symph()
+      Calls superclass generate_symph() method with the instruments of the rules
+  
+    Notes
+    ----------
+    Subclasses are created by genre_class() and pickled by genre name, so
+    workers of batch.generate_batch() need the genre registered as well.
+    """
+    def __reduce__(self):
+        return _rebuild_piece, (self.rules.name, self.__dict__)
+  
+    def sequence(self, rerun = False, change_key = False, compact = False, play = True):
+        """Generates MIDI sequence from the rules.
+    
+        Parameters
+        ----------
+        rerun : bool, default=False
+          Whether to overwrite previous instance sequence
+        change_key : bool, default=False
+          Whether to change key scale within sequence, for rules with key_change
+        compact : bool, default=False
+          Whether to store and return the sequence as compact note events
+        play : bool, default=True
+          Whether to generate audio playback
+    
+        Returns
+        ----------
+        self.chord_tracks : list or events.NoteEvents or events.PatternEvents
+          List of musicpy.structures.chord arranged chronologically
+        """
+        if not self.is_sequenced() or rerun == True:
+            if self.is_sequenced():
+                self.reseed()
+      
+            #Rules with a single progression repeat it by variation
+            self.sequence_options = {'change_key': change_key}
+            raw_chords, track_events, progressions = next(self.sequence_blocks(
+                change_key = change_key))
+            repeat = self.variation if self.rules.single else 1
+            self.store_sequence(raw_chords, track_events, compact, repeat, progressions)
+    
+        if play == True:
+            self.play_sequence()
+    
+        return self.sequence_output(compact)
+  
+    def generate_symph(self):
+        """Calls superclass generate_symph() method with the instruments of the rules.
+        """
+        if self.rules.symph is None:
+            return super().generate_symph()
+        return super().generate_symph(*self.rules.symph)
+
+#Genre subclasses by registered genre name, extended by genre_class()
+GENRE_CLASSES = {'jazz': Jazz, 'pop': Pop, 'country': Country}
+
+def genre_class(name):
+    """Returns the Genre subclass of a registered genre.
+  
+    Parameters
+    ----------
+    name : str
+      Name the genre rules were registered under, case-insensitive
+  
+    Returns
+    ----------
+    class
+      Jazz, Pop or Country for the built-in genres, otherwise a DataGenre
+      subclass built once from the rules
+    """
+    rules = genres.get_rules(name)
+    genre = GENRE_CLASSES.get(rules.name)
+    if genre is None or genre.rules is not rules:
+        genre = type(rules.name.title(), (DataGenre,),
+                     {'rules': rules, 'arp_intervals': rules.arp_intervals,
+                      'arp_second_half': rules.arp_second_half})
+        GENRE_CLASSES[rules.name] = genre
+    return genre
+
+def _rebuild_piece(name, state):
+    #Unpickles a DataGenre instance through the registry
+    music_piece = genre_class(name).__new__(genre_class(name))
+    music_piece.__dict__.update(state)
+    return music_piece
+
+def switch_on_match(active, masks):
+    """Switching rule of mix_pieces(), handing over on chords with the same pitch classes.
+  
+    Parameters
+    ----------
+    active : int
+      Index of the piece the current chord is taken from
+    masks : list
+      Pitch-class mask of the current chord of every piece, None for pieces
+      without chords left
+  
+    Returns
+    ----------
+    int
+      Index of the piece to take the next chord from, the next piece after
+      active whose chord matches, or active when none matches
+    """
+    count = len(masks)
+    for step in range(1, count):
+        other = (active + step) % count
+        if masks[other] is not None and masks[other] == masks[active]:
+            return other
+    return active
+
+def round_robin(active, masks):
+    """Switching rule taking every chord from the next piece with chords left."""
+    count = len(masks)
+    for step in range(1, count + 1):
+        other = (active + step) % count
+        if masks[other] is not None:
+            return other
+    return active
+
+def merge_pieces(pieces, key = 'first', rule = switch_on_match, truncate = False, play = True):
+    """Mixes any number of musical pieces into one musical instance.
+  
+    Parameters
+    ----------
+    pieces : list
+      Genre instances to mix together, the first one leading
+    key : str or None, default='first'
+      Key policy, 'first' to transpose every piece to the key chord of the
+      first piece, a note name to transpose every piece to that key chord, or
+      None to keep every piece in its own key
+    rule : function, default=switch_on_match
+      Switching rule called after every chord as rule(active, masks), see
+      switch_on_match()
+    truncate : bool, default=False
+      Whether to stop at the end of the shortest piece instead of carrying
+      on with the pieces that have chords left
+    play : bool, default=True
+      Whether to generate audio playback
+  
+    Returns
+    ----------
+    out_instance : Genre instance
+      Mixed musical instance of all pieces
+  
+    Notes
+    ----------
+    The pitch-class masks of all pieces are walked position by position with
+    zip_longest(), so the output is linear in the total number of chords.
+    The mix is arpeggiated at once and rendered a single time at the end.
+    """
+    key_chord = pieces[0].key_chord if key in ('first', None) else key
+  
+    #Unarpeggiated chords of every piece as pitch arrays, moved to the key chord
+    raws = []
+    for music_piece in pieces:
+        raw = music_piece.note_events(raw = True)
+        if key is not None:
+            raw = raw.transpose(N(key_chord).degree - N(music_piece.key_chord).degree)
+        raws.append(raw)
+  
+    #Loop over chords of all pieces position by position to choose the mixed chords
+    mask_lists = [raw.pitch_class_masks().tolist() for raw in raws]
+    sources = []
+    segments = []
+    active = 0
+    for position, masks in enumerate(itertools.zip_longest(*mask_lists)):
+        masks = list(masks)
+        if truncate == True and None in masks:
+            break
+        #Hand over when the active piece has no chords left
+        if masks[active] is None:
+            active = round_robin(active, masks)
+        sources.append(active)
+        segments.append(position)
+        active = rule(active, masks)
+    mixed_chords = events.take_segments(raws, sources, segments)
+  
+    #Create name and seed for building Genre musical instance
+    mixed_name = ' + '.join(music_piece.name for music_piece in pieces)
+    mixed_seed = ':'.join(str(music_piece.seed) for music_piece in pieces)
+    mixed_seed = random.Random(f'{mixed_seed}:mix').randrange(2 ** 32)
+    out_instance = Genre(mixed_name, key_chord, "major", pieces[0].variation, mixed_seed)
+  
+    #Arpeggiate all chosen chords at once, converted to musicpy chords on access
+    generator = np.random.default_rng(out_instance.rng().getrandbits(64))
+    mixed_track = arp_chords(mixed_chords, 5, 0.0625, True, generator)
+    out_instance.store_sequence(mixed_chords, mixed_track, compact = True)
+  
+    #Generate audio playback in output without determined settings
+    if play == True:
+        out_instance.play_sequence()
+    return out_instance
 
 def mix_pieces(piece_1, piece_2, change_key = True):
     """Mixes two musical pieces together into one musical instance.
@@ -464,58 +1757,10 @@ def mix_pieces(piece_1, piece_2, change_key = True):
     ----------
     Generates audio playback in output through play_music()
     Creates default Genre class instance
+    Stops at the end of the shorter piece, see merge_pieces() for more pieces
     """
-  
-    #Set key to that of piece_1
-    key_chord = piece_1.key_chord
-  
-    #Initialised transposed and mixed tracks
-    trans_track = []
-    mixed_track = []
-  
-    #Find amount of transposition between both musical instances
-    transpose = N(key_chord).degree - N(piece_2.key_chord).degree
-  
-    #Conditional to tranpose based on bool change_key
     if change_key == True:
-        #Transpose piece_2 upwards
-        if transpose > 0:
-            for c in piece_2.raw_chords:
-                trans_track.append(c.up(transpose))
-        #Transpose piece_2 downwards
-        elif transpose < 0:
-            for c in piece_2.raw_chords:
-                transpose = transpose * -1
-                trans_track.append(c.down(transpose))
+        key = 'first'
     else:
-        trans_track = piece_2.chord_tracks
-  
-    #Initialise boolean to switch main added progression
-    switch_bool = True
-  
-    #Loop over chords of both instances to created mixed tracklist
-    for c1, c2 in zip(piece_1.raw_chords, trans_track):
-    
-        #Conditional to choose which chord to add to mixed_track
-        if switch_bool == True:
-            mixed_track.append(arp(c1,
-                            random.randrange(2, 4), random.randrange(5, 7),
-                            durations = 0.5, intervals = 0.0625, second_half = True))
-        else:
-            mixed_track.append(arp(c2,
-                            random.randrange(2, 4), random.randrange(5, 7),
-                            durations = 0.5, intervals = 0.0625, second_half = True))
-      
-        #Conditional to switch progressions when both chords are essentially the same
-        if c1.standardize().reset_octave(3) == c2.standardize().reset_octave(3):
-            switch_bool = not switch_bool
-    
-    #Generate audio playback in output without determined settings
-    play_music(mixed_track, False)
-  
-    #Create name for building Genre musical instance
-    mixed_name = f"{piece_1.name} + {piece_2.name}"
-    out_instance = Genre(mixed_name, key_chord, "major", piece_1.variation)
-    out_instance.chord_tracks = mixed_track
-    #Returns mixed musical Genre instance
-    return out_instance
+        key = None
+    return merge_pieces([piece_1, piece_2], key, switch_on_match, truncate = True)
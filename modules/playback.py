@@ -0,0 +1,368 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+try:
+    from . import events
+    from . import midi
+except ImportError:
+    import events
+    import midi
+
+#Columns of one scheduled MIDI message, due times are in seconds from the start
+MESSAGE_DTYPE = np.dtype([('time', np.float64), ('status', np.uint8),
+                          ('data_1', np.uint8), ('data_2', np.uint8)])
+
+#Time resolution of scheduled note messages, the same as written MIDI files
+TICKS_PER_BAR = 3840
+
+def schedule(tracks, bpm = 120):
+    """Converts tracks to one time-ordered array of MIDI messages.
+
+    Parameters
+    ----------
+    tracks : list
+      List of midi.MidiTrack
+    bpm : float, default=120
+      Tempo in beats per minute, four beats to a bar
+
+    Returns
+    ----------
+    messages : numpy.ndarray
+      MESSAGE_DTYPE array, program changes and channel volumes at time 0
+      followed by note-ons and note-offs (note-ons of velocity 0)
+    """
+    parts = []
+    for track in tracks:
+        header = [(0.0, 0xC0 | track.channel, track.instrument - 1, 0)]
+        if track.volume is not None:
+            header.append((0.0, 0xB0 | track.channel, 7, track.volume))
+        parts.append(np.array(header, dtype = MESSAGE_DTYPE))
+
+        if isinstance(track.events, events.PatternEvents):
+            track = midi.MidiTrack(track.events.expand(), track.instrument, track.channel,
+                                   track.volume, track.start_time)
+        ticks, status, pitch, velocity = midi._note_arrays(track, TICKS_PER_BAR)
+        notes = np.zeros(len(ticks), dtype = MESSAGE_DTYPE)
+        notes['time'] = ticks * (240 / bpm / TICKS_PER_BAR)
+        notes['status'] = status
+        notes['data_1'] = pitch
+        notes['data_2'] = velocity
+        parts.append(notes)
+
+    if not parts:
+        return np.zeros(0, dtype = MESSAGE_DTYPE)
+    messages = np.concatenate(parts)
+    return messages[np.argsort(messages['time'], kind = 'stable')]
+
+class RingBuffer():
+    """Bounded first in first out queue of MIDI messages in a NumPy array.
+
+    ...
+
+    Attributes
+    ----------
+    capacity : int
+      Number of messages the buffer holds
+
+    Methods
+    ----------
+    put(messages)
+      Appends messages, waiting while the buffer is full
+    get(count)
+      Removes up to count messages, waiting while the buffer is empty
+    close()
+      Marks the end of the messages and wakes up waiting threads
+    """
+    def __init__(self, capacity = 1024):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype = MESSAGE_DTYPE)
+        self.head = 0 #Messages removed so far
+        self.tail = 0 #Messages appended so far
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def put(self, messages):
+        """Appends messages, waiting while the buffer is full.
+
+        Returns
+        ----------
+        bool
+          False when the buffer was closed before every message fitted
+        """
+        written = 0
+        while written < len(messages):
+            with self.condition:
+                while self.tail - self.head == self.capacity and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return False
+                count = min(len(messages) - written, self.capacity - (self.tail - self.head))
+                positions = (self.tail + np.arange(count)) % self.capacity
+                self.data[positions] = messages[written:written + count]
+                self.tail += count
+                written += count
+                self.condition.notify_all()
+        return True
+
+    def get(self, count):
+        """Removes up to count messages, waiting while the buffer is empty.
+
+        Returns
+        ----------
+        numpy.ndarray
+          MESSAGE_DTYPE array, empty once the buffer is closed and drained
+        """
+        with self.condition:
+            while self.tail == self.head and not self.closed:
+                self.condition.wait()
+            count = min(count, self.tail - self.head)
+            messages = self.data[(self.head + np.arange(count)) % self.capacity]
+            self.head += count
+            self.condition.notify_all()
+            return messages
+
+    def close(self):
+        """Marks the end of the messages and wakes up waiting threads."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class MidoSink():
+    """Sink sending messages to a MIDI output port through mido.
+
+    ...
+
+    Attributes
+    ----------
+    port : mido port
+      Open output port
+
+    Methods
+    ----------
+    send(message)
+      Sends the bytes of one MIDI message
+    close()
+      Closes the port
+    """
+    def __init__(self, name = None, virtual = False):
+        try:
+            import mido
+        except ImportError:
+            #musicpy installs mido under this name
+            import mido_fix as mido
+        self.mido = mido
+        self.port = mido.open_output(name, virtual = virtual)
+
+    def send(self, message):
+        """Sends the bytes of one MIDI message."""
+        self.port.send(self.mido.Message.from_bytes(message))
+
+    def close(self):
+        """Closes the port."""
+        self.port.close()
+
+class SocketSink():
+    """Sink sending every MIDI message as one datagram to a local synthesizer.
+
+    ...
+
+    Attributes
+    ----------
+    address : tuple
+      Host and port of the synthesizer
+
+    Methods
+    ----------
+    send(message)
+      Sends the bytes of one MIDI message
+    close()
+      Closes the socket
+    """
+    def __init__(self, host = '127.0.0.1', port = 5004):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, message):
+        """Sends the bytes of one MIDI message."""
+        self.socket.sendto(message, self.address)
+
+    def close(self):
+        """Closes the socket."""
+        self.socket.close()
+
+class Scheduler():
+    """Real-time dispatcher of MIDI messages on a monotonic clock.
+
+    ...
+
+    Attributes
+    ----------
+    sink : object
+      Destination providing send(message) for the bytes of one MIDI message
+    lookahead : float
+      Seconds of messages moved into the ring buffer ahead of their due time
+    capacity : int
+      Number of messages the ring buffer holds
+    spin : float
+      Seconds before a due time after which the dispatcher busy-waits
+      instead of sleeping
+    late_after : float
+      Lateness in seconds from which a message counts as late
+    clock : function
+      Monotonic clock in seconds
+
+    Methods
+    ----------
+    play(messages)
+      Plays messages and blocks until the last one is sent
+    start(messages)
+      Plays messages on a background thread
+    wait()
+      Waits for background playback to end and returns its statistics
+    stop()
+      Stops playback and silences every channel
+    stats()
+      Returns jitter and late-message statistics of the last playback
+
+    Notes
+    ----------
+    A producer thread moves messages due within the lookahead window into the
+    ring buffer, and the dispatcher sleeps until shortly before each due time
+    and spins the rest of the way. Playback starts as soon as the first
+    window is buffered.
+    """
+    def __init__(self, sink, lookahead = 0.1, capacity = 1024, spin = 0.002,
+                 late_after = 0.005, clock = time.monotonic):
+        self.sink = sink
+        self.lookahead = lookahead
+        self.capacity = capacity
+        self.spin = spin
+        self.late_after = late_after
+        self.clock = clock
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lateness = np.zeros(0)
+        self._start_latency = None
+
+    def _produce(self, messages, ring, origin):
+        #Producer thread, keeping the ring buffer filled up to the lookahead window
+        cursor = 0
+        try:
+            while cursor < len(messages) and not self._stopped.is_set():
+                horizon = self.clock() - origin + self.lookahead
+                end = int(np.searchsorted(messages['time'], horizon, 'right'))
+                if end > cursor:
+                    if not ring.put(messages[cursor:end]):
+                        return
+                    cursor = end
+                if cursor < len(messages):
+                    self._stopped.wait(min(self.lookahead / 2,
+                                           max(messages['time'][cursor] - horizon, 0.0)))
+        finally:
+            ring.close()
+
+    def _dispatch(self, messages, called):
+        ring = RingBuffer(self.capacity)
+        lateness = np.zeros(len(messages))
+        origin = self.clock()
+        producer = threading.Thread(target = self._produce, args = (messages, ring, origin),
+                                    daemon = True)
+        producer.start()
+
+        #Dispatcher loop, waiting for every due time on the monotonic clock
+        sent = 0
+        try:
+            while not self._stopped.is_set():
+                batch = ring.get(64)
+                if len(batch) == 0:
+                    break
+                for message in batch:
+                    due = origin + message['time']
+                    remaining = due - self.clock()
+                    if remaining > self.spin:
+                        if self._stopped.wait(remaining - self.spin):
+                            break
+                    while self.clock() < due:
+                        pass
+                    self.sink.send(bytes([message['status'], message['data_1'],
+                                          message['data_2']]))
+                    now = self.clock()
+                    if sent == 0:
+                        self._start_latency = now - called
+                    lateness[sent] = now - due
+                    sent += 1
+        finally:
+            ring.close()
+            producer.join()
+            self._lateness = lateness[:sent]
+            if self._stopped.is_set():
+                self._silence(messages)
+
+    def _silence(self, messages):
+        #All notes off on every channel that was played
+        for channel in np.unique(messages['status'] & 0x0F):
+            self.sink.send(bytes([0xB0 | int(channel), 123, 0]))
+
+    def play(self, messages):
+        """Plays messages and blocks until the last one is sent.
+
+        Parameters
+        ----------
+        messages : numpy.ndarray
+          MESSAGE_DTYPE array sorted by time, see schedule()
+
+        Returns
+        ----------
+        stats : dict
+          See stats()
+        """
+        called = self.clock()
+        self._stopped.clear()
+        self._dispatch(messages, called)
+        return self.stats()
+
+    def start(self, messages):
+        """Plays messages on a background thread, see play()."""
+        called = self.clock()
+        self._stopped.clear()
+        self._thread = threading.Thread(target = self._dispatch, args = (messages, called),
+                                        daemon = True)
+        self._thread.start()
+
+    def wait(self):
+        """Waits for background playback to end and returns its statistics."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.stats()
+
+    def stop(self):
+        """Stops playback and silences every channel."""
+        self._stopped.set()
+        return self.wait()
+
+    def stats(self):
+        """Returns jitter and late-message statistics of the last playback.
+
+        Returns
+        ----------
+        stats : dict
+          Number of messages sent, seconds from the call to the first message,
+          mean, 99th percentile and maximum lateness in seconds and the
+          number of messages later than late_after
+        """
+        lateness = self._lateness
+        if len(lateness) == 0:
+            return {'messages': 0, 'start_latency': None, 'mean_jitter': 0.0,
+                    'p99_jitter': 0.0, 'max_jitter': 0.0, 'late': 0}
+        return {'messages': len(lateness), 'start_latency': self._start_latency,
+                'mean_jitter': float(lateness.mean()),
+                'p99_jitter': float(np.percentile(lateness, 99)),
+                'max_jitter': float(lateness.max()),
+                'late': int((lateness > self.late_after).sum())}
@@ -0,0 +1,388 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+class RenderError(Exception):
+    """Raised when a synthesizer fails to render a MIDI file."""
+
+class RenderResult():
+    """Represents the artifacts produced by one render job.
+
+    ...
+
+    Attributes
+    ----------
+    midi_path : str
+      Path of the MIDI file that was rendered
+    audio_path : str or None
+      Path of the waveform audio file, None if no audio was rendered
+    elapsed : float
+      Wall time of the render in seconds
+    log : str
+      Output captured from the synthesizer
+    pcm : numpy.ndarray or None
+      Rendered 16-bit frames held in memory, one column per audio channel
+    sample_rate : int or None
+      Sample rate of pcm
+
+    Methods
+    ----------
+    samples()
+      Returns the rendered frames without reading the audio file into memory
+    """
+    def __init__(self, midi_path, audio_path, elapsed = 0.0, log = '', pcm = None,
+                 sample_rate = None):
+        self.midi_path = midi_path
+        self.audio_path = audio_path
+        self.elapsed = elapsed
+        self.log = log
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+
+    def samples(self):
+        """Returns the rendered frames without reading the audio file into memory.
+
+        Returns
+        ----------
+        sample_rate : int
+          Sample rate of the frames
+        frames : numpy.ndarray
+          int16 frames, one column per audio channel, either the in-memory
+          buffer or a read-only memory map of the waveform audio file
+        """
+        if self.pcm is not None:
+            return self.sample_rate, self.pcm
+        if self.audio_path is None:
+            raise RenderError('No audio was rendered')
+        return map_audio(self.audio_path)
+
+    def __repr__(self):
+        return (f'RenderResult(midi_path={self.midi_path!r}, ' +
+                f'audio_path={self.audio_path!r}, elapsed={self.elapsed:.3f})')
+
+def map_audio(path):
+    """Memory-maps the frames of a 16-bit waveform audio file.
+
+    Parameters
+    ----------
+    path : str
+      Path of the waveform audio file
+
+    Returns
+    ----------
+    sample_rate : int
+      Sample rate of the file
+    frames : numpy.ndarray
+      Read-only int16 memory map of the frames, one column per audio channel,
+      so that slices are read from disk on access
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as audio_file:
+        if audio_file.read(12)[8:] != b'WAVE':
+            raise RenderError(f'{path} is not a waveform audio file')
+        #Loop over RIFF chunks up to the frames, reading the format on the way
+        offset = 12
+        channels = None
+        while True:
+            audio_file.seek(offset)
+            header = audio_file.read(8)
+            if len(header) < 8:
+                raise RenderError(f'{path} holds no audio frames')
+            length = int.from_bytes(header[4:], 'little')
+            if header[:4] == b'fmt ':
+                fmt = audio_file.read(16)
+                channels = int.from_bytes(fmt[2:4], 'little')
+                sample_rate = int.from_bytes(fmt[4:8], 'little')
+                if int.from_bytes(fmt[14:16], 'little') != 16:
+                    raise RenderError(f'{path} does not hold 16-bit audio')
+            elif header[:4] == b'data':
+                break
+            offset += 8 + length + (length & 1)
+    if channels is None:
+        raise RenderError(f'{path} has no format chunk')
+
+    #Streaming writers may leave the data length unset, so it is bound by the file size
+    count = min(length, size - offset - 8) // (2 * channels)
+    if count == 0:
+        return sample_rate, np.zeros((0, channels), dtype = np.int16)
+    return sample_rate, np.memmap(path, dtype = '<i2', mode = 'r', offset = offset + 8,
+                                  shape = (count, channels))
+
+#Folder of the renders of this process made without a name, removed at exit
+_output_folder = None
+
+def output_folder():
+    """Returns the temporary folder holding the renders made without a name.
+
+    Notes
+    ----------
+    The folder is created on first use and removed with everything in it
+    when the process exits. Files that must outlive the process are
+    rendered with a name, or copied out of the folder.
+    """
+    global _output_folder
+    if _output_folder is None:
+        _output_folder = tempfile.TemporaryDirectory(prefix = 'music_sequencer_')
+    return _output_folder.name
+
+@contextmanager
+def output_paths(name = None, scratch = False):
+    """Provides the MIDI and waveform audio paths of one render job.
+
+    Parameters
+    ----------
+    name : str, optional
+      File name without extension, by default both files go to a new
+      subfolder of output_folder() so that concurrent renders never collide
+    scratch : bool, default=False
+      Whether the files are only needed inside the with block, such as when
+      the render cache keeps a copy, so that the subfolder is removed on exit
+      of the block
+
+    Returns
+    ----------
+    context manager
+      Yielding (midi_path, audio_path)
+    """
+    if name is not None:
+        yield f'{name}.mid', f'{name}.wav'
+    elif scratch == True:
+        with tempfile.TemporaryDirectory(dir = output_folder()) as folder:
+            yield os.path.join(folder, 'output.mid'), os.path.join(folder, 'output.wav')
+    else:
+        folder = tempfile.mkdtemp(dir = output_folder())
+        yield os.path.join(folder, 'output.mid'), os.path.join(folder, 'output.wav')
+
+#Environment variable naming the default SoundFont
+SOUNDFONT_VARIABLE = 'MUSIC_SEQUENCER_SOUNDFONT'
+
+#General MIDI SoundFonts installed by common fluidsynth packages, tried in order
+SOUNDFONT_PATHS = ['/usr/share/sounds/sf2/FluidR3_GM.sf2',
+                   '/usr/share/sounds/sf2/default-GM.sf2',
+                   '/usr/share/soundfonts/default.sf2',
+                   '/usr/share/soundfonts/FluidR3_GM.sf2',
+                   '/usr/local/share/soundfonts/default.sf2',
+                   '/opt/homebrew/share/soundfonts/default.sf2']
+
+def find_soundfont():
+    """Returns the path of the default SoundFont.
+
+    Returns
+    ----------
+    str or None
+      Path named by the MUSIC_SEQUENCER_SOUNDFONT environment variable, or
+      the first of SOUNDFONT_PATHS that exists, None when there is none
+    """
+    path = os.environ.get(SOUNDFONT_VARIABLE)
+    if path:
+        return path
+    for path in SOUNDFONT_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+class FluidSynthRenderer():
+    """Renders MIDI files through the fluidsynth command line as a managed subprocess.
+
+    ...
+
+    Attributes
+    ----------
+    soundfont : str or None
+      Path of the SoundFont to load, None for the fluidsynth default
+    binary : str
+      Name or path of the fluidsynth executable
+    sample_rate : int
+      Sample rate of the rendered audio
+    timeout : float or None
+      Seconds to wait for a render before killing the process
+
+    Methods
+    ----------
+    available()
+      Checks whether the fluidsynth executable can be found
+    cache_identity()
+      Returns the settings that change the rendered audio
+    render(midi_path, audio_path)
+      Renders a MIDI file to a waveform audio file
+    stream(midi_data)
+      Renders MIDI data to raw frames read as fluidsynth writes them
+    """
+    def __init__(self, soundfont = None, binary = 'fluidsynth', sample_rate = 44100,
+                 timeout = None):
+        self.soundfont = soundfont
+        self.binary = binary
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+
+    def available(self):
+        """Checks whether the fluidsynth executable can be found.
+
+        Returns
+        ----------
+        bool
+          Whether rendering is possible on this machine
+        """
+        return shutil.which(self.binary) is not None
+
+    def cache_identity(self):
+        """Returns the settings that change the rendered audio, for render cache keys."""
+        return ('fluidsynth', self.soundfont, self.sample_rate)
+
+    def command(self, midi_path, audio_path):
+        """Builds the fluidsynth command line for one render job.
+
+        Returns
+        ----------
+        list
+          Arguments for subprocess
+        """
+        #No MIDI input and no shell, so the process exits once the file is written
+        args = [self.binary, '-ni', '-q', '-r', str(self.sample_rate), '-F', audio_path]
+        if self.soundfont is not None:
+            args.append(self.soundfont)
+        args.append(midi_path)
+        return args
+
+    def render(self, midi_path, audio_path):
+        """Renders a MIDI file to a waveform audio file.
+
+        Parameters
+        ----------
+        midi_path : str
+          Path of the MIDI file to render
+        audio_path : str
+          Path to write the waveform audio file to
+
+        Returns
+        ----------
+        RenderResult
+          Paths of the rendered artifacts and render statistics
+
+        Notes
+        ----------
+        Returns as soon as the fluidsynth process exits
+        """
+        start = perf_counter()
+        try:
+            process = subprocess.run(self.command(midi_path, audio_path),
+                                     capture_output = True, text = True,
+                                     timeout = self.timeout)
+        except FileNotFoundError:
+            raise RenderError(f'{self.binary} executable not found')
+        except subprocess.TimeoutExpired:
+            raise RenderError(f'{self.binary} did not finish within {self.timeout} seconds')
+
+        log = process.stdout + process.stderr
+        if process.returncode != 0 or not os.path.exists(audio_path):
+            raise RenderError(f'{self.binary} exited with code {process.returncode}: {log}')
+
+        return RenderResult(midi_path, audio_path, perf_counter() - start, log)
+
+    def stream(self, midi_data, chunk_frames = 8192):
+        """Renders MIDI data to raw frames read as fluidsynth writes them.
+
+        Parameters
+        ----------
+        midi_data : bytes
+          Contents of the MIDI file
+        chunk_frames : int, default=8192
+          Largest number of frames per chunk
+
+        Returns
+        ----------
+        iterator
+          (channels, sample_width, sample_rate) followed by bytes of
+          interleaved little-endian 16-bit frames, like SynthPool.stream()
+
+        Notes
+        ----------
+        fluidsynth writes raw audio to its standard output, so chunks arrive
+        while synthesis goes on rather than once the whole file is written.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            midi_path = os.path.join(folder, 'stream.mid')
+            with open(midi_path, 'wb') as midi_file:
+                midi_file.write(midi_data)
+            #Messages go to a file, so a full stderr pipe can never stall synthesis
+            with open(os.path.join(folder, 'stream.log'), 'w+b') as log_file:
+                command = self.command(midi_path, '-')
+                command[1:1] = ['-T', 'raw', '-O', 's16', '-E', 'little']
+                try:
+                    process = subprocess.Popen(command, stdout = subprocess.PIPE,
+                                               stderr = log_file)
+                except FileNotFoundError:
+                    raise RenderError(f'{self.binary} executable not found')
+                try:
+                    yield 2, 2, self.sample_rate
+                    #Hand on whatever arrived, holding back bytes of an incomplete frame
+                    partial = b''
+                    while True:
+                        data = process.stdout.read1(chunk_frames * 4)
+                        if not data:
+                            break
+                        data = partial + data
+                        complete = len(data) - len(data) % 4
+                        partial = data[complete:]
+                        if complete:
+                            yield data[:complete]
+                    try:
+                        returncode = process.wait(timeout = self.timeout)
+                    except subprocess.TimeoutExpired:
+                        raise RenderError(f'{self.binary} did not finish within ' +
+                                          f'{self.timeout} seconds')
+                    if returncode != 0:
+                        log_file.seek(0)
+                        log = log_file.read().decode(errors = 'replace')
+                        raise RenderError(f'{self.binary} exited with code {returncode}: {log}')
+                finally:
+                    #Stop fluidsynth when the consumer gives up early
+                    if process.poll() is None:
+                        process.kill()
+                        process.wait()
+                    process.stdout.close()
+
+def default_renderer():
+    """Returns fluidsynth when it is installed, the built-in NumPy synthesizer otherwise."""
+    renderer = FluidSynthRenderer()
+    if renderer.available():
+        return renderer
+    try:
+        from . import synth
+    except ImportError:
+        import synth
+    return synth.NumpySynth()
+
+#Renderer used by the sequencer, chosen on first use and swappable through set_renderer()
+_renderer = None
+
+def get_renderer():
+    """Returns the renderer used by the sequencer."""
+    global _renderer
+    if _renderer is None:
+        _renderer = default_renderer()
+    return _renderer
+
+def set_renderer(renderer):
+    """Swaps the renderer used by the sequencer.
+
+    Parameters
+    ----------
+    renderer : object or None
+      Object providing available() and render(midi_path, audio_path), None
+      for default_renderer()
+
+    Returns
+    ----------
+    previous : object or None
+      Renderer that was replaced, None when none was chosen yet
+    """
+    global _renderer
+    previous = _renderer
+    _renderer = renderer
+    return previous
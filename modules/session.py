@@ -0,0 +1,257 @@
+import json
+import os
+import tempfile
+from collections.abc import MutableMapping
+
+import numpy as np
+
+try:
+    from . import events
+    from . import music_sequencer as ms
+except ImportError:
+    import events
+    import music_sequencer as ms
+
+#Identifies session files and their layout version
+MAGIC = b'MSQS'
+VERSION = 1
+
+#Fixed header at the start of a session file, pointing at the index and names
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('count', '<u8'),
+                         ('index_offset', '<u8'), ('names_offset', '<u8')])
+
+#Index entry of one piece, offsets and lengths in bytes from the start of the file
+INDEX_DTYPE = np.dtype([('name_offset', '<u8'), ('name_length', '<u8'),
+                        ('meta_offset', '<u8'), ('meta_length', '<u8')])
+
+#Arrays of note events and their types on disk
+ARRAY_DTYPES = {'notes': events.NOTE_DTYPE, 'bounds': np.dtype('<i8'), 'ends': np.dtype('<f8')}
+
+#Arrays start at multiples of this many bytes
+ALIGNMENT = 16
+
+def _stored_events(note_events, chords):
+    #Compact events of a piece, converting musicpy chords when it holds none
+    if note_events is not None:
+        return note_events
+    if chords:
+        return events.NoteEvents.from_chords(chords)
+    return None
+
+def _write_events(out, note_events):
+    """Writes the arrays of note events and returns their description."""
+    if note_events is None:
+        return None
+    description = {'times': None}
+    if isinstance(note_events, events.PatternEvents):
+        description['times'] = note_events.times
+        note_events = note_events.pattern
+    for name, dtype in ARRAY_DTYPES.items():
+        array = np.ascontiguousarray(getattr(note_events, name), dtype = dtype)
+        out.write(b'\x00' * (-out.tell() % ALIGNMENT))
+        description[name] = [out.tell(), len(array)]
+        out.write(array.tobytes())
+    return description
+
+def _state_to_json(state):
+    return list(state) if isinstance(state, tuple) else state
+
+def _state_from_json(state):
+    return tuple(state) if isinstance(state, list) else state
+
+def save_session(path, pieces):
+    """Writes pieces to one session file.
+
+    Parameters
+    ----------
+    path : str
+      Path of the session file, replaced atomically
+    pieces : dict
+      Genre instances by name, such as the list_pieces of interface.user_interface()
+
+    Notes
+    ----------
+    Every piece keeps its parameters, seed, options and progressions, and its
+    raw chords and arpeggios as packed note event arrays. Patterns are stored
+    once with their repeat count. Renders are not stored.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir = folder, suffix = '.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            out.write(b'\x00' * HEADER_DTYPE.itemsize)
+            entries = []
+            names = []
+
+            #Loop to write the arrays and parameters of every piece
+            for name, music_piece in pieces.items():
+                meta = {'genre': type(music_piece).__name__, 'name': music_piece.name,
+                        'key_chord': music_piece.key_chord,
+                        'add_to_chord': music_piece.add_to_chord,
+                        'variation': music_piece.variation, 'seed': music_piece.seed,
+                        'sequence_options': music_piece.sequence_options,
+                        'progression_bounds': None, 'progression_states': None}
+                if music_piece.progression_bounds is not None:
+                    meta['progression_bounds'] = [int(b) for b in music_piece.progression_bounds]
+                    meta['progression_states'] = [_state_to_json(state) for state
+                                                  in music_piece.progression_states]
+                meta['raw'] = _write_events(out, _stored_events(music_piece.raw_events,
+                                                                music_piece._raw_chords))
+                meta['track'] = _write_events(out, _stored_events(music_piece.track_events,
+                                                                  music_piece._chord_tracks))
+                data = json.dumps(meta).encode()
+                entries.append((0, 0, out.tell(), len(data)))
+                out.write(data)
+                names.append(str(name).encode())
+
+            #Names and the index follow the pieces, so that writing is a single pass
+            names_offset = out.tell()
+            index = np.zeros(len(entries), dtype = INDEX_DTYPE)
+            for i, (entry, name) in enumerate(zip(entries, names)):
+                index[i] = (out.tell(), len(name), entry[2], entry[3])
+                out.write(name)
+            out.write(b'\x00' * (-out.tell() % ALIGNMENT))
+            index_offset = out.tell()
+            out.write(index.tobytes())
+
+            header = np.array([(MAGIC, VERSION, len(entries), index_offset, names_offset)],
+                              dtype = HEADER_DTYPE)
+            out.seek(0)
+            out.write(header.tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class Session(MutableMapping):
+    """Dictionary of pieces backed by a memory-mapped session file.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+      Path of the session file
+
+    Methods
+    ----------
+    save(path = None)
+      Writes every piece, including added and changed ones, to a session file
+
+    Notes
+    ----------
+    Opening reads only the header, the index and the names. A piece is
+    decoded when it is first accessed, its note events being views of the
+    memory-mapped file that are copied only when written to.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._pieces = {}
+        self._order = []
+        self._offsets = {}
+        if os.path.getsize(path) < HEADER_DTYPE.itemsize:
+            raise ValueError(f'{path} is not a session file')
+        self._data = np.memmap(path, dtype = np.uint8, mode = 'c')
+        header = self._data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} session file')
+        start = int(header['index_offset'])
+        index = self._data[start:start + int(header['count']) * INDEX_DTYPE.itemsize]
+        for entry in index.view(INDEX_DTYPE):
+            offset = int(entry['name_offset'])
+            name = bytes(self._data[offset:offset + int(entry['name_length'])]).decode()
+            self._order.append(name)
+            self._offsets[name] = (int(entry['meta_offset']), int(entry['meta_length']))
+
+    def _read_events(self, description):
+        if description is None:
+            return None
+        arrays = {name: np.frombuffer(self._data, dtype = dtype, count = description[name][1],
+                                      offset = description[name][0])
+                  for name, dtype in ARRAY_DTYPES.items()}
+        note_events = events.NoteEvents(arrays['notes'], arrays['bounds'], arrays['ends'])
+        if description['times'] is not None:
+            return events.PatternEvents(note_events, description['times'])
+        return note_events
+
+    def _decode(self, name):
+        offset, length = self._offsets[name]
+        meta = json.loads(bytes(self._data[offset:offset + length]))
+        genre = getattr(ms, meta['genre'], None)
+        if not (isinstance(genre, type) and issubclass(genre, ms.Genre)):
+            #Genres registered as data are looked up in the registry
+            try:
+                genre = ms.genre_class(meta['genre'])
+            except ValueError:
+                raise ValueError(f'Unknown genre {meta["genre"]!r} in {self.path}') from None
+        music_piece = genre(meta['name'], meta['key_chord'], meta['add_to_chord'],
+                            meta['variation'], meta['seed'])
+        music_piece.sequence_options = meta['sequence_options']
+
+        #Pieces come back in compact form, chords are built on first access
+        raw_events = self._read_events(meta['raw'])
+        track_events = self._read_events(meta['track'])
+        if raw_events is not None:
+            music_piece.raw_events = raw_events
+            music_piece._raw_chords = None
+        if track_events is not None:
+            music_piece.track_events = track_events
+            music_piece._chord_tracks = None
+        if meta['progression_bounds'] is not None:
+            music_piece.progression_bounds = np.array(meta['progression_bounds'], dtype = np.int64)
+            music_piece.progression_states = [_state_from_json(state) for state
+                                              in meta['progression_states']]
+        return music_piece
+
+    def __getitem__(self, name):
+        if name not in self._pieces:
+            if name not in self._offsets:
+                raise KeyError(name)
+            self._pieces[name] = self._decode(name)
+        return self._pieces[name]
+
+    def __setitem__(self, name, music_piece):
+        if name not in self._offsets and name not in self._pieces:
+            self._order.append(name)
+        self._pieces[name] = music_piece
+
+    def __delitem__(self, name):
+        if name not in self._offsets and name not in self._pieces:
+            raise KeyError(name)
+        self._offsets.pop(name, None)
+        self._pieces.pop(name, None)
+        self._order.remove(name)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._offsets or name in self._pieces
+
+    def save(self, path = None):
+        """Writes every piece, including added and changed ones, to a session file.
+
+        Parameters
+        ----------
+        path : str, optional
+          Path of the session file, the file the session was opened from by default
+        """
+        save_session(path or self.path, self)
+
+def load_session(path):
+    """Opens a session file as a dictionary of pieces decoded on access.
+
+    Parameters
+    ----------
+    path : str
+      Path of a file written by save_session()
+
+    Returns
+    ----------
+    Session
+      Pieces by name, usable as the list_pieces of interface.user_interface()
+    """
+    return Session(path)
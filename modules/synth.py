@@ -0,0 +1,261 @@
+import wave
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from . import midi
+    from . import render
+except ImportError:
+    import midi
+    import render
+
+#Samples in one cycle of every wavetable, a power of two for masking
+TABLE_SIZE = 2048
+
+#Harmonic amplitudes and (attack, decay, sustain, release) of the sixteen
+#General MIDI instrument families, programs 1-8 being family 0
+FAMILIES = [
+    ((1, .5, .3, .2, .1, .05), (.005, .6, .3, .3)),           #Piano
+    ((1, 0, .4, 0, .2), (.002, .4, .1, .4)),                  #Chromatic percussion
+    ((1, .8, .6, 0, .4, 0, 0, .3), (.01, .05, .9, .08)),      #Organ
+    ((1, .6, .4, .25, .15, .1), (.003, .5, .2, .25)),         #Guitar
+    ((1, .4, .15), (.005, .3, .5, .15)),                      #Bass
+    ((1, 1/2, 1/3, 1/4, 1/5, 1/6, 1/7, 1/8), (.08, .2, .8, .3)),  #Strings
+    ((1, .5, .33, .25), (.1, .2, .8, .4)),                    #Ensemble
+    ((1, .8, .6, .5, .4, .3), (.04, .1, .8, .15)),            #Brass
+    ((1, 0, 1/3, 0, 1/5, 0, 1/7), (.03, .1, .8, .1)),         #Reed
+    ((1, .1, .05), (.05, .1, .8, .15)),                       #Pipe
+    (tuple(1 / k for k in range(1, 11)), (.01, .1, .8, .1)),  #Synth lead
+    ((1, .3, .1), (.3, .3, .7, .8)),                          #Synth pad
+    ((1, .5, 0, .3), (.1, .3, .6, .6)),                       #Synth effects
+    ((1, .7, .2, .3), (.005, .4, .3, .3)),                    #Ethnic
+    ((1, .3, .6, .2), (.001, .2, 0, .1)),                     #Percussive
+    ((1, .9, .8, .7), (.05, .2, .5, .3)),                     #Sound effects
+]
+
+#Family used for notes on the General MIDI drum channel
+DRUM_CHANNEL = midi.DRUM_CHANNEL
+DRUM_FAMILY = 14
+
+def _wavetables():
+    """Builds one normalized cycle of every family from its harmonics."""
+    phase = np.arange(TABLE_SIZE) / TABLE_SIZE
+    tables = np.zeros((len(FAMILIES), TABLE_SIZE))
+    for family, (harmonics, envelope) in enumerate(FAMILIES):
+        for k, amplitude in enumerate(harmonics, 1):
+            tables[family] += amplitude * np.sin(2 * np.pi * k * phase)
+        tables[family] /= np.abs(tables[family]).max()
+    return tables
+
+class NumpySynth():
+    """Vectorized wavetable synthesizer for machines without fluidsynth.
+
+    ...
+
+    Attributes
+    ----------
+    sample_rate : int
+      Sample rate of the rendered audio
+    chunk_frames : int
+      Number of audio frames computed at once, bounding memory use
+    gain : float
+      Amplitude of a note at full velocity and volume, leaving headroom for chords
+    soundfont : None
+      Always None, kept for render keys shared with FluidSynthRenderer
+
+    Methods
+    ----------
+    available()
+      Always True, the synthesizer needs nothing outside NumPy
+    cache_identity()
+      Returns the settings that change the rendered audio
+    stream(tracks, bpm)
+      Renders note events to 16-bit stereo chunks
+    synthesize(tracks, bpm)
+      Renders note events to one 16-bit stereo buffer
+    render_pcm(midi_data)
+      Renders the contents of a MIDI file straight to one 16-bit stereo buffer
+    render(midi_path, audio_path)
+      Renders a MIDI file to a waveform audio file
+
+    Notes
+    ----------
+    Every General MIDI family has one additive timbre and a linear ADSR
+    envelope. Samples only depend on their frame, so the audio is the same
+    whatever chunk_frames is.
+    """
+    soundfont = None
+
+    def __init__(self, sample_rate = 44100, chunk_frames = 8192, gain = 0.2):
+        self.sample_rate = sample_rate
+        self.chunk_frames = chunk_frames
+        self.gain = gain
+        self.tables = _wavetables()
+        self.envelopes = np.array([envelope for harmonics, envelope in FAMILIES])
+
+    def available(self):
+        """Returns True, the synthesizer needs nothing outside NumPy."""
+        return True
+
+    def cache_identity(self):
+        """Returns the settings that change the rendered audio, for render cache keys."""
+        return ('numpy', self.sample_rate, self.gain, FAMILIES)
+
+    def note_table(self, tracks, bpm = 120):
+        """Converts the note events of tracks to frames, frequencies and gains.
+
+        Parameters
+        ----------
+        tracks : list
+          List of midi.MidiTrack
+        bpm : float, default=120
+          Tempo in beats per minute, four beats to a bar
+
+        Returns
+        ----------
+        dict
+          Arrays start, length, end (frames), frequency, gain and family of
+          every note, sorted by start frame
+        """
+        frames_per_bar = 240 / bpm * self.sample_rate
+        columns = {name: [] for name in ('start', 'length', 'frequency', 'gain', 'family')}
+        for track in tracks:
+            note_events = track.events
+            if hasattr(note_events, 'expand'):
+                note_events = note_events.expand()
+            notes = note_events.notes
+            channels = np.where(notes['channel'] < 0, track.channel, notes['channel'])
+            volume = 100 if track.volume is None else track.volume
+            family = np.full(len(notes), ((track.instrument - 1) % 128) // 8)
+            family[channels == DRUM_CHANNEL] = DRUM_FAMILY
+
+            columns['start'].append(np.rint((notes['start'].astype(np.float64) + track.start_time)
+                                            * frames_per_bar).astype(np.int64))
+            columns['length'].append(np.rint(notes['duration'].astype(np.float64)
+                                             * frames_per_bar).astype(np.int64))
+            columns['frequency'].append(440.0 * 2.0 ** ((notes['pitch'] - 69.0) / 12))
+            columns['gain'].append(notes['velocity'] / 127 * (volume / 127) * self.gain)
+            columns['family'].append(family)
+
+        table = {name: np.concatenate(values) if values else np.zeros(0)
+                 for name, values in columns.items()}
+        table['family'] = table['family'].astype(np.int64)
+        order = np.argsort(table['start'], kind = 'stable')
+        table = {name: values[order] for name, values in table.items()}
+        release = np.ceil(self.envelopes[table['family'], 3] * self.sample_rate).astype(np.int64)
+        table['end'] = table['start'].astype(np.int64) + table['length'] + release
+        return table
+
+    def stream(self, tracks, bpm = 120):
+        """Renders note events to 16-bit stereo chunks.
+
+        Parameters
+        ----------
+        tracks : list
+          List of midi.MidiTrack
+        bpm : float, default=120
+          Tempo in beats per minute
+
+        Yields
+        ----------
+        numpy.ndarray
+          int16 array of up to chunk_frames frames by two channels, ending
+          once the release of the last note has faded
+        """
+        table = self.note_table(tracks, bpm)
+        starts = table['start']
+        ends = table['end']
+        if len(starts) == 0:
+            return
+        total = int(ends.max())
+        longest = int((ends - starts).max())
+
+        for begin in range(0, total, self.chunk_frames):
+            stop = min(begin + self.chunk_frames, total)
+
+            #Notes sounding in the chunk, no note starts more than longest before its end
+            low = np.searchsorted(starts, begin - longest, 'right')
+            high = np.searchsorted(starts, stop, 'left')
+            active = low + np.flatnonzero(ends[low:high] > begin)
+            first = np.maximum(starts[active], begin)
+            counts = np.minimum(ends[active], stop) - first
+
+            #One entry per note and frame, frames of a note being consecutive
+            note = np.repeat(np.arange(len(active)), counts)
+            frame = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            offset = frame - starts[active][note]
+            attack, decay, sustain, release = self.envelopes[table['family'][active]].T
+
+            #Stages up to the note off, frozen during a linear release
+            t = np.minimum(offset, table['length'][active][note]) / self.sample_rate
+            level = np.minimum(t / attack[note], 1.0)
+            t -= attack[note]
+            t /= decay[note]
+            np.clip(t, 0.0, 1.0, out = t)
+            t *= (1.0 - sustain)[note]
+            level *= 1.0 - t
+            t = (offset - table['length'][active][note]) / (release * self.sample_rate)[note]
+            np.clip(1.0 - t, 0.0, 1.0, out = t)
+            level *= t
+            level *= table['gain'][active][note]
+
+            step = table['frequency'][active] * (TABLE_SIZE / self.sample_rate)
+            phase = (offset * step[note]).astype(np.int64) & (TABLE_SIZE - 1)
+            phase += (table['family'][active] * TABLE_SIZE)[note]
+            values = self.tables.ravel()[phase] * level
+
+            samples = np.bincount(frame - begin, weights = values, minlength = stop - begin)
+            samples = np.clip(np.rint(samples * 32767), -32768, 32767).astype(np.int16)
+            yield np.repeat(samples[:, None], 2, axis = 1)
+
+    def synthesize(self, tracks, bpm = 120):
+        """Renders note events to one 16-bit stereo buffer.
+
+        Returns
+        ----------
+        numpy.ndarray
+          int16 array of frames by two channels
+        """
+        chunks = list(self.stream(tracks, bpm))
+        if not chunks:
+            return np.zeros((0, 2), dtype = np.int16)
+        return np.concatenate(chunks)
+
+    def render_pcm(self, midi_data):
+        """Renders the contents of a MIDI file straight to one 16-bit stereo buffer.
+
+        Returns
+        ----------
+        numpy.ndarray
+          int16 array of frames by two channels
+        """
+        return self.synthesize(*midi.decode_midi(midi_data))
+
+    def render(self, midi_path, audio_path):
+        """Renders a MIDI file to a waveform audio file.
+
+        Parameters
+        ----------
+        midi_path : str
+          Path of the MIDI file to render
+        audio_path : str
+          Path to write the waveform audio file to
+
+        Returns
+        ----------
+        render.RenderResult
+          Paths of the rendered artifacts and render statistics
+        """
+        start = perf_counter()
+        with open(midi_path, 'rb') as midi_file:
+            tracks, bpm = midi.decode_midi(midi_file.read())
+
+        with wave.open(audio_path, 'wb') as audio:
+            audio.setnchannels(2)
+            audio.setsampwidth(2)
+            audio.setframerate(self.sample_rate)
+            for chunk in self.stream(tracks, bpm):
+                audio.writeframes(chunk.tobytes())
+
+        return render.RenderResult(midi_path, audio_path, perf_counter() - start)
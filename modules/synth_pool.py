@@ -0,0 +1,448 @@
+import io
+import os
+import queue
+import tempfile
+import threading
+import wave
+import multiprocessing
+from time import perf_counter
+
+try:
+    from . import render
+except ImportError:
+    import render
+
+class FluidSynthEngine():
+    """Synthesizer engine that keeps a SoundFont loaded between render jobs.
+
+    ...
+
+    Attributes
+    ----------
+    soundfont : str or None
+      Path of the SoundFont to load, render.find_soundfont() by default
+    sample_rate : int
+      Sample rate of the rendered audio
+    chunk_frames : int
+      Number of audio frames sent back per chunk
+    tail : float
+      Seconds of audio rendered after the last event for note release
+
+    Methods
+    ----------
+    load()
+      Loads the synthesizer and SoundFont once per worker
+    render(midi_bytes)
+      Renders a Standard MIDI File to audio chunks
+
+    Notes
+    ----------
+    Uses the pyfluidsynth bindings when installed, which need a SoundFont
+    file. Otherwise every job falls back to a fluidsynth subprocess, which
+    reloads the SoundFont per job.
+    """
+    def __init__(self, soundfont = None, sample_rate = 44100, chunk_frames = 4096, tail = 1.0):
+        if soundfont is None:
+            soundfont = render.find_soundfont()
+        self.soundfont = soundfont
+        self.sample_rate = sample_rate
+        self.chunk_frames = chunk_frames
+        self.tail = tail
+        self.synth = None
+
+    def load(self):
+        """Loads the synthesizer and SoundFont once per worker."""
+        try:
+            import fluidsynth
+        except ImportError:
+            fluidsynth = None
+
+        if fluidsynth is None:
+            self.fallback = render.FluidSynthRenderer(self.soundfont,
+                                                      sample_rate = self.sample_rate)
+            if not self.fallback.available():
+                raise render.RenderError('fluidsynth executable not found')
+            return
+
+        #The warm synthesizer needs a SoundFont file to keep loaded
+        if self.soundfont is None:
+            raise render.RenderError('No SoundFont found, pass soundfont or set ' +
+                                     render.SOUNDFONT_VARIABLE)
+        self.synth = fluidsynth.Synth(samplerate = float(self.sample_rate))
+        self.soundfont_id = self.synth.sfload(self.soundfont)
+        if self.soundfont_id == -1:
+            raise render.RenderError(f'Could not load SoundFont {self.soundfont}')
+        for channel in range(16):
+            self.synth.program_select(channel, self.soundfont_id, 0, 0)
+
+    def render(self, midi_bytes):
+        """Renders a Standard MIDI File to audio chunks.
+
+        Parameters
+        ----------
+        midi_bytes : bytes
+          Contents of the MIDI file
+
+        Returns
+        ----------
+        params : tuple
+          Number of channels, sample width in bytes and sample rate
+        chunks : iterator
+          Iterator over raw PCM byte chunks
+        """
+        if self.synth is None:
+            return self._render_subprocess(midi_bytes)
+        return (2, 2, self.sample_rate), self._render_warm(midi_bytes)
+
+    def _render_warm(self, midi_bytes):
+        try:
+            import mido
+        except ImportError:
+            #musicpy installs mido under this name
+            import mido_fix as mido
+        synth = self.synth
+
+        #Silence notes and reset controllers left over from the previous job
+        for channel in range(16):
+            synth.cc(channel, 123, 0)
+            synth.cc(channel, 121, 0)
+
+        pending = 0.0
+        for msg in mido.MidiFile(file = io.BytesIO(midi_bytes)):
+            pending += msg.time
+            frames = int(pending * self.sample_rate)
+            if frames > 0:
+                pending -= frames / self.sample_rate
+                yield from self._samples(frames)
+
+            if msg.type == 'note_on':
+                synth.noteon(msg.channel, msg.note, msg.velocity)
+            elif msg.type == 'note_off':
+                synth.noteoff(msg.channel, msg.note)
+            elif msg.type == 'program_change':
+                synth.program_select(msg.channel, self.soundfont_id, 0, msg.program)
+            elif msg.type == 'control_change':
+                synth.cc(msg.channel, msg.control, msg.value)
+
+        yield from self._samples(int(self.tail * self.sample_rate))
+
+    def _samples(self, frames):
+        import fluidsynth
+        while frames > 0:
+            count = min(frames, self.chunk_frames)
+            yield fluidsynth.raw_audio_string(self.synth.get_samples(count))
+            frames -= count
+
+    def _render_subprocess(self, midi_bytes):
+        with tempfile.TemporaryDirectory() as folder:
+            midi_path = os.path.join(folder, 'job.mid')
+            audio_path = os.path.join(folder, 'job.wav')
+            with open(midi_path, 'wb') as midi_file:
+                midi_file.write(midi_bytes)
+            self.fallback.render(midi_path, audio_path)
+
+            with wave.open(audio_path, 'rb') as audio:
+                params = (audio.getnchannels(), audio.getsampwidth(), audio.getframerate())
+                chunks = []
+                data = audio.readframes(self.chunk_frames)
+                while data:
+                    chunks.append(data)
+                    data = audio.readframes(self.chunk_frames)
+        return params, iter(chunks)
+
+def _worker_main(conn, engine):
+    """Runs one synth worker until asked to stop."""
+    try:
+        engine.load()
+    except Exception as error:
+        conn.send(('error', str(error)))
+        return
+    conn.send(('ready', os.getpid()))
+
+    #Loop to serve render jobs and health checks from the pool
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg[0] == 'stop':
+            return
+        elif msg[0] == 'ping':
+            conn.send(('pong', os.getpid()))
+        elif msg[0] == 'render':
+            try:
+                params, chunks = engine.render(msg[1])
+                conn.send(('format', params))
+                for chunk in chunks:
+                    conn.send(('chunk', chunk))
+                conn.send(('done', None))
+            except Exception as error:
+                conn.send(('error', str(error)))
+
+class WorkerCrashed(render.RenderError):
+    """Raised when a synth worker exits or stops responding during a job."""
+
+class _Worker():
+    """Handle on one synth worker process and its pipe."""
+    def __init__(self, engine, start_timeout):
+        self.engine = engine
+        self.start_timeout = start_timeout
+        self.restarts = -1
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target = _worker_main,
+                                               args = (child_conn, self.engine), daemon = True)
+        self.process.start()
+        child_conn.close()
+        self.restarts += 1
+        kind, value = self.recv(self.start_timeout)
+        if kind != 'ready':
+            self.stop()
+            raise render.RenderError(f'Synth worker failed to start: {value}')
+        self.pid = value
+
+    def recv(self, timeout):
+        if not self.conn.poll(timeout):
+            raise WorkerCrashed(f'Synth worker did not answer within {timeout} seconds')
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            raise WorkerCrashed('Synth worker exited unexpectedly')
+
+    def send(self, msg):
+        try:
+            self.conn.send(msg)
+        except (BrokenPipeError, OSError):
+            raise WorkerCrashed('Synth worker exited unexpectedly')
+
+    def alive(self, timeout):
+        if not self.process.is_alive():
+            return False
+        try:
+            self.send(('ping',))
+            return self.recv(timeout)[0] == 'pong'
+        except WorkerCrashed:
+            return False
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+
+class SynthPool():
+    """Pool of long-lived synth workers that load the SoundFont only once.
+
+    ...
+
+    Attributes
+    ----------
+    size : int
+      Number of worker processes
+    engine : FluidSynthEngine
+      Engine copied into every worker
+    timeout : float
+      Seconds to wait for each message from a busy worker
+    retries : int
+      Number of times a job is retried on a restarted worker after a crash
+
+    Methods
+    ----------
+    available()
+      Checks whether the pool can start workers
+    cache_identity()
+      Returns the engine settings that change the rendered audio
+    stream(midi_bytes)
+      Renders MIDI bytes and yields audio chunks as they arrive
+    render(midi_path, audio_path)
+      Renders a MIDI file to a waveform audio file
+    health()
+      Pings every worker and restarts the ones that crashed
+    close()
+      Stops all workers
+
+    Notes
+    ----------
+    Install with render.set_renderer(SynthPool(...)) so that Genre.sequence(),
+    Genre.generate_symph() and mix_pieces() render through the pool.
+    """
+    def __init__(self, size = 2, soundfont = None, sample_rate = 44100, engine = None,
+                 timeout = 60, retries = 1):
+        self.size = size
+        if engine is None:
+            engine = FluidSynthEngine(soundfont, sample_rate)
+        self.engine = engine
+        self.timeout = timeout
+        self.retries = retries
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def cache_identity(self):
+        """Returns the engine settings that change the rendered audio, for render cache keys."""
+        return (type(self.engine).__name__, getattr(self.engine, 'soundfont', None),
+                getattr(self.engine, 'sample_rate', None), getattr(self.engine, 'tail', None))
+
+    def _start(self):
+        #Workers are started on first use so that constructing a pool is cheap
+        with self._lock:
+            while len(self._workers) < self.size:
+                worker = _Worker(self.engine, self.timeout)
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def available(self):
+        """Checks whether the pool can start workers.
+
+        Returns
+        ----------
+        bool
+          Whether at least one worker is running
+        """
+        try:
+            self._start()
+        except render.RenderError:
+            return False
+        return True
+
+    def stream(self, midi_bytes):
+        """Renders MIDI bytes and yields audio chunks as they arrive.
+
+        Parameters
+        ----------
+        midi_bytes : bytes
+          Contents of the MIDI file
+
+        Returns
+        ----------
+        iterator
+          Audio format tuple (channels, sample width, sample rate) followed by
+          raw PCM byte chunks
+        """
+        self._start()
+        worker = self._idle.get()
+        finished = False
+        try:
+            attempt = 0
+            while True:
+                sent = False
+                try:
+                    worker.send(('render', midi_bytes))
+                    kind, value = worker.recv(self.timeout)
+                    while kind != 'done':
+                        if kind == 'error':
+                            finished = True
+                            raise render.RenderError(value)
+                        sent = True
+                        yield value
+                        kind, value = worker.recv(self.timeout)
+                    finished = True
+                    return
+                except WorkerCrashed:
+                    #Retry on another worker only if nothing was streamed yet
+                    attempt += 1
+                    if sent or attempt > self.retries:
+                        raise
+                    self._release(worker, False)
+                    worker = None
+                    self._start()
+                    worker = self._idle.get()
+        finally:
+            #A crashed worker, or a job abandoned by the consumer leaving chunks
+            #in the pipe, is restarted before it serves another job
+            if worker is not None:
+                self._release(worker, finished)
+
+    def _release(self, worker, clean):
+        #Only place workers are restarted after a job, workers failing to
+        #restart leave the pool and are replaced by _start() on next use
+        if not clean:
+            try:
+                worker.restart()
+            except render.RenderError:
+                with self._lock:
+                    self._workers.remove(worker)
+                return
+        self._idle.put(worker)
+
+    def render(self, midi_path, audio_path):
+        """Renders a MIDI file to a waveform audio file.
+
+        Parameters
+        ----------
+        midi_path : str
+          Path of the MIDI file to render
+        audio_path : str
+          Path to write the waveform audio file to
+
+        Returns
+        ----------
+        render.RenderResult
+          Paths of the rendered artifacts and render statistics
+        """
+        start = perf_counter()
+        with open(midi_path, 'rb') as midi_file:
+            midi_bytes = midi_file.read()
+
+        chunks = self.stream(midi_bytes)
+        channels, sample_width, sample_rate = next(chunks)
+        with wave.open(audio_path, 'wb') as audio:
+            audio.setnchannels(channels)
+            audio.setsampwidth(sample_width)
+            audio.setframerate(sample_rate)
+            for chunk in chunks:
+                audio.writeframes(chunk)
+
+        return render.RenderResult(midi_path, audio_path, perf_counter() - start)
+
+    def health(self):
+        """Pings every worker and restarts the ones that crashed.
+
+        Returns
+        ----------
+        status : list
+          One dictionary per worker with its pid, liveness and restart count
+        """
+        self._start()
+        status = []
+        idle = []
+        #Only idle workers are checked, busy ones are answering a job
+        while not self._idle.empty():
+            idle.append(self._idle.get())
+        try:
+            for worker in idle:
+                alive = worker.alive(self.timeout)
+                if not alive:
+                    worker.restart()
+                status.append({'pid': worker.pid, 'alive': alive,
+                               'restarts': worker.restarts})
+        finally:
+            for worker in idle:
+                self._idle.put(worker)
+        return status
+
+    def close(self):
+        """Stops all workers."""
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+            self._idle = queue.Queue()
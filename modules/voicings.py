@@ -0,0 +1,82 @@
+from functools import lru_cache
+from musicpy import scale, get_chord, chord, note
+
+#Bound on distinct voicings kept, shared by all Genre instances
+CACHE_SIZE = 4096
+
+@lru_cache(maxsize = CACHE_SIZE)
+def get_voicing(key_chord, mode, degree, quality, alteration = None, inversion = 0,
+                transpose = 0, root_shift = 0):
+    """Builds the voicing of a scale degree once and caches it.
+
+    Parameters
+    ----------
+    key_chord : str
+      Note for key scale of piece
+    mode : str
+      Mode of the key scale, such as 'major' or 'minor'
+    degree : int
+      Degree of the key scale the chord is built on
+    quality : str
+      Chord type passed to musicpy get_chord()
+    alteration : str, optional
+      Chord alteration such as 'b9' or 'b5'
+    inversion : int, default=0
+      Number of the inversion, 0 for root position
+    transpose : int, default=0
+      Semitones the key scale is moved by, as in a key change
+    root_shift : int, default=0
+      Semitones the root note is moved by from the scale degree
+
+    Returns
+    ----------
+    template : tuple
+      Immutable tuple of (note name, octave) pairs
+    """
+    key_scale = scale(key_chord, mode)
+    if transpose > 0:
+        key_scale = key_scale.up(transpose)
+    elif transpose < 0:
+        key_scale = key_scale.down(-transpose)
+
+    root = key_scale.get_note_from_degree(degree)
+    if root_shift > 0:
+        root = root.up(root_shift)
+    elif root_shift < 0:
+        root = root.down(-root_shift)
+
+    chord_x = get_chord(root, quality)
+    if alteration is not None:
+        chord_x = chord_x(alteration)
+    if inversion > 0:
+        chord_x = chord_x.inv(inversion)
+    return tuple((n.name, n.num) for n in chord_x.notes)
+
+def voicing_chord(*args, **kwargs):
+    """Returns a new musicpy chord built from a cached voicing.
+
+    Parameters
+    ----------
+    *args, **kwargs
+      Arguments of get_voicing()
+
+    Returns
+    ----------
+    musicpy.structures.chord
+      Chord equal to building the voicing with get_chord()
+    """
+    return chord([note(name, num) for name, num in get_voicing(*args, **kwargs)])
+
+def voicing_cache_info():
+    """Returns hit and miss counters of the voicing cache.
+
+    Returns
+    ----------
+    functools._CacheInfo
+      Named tuple of hits, misses, maxsize and currsize
+    """
+    return get_voicing.cache_info()
+
+def clear_voicing_cache():
+    """Empties the voicing cache and resets its counters."""
+    get_voicing.cache_clear()
@@ -0,0 +1,31 @@
+import os
+import pytest
+import modules.cache as cache
+import modules.render as render
+
+@pytest.fixture(autouse = True, scope = 'session')
+def isolated_cache_variable(tmp_path_factory):
+    """Points the default render cache of subprocesses away from the user cache folder"""
+    previous = os.environ.get(cache.CACHE_VARIABLE)
+    os.environ[cache.CACHE_VARIABLE] = str(tmp_path_factory.mktemp('default_cache'))
+    yield
+    if previous is None:
+        del os.environ[cache.CACHE_VARIABLE]
+    else:
+        os.environ[cache.CACHE_VARIABLE] = previous
+
+@pytest.fixture(autouse = True)
+def isolated_render_cache(tmp_path):
+    """Points the render cache at the temporary folder of every test"""
+    previous = cache.set_cache(cache.RenderCache(str(tmp_path / 'render_cache')))
+    yield
+    cache.set_cache(previous)
+
+@pytest.fixture(autouse = True)
+def isolated_output_folder(tmp_path, monkeypatch):
+    """Points renders made without a name at the temporary folder of every test"""
+    def output_folder():
+        folder = tmp_path / 'renders'
+        folder.mkdir(exist_ok = True)
+        return str(folder)
+    monkeypatch.setattr(render, 'output_folder', output_folder)
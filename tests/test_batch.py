@@ -0,0 +1,36 @@
+import os
+import pytest
+import modules.batch as batch
+import modules.synth as synth
+
+class TestGenerateBatch():
+    """Test generate_batch() across a process pool"""
+  
+    specs = [{'genre': genre, 'key_chord': key, 'add_to_chord': 'major',
+              'variation': 3, 'seed': seed}
+             for seed, (genre, key) in enumerate([('jazz', 'C'), ('P', 'F#'), ('country', 'Bb')] * 4)]
+  
+    def test_one(self):
+        """Test every spec is sequenced once and matches sequential sequencing"""
+        results = dict(batch.generate_batch(self.specs, workers = 2, chunksize = 5))
+        assert sorted(results) == list(range(len(self.specs)))
+        for index, spec in enumerate(self.specs):
+            expected = batch.sequence_spec(spec, index)
+            assert results[index].chord_tracks == expected.chord_tracks
+            assert results[index].seed == spec['seed']
+  
+    def test_two(self):
+        """Test unknown genres are rejected"""
+        with pytest.raises(ValueError):
+            batch.build_piece({'genre': 'polka', 'key_chord': 'C', 'variation': 2})
+  
+    def test_three(self, tmp_path):
+        """Test rendered specs leave MIDI and audio files, also when served from the cache"""
+        previous = batch.ms.render.set_renderer(synth.NumpySynth(8000))
+        try:
+            for folder in ['first', 'second']:
+                os.mkdir(tmp_path / folder)
+                batch.sequence_spec(self.specs[0], 0, True, str(tmp_path / folder))
+                assert sorted(os.listdir(tmp_path / folder)) == ['piece_0.mid', 'piece_0.wav']
+        finally:
+            batch.ms.render.set_renderer(previous)
@@ -0,0 +1,56 @@
+import json
+import subprocess
+import sys
+import pytest
+import modules.cli as cli
+
+class TestCli():
+    """Test the command-line entry point"""
+  
+    def test_one(self):
+        """Test piece specs are read from arguments"""
+        assert cli.parse_spec('jazz:Db:minor:6:5') == {'genre': 'jazz', 'key_chord': 'Db',
+                                                       'add_to_chord': 'minor',
+                                                       'variation': 6, 'seed': 5}
+        assert cli.parse_spec('pop:C')['variation'] == 4
+  
+    def test_two(self, tmp_path, capsys):
+        """Test pieces from arguments and files are written without prompts"""
+        pytest.importorskip('yaml')
+        spec_file = tmp_path / 'specs.json'
+        spec_file.write_text(json.dumps([{'genre': 'country', 'key_chord': 'G',
+                                          'variation': 2, 'seed': 3}]))
+        yaml_file = tmp_path / 'specs.yaml'
+        yaml_file.write_text('pieces:\n  - {genre: pop, key_chord: F, variation: 2}\n')
+        status = cli.main(['jazz:C:major:2:1', '-f', str(spec_file), '-f', str(yaml_file),
+                           '-o', str(tmp_path / 'out'), '--import-times'])
+        output = capsys.readouterr()
+        assert status == 0
+        assert output.out.split() == [str(tmp_path / 'out' / f'piece_{i}.mid') for i in range(3)]
+        assert 'musicpy' in output.err
+        assert (tmp_path / 'out' / 'piece_1.mid').read_bytes()[:4] == b'MThd'
+  
+    def test_three(self, capsys):
+        """Test invalid specs exit with status 2"""
+        assert cli.main(['rock:C']) == 2
+        assert cli.main(['jazz']) == 2
+        assert cli.main([]) == 2
+        assert 'error' in capsys.readouterr().err
+  
+    def test_four(self):
+        """Test importing the command line does not import musicpy or IPython"""
+        code = 'import sys, modules.cli; print("musicpy" in sys.modules, "IPython" in sys.modules)'
+        output = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True)
+        assert output.stdout.split() == ['False', 'False']
+  
+    def test_five(self):
+        """Test options take exactly one value, so specs may follow them"""
+        parser = cli.build_parser()
+        args = parser.parse_intermixed_args(['jazz:C', '--render', 'wav', 'pop:F',
+                                             '--skip-duplicates', '0.8', 'country:G',
+                                             '--render', 'mp3'])
+        assert args.specs == ['jazz:C', 'pop:F', 'country:G']
+        assert args.render == ['wav', 'mp3']
+        assert args.skip_duplicates == 0.8
+        with pytest.raises(SystemExit):
+            parser.parse_intermixed_args(['jazz:C', '--render'])
@@ -0,0 +1,70 @@
+import numpy as np
+from musicpy import N
+import modules.music_sequencer as ms
+import modules.compatibility as compatibility
+
+def sequenced(genre, name, key, variation, seed):
+    """Compactly sequenced piece without playback"""
+    music_piece = genre(name, key, 'major', variation, seed = seed)
+    music_piece.sequence(compact = True, play = False)
+    return music_piece
+
+def expected_scores(first, second, change_key):
+    """Chord matches and overlap of two pieces, walking every chord pair"""
+    raws = [first.note_events(raw = True), second.note_events(raw = True)]
+    if change_key == True:
+        raws[1] = raws[1].transpose(N(first.key_chord).degree - N(second.key_chord).degree)
+    masks = [raw.pitch_class_masks().tolist() for raw in raws]
+    pairs = list(zip(*masks))
+    if not pairs:
+        return 0.0, 0.0
+    match = sum(a == b for a, b in pairs) / len(pairs)
+    overlap = sum(bin(a & b).count('1') / bin(a | b).count('1') for a, b in pairs) / len(pairs)
+    return match, overlap
+
+class TestCompatibility():
+    """Test CompatibilityMatrix scores and updates"""
+
+    pieces = {'jazz': sequenced(ms.Jazz, 'Jazz', 'C', 6, 1),
+              'pop': sequenced(ms.Pop, 'Pop', 'D', 5, 2),
+              'country': sequenced(ms.Country, 'Country', 'G', 8, 3),
+              'moved': sequenced(ms.Country, 'Moved', 'Eb', 8, 3),
+              'empty': ms.Jazz('Empty', 'F', 'major', 4, seed = 4)}
+
+    def test_one(self):
+        """Test all pairs equal walking the chords of every pair"""
+        for change_key in [True, False]:
+            matrix = compatibility.CompatibilityMatrix(change_key)
+            matrix.update(self.pieces)
+            assert matrix.names == list(self.pieces)
+            for i, first in enumerate(self.pieces.values()):
+                for j, second in enumerate(self.pieces.values()):
+                    if i != j:
+                        match, overlap = expected_scores(first, second, change_key)
+                        assert np.isclose(matrix.match[i, j], match)
+                        assert np.isclose(matrix.overlap[i, j], overlap)
+            assert matrix.key_distance[2, 3] == 4 and matrix.key_distance[0, 2] == 1
+
+    def test_two(self):
+        """Test the same progressions in another key are the best partner"""
+        matrix = compatibility.CompatibilityMatrix()
+        matrix.update(self.pieces)
+        assert matrix.partners('country', 1)[0][0] == 'moved'
+        assert matrix.best_pairs(1)[0][:2] == ('country', 'moved')
+        assert 'country' not in [name for name, score in matrix.partners('country')]
+
+    def test_three(self):
+        """Test updates only score pieces that are new or changed"""
+        pieces = {name: music_piece for name, music_piece in self.pieces.items()}
+        pieces['pop'] = sequenced(ms.Pop, 'Pop', 'D', 5, 2)
+        matrix = compatibility.CompatibilityMatrix()
+        assert matrix.update(pieces) == 5
+        assert matrix.update(pieces) == 0
+        pieces['extra'] = sequenced(ms.Jazz, 'Extra', 'A', 4, 5)
+        pieces['pop'].sequence(rerun = True, compact = True, play = False)
+        del pieces['jazz']
+        assert matrix.update(pieces) == 2
+        fresh = compatibility.CompatibilityMatrix()
+        fresh.update(pieces)
+        order = [matrix.names.index(name) for name in fresh.names]
+        assert np.allclose(matrix.scores()[np.ix_(order, order)], fresh.scores())
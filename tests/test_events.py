@@ -0,0 +1,52 @@
+import random
+import musicpy
+import modules.events as ev
+
+#Chords on every degree of a scale with flat note names
+key_scale = musicpy.scale('Db', 'minor')
+chord_list = [musicpy.get_chord(key_scale.get_note_from_degree(d), q)
+              for d in range(1, 8) for q in ['major', 'minor', 'M7', 'm7', 'm6', 'dim7']]
+
+class TestArpeggiate():
+    """Test arpeggiate() against musicpy arp()"""
+  
+    chords = chord_list
+  
+    def test_one(self):
+        """Test every arpeggio equals arp() with the same parameters"""
+        random.seed(4)
+        for intervals, second_half in [(0.0625, True), (0.125, False)]:
+            starts = [random.randrange(2, 4) for c in self.chords]
+            stops = [random.randrange(4, 7) for c in self.chords]
+            expected = [musicpy.arp(c, a, b, durations = 0.5, intervals = intervals,
+                                    second_half = second_half)
+                        for c, a, b in zip(self.chords, starts, stops)]
+            output = ev.arpeggiate(self.chords, starts, stops, 0.5, intervals, second_half)
+            assert output.to_chords() == expected
+            assert output.to_chord() == musicpy.concat(expected, '|')
+  
+    def test_two(self):
+        """Test from_chords() and repeat() round-trip chord lists"""
+        tracks = [musicpy.arp(c, 2, 4, durations = 0.5, intervals = 0.125)
+                  for c in self.chords[:5]]
+        output = ev.NoteEvents.from_chords(tracks)
+        assert output.to_chords() == tracks
+        assert output.repeat(3).to_chords() == tracks * 3
+        assert ev.concat_events([output, output]).to_chords() == tracks * 2
+  
+    def test_three(self):
+        """Test arrays equal musicpy transposition, pitch classes and chord selection"""
+        output = ev.NoteEvents.from_chords(self.chords)
+        assert output.transpose(-5).to_chords() == [c.down(5) for c in self.chords]
+        assert output.transpose(3).to_chords() == [c.up(3) for c in self.chords]
+        masks = output.pitch_class_masks()
+        for c, mask in zip(self.chords, masks):
+            assert mask == sum(1 << p for p in {n.degree % 12 for n in c.notes})
+        tracks = [musicpy.arp(c, 2, 4, durations = 0.5, intervals = 0.125)
+                  for c in self.chords[:6]]
+        other = ev.NoteEvents.from_chords(tracks)
+        use_second = [False, True, True, False, True, False]
+        selected = ev.select_segments(output, other, use_second)
+        assert selected.to_chords() == [t if b else c for c, t, b in
+                                        zip(self.chords, tracks, use_second)]
+        assert ev.arpeggiate(output, 2, 4).to_chords() == ev.arpeggiate(self.chords, 2, 4).to_chords()
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import wave
+import numpy as np
+import pytest
+import modules.music_sequencer as ms
+import modules.export as export
+import modules.synth as synth
+
+class PipeEncoder(export.CommandEncoder):
+    """Encoder copying raw frames to its file through a child process"""
+    def __init__(self, path, script = 'import shutil, sys; ' +
+                 'shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))'):
+        super().__init__(path, [], sys.executable)
+        self.script = script
+  
+    def command(self, sample_rate, channels):
+        return [sys.executable, '-c', self.script, self.path]
+
+class SlowEncoder(export.WaveEncoder):
+    """Encoder taking a while per chunk"""
+    def write(self, chunk):
+        time.sleep(0.01)
+        super().write(chunk)
+
+class FailingEncoder(export.WaveEncoder):
+    """Encoder failing on its third chunk"""
+    writes = 0
+    def write(self, chunk):
+        self.writes += 1
+        if self.writes == 3:
+            raise OSError('Disk full')
+        super().write(chunk)
+
+class ProbeEncoder(export.WaveEncoder):
+    """Encoder noting whether a flag file existed at its first write"""
+    def __init__(self, path, flag):
+        super().__init__(path)
+        self.flag = flag
+        self.flag_seen = None
+  
+    def write(self, chunk):
+        if self.flag_seen is None:
+            self.flag_seen = os.path.exists(self.flag)
+        super().write(chunk)
+
+class TestExport():
+    """Test the streaming export stage"""
+  
+    midi_data = ms.midi_bytes(ms.Country('Piece', 'G', 'major', 2, seed = 1)
+                              .sequence(compact = True, play = False), False, True)
+  
+    def test_one(self, tmp_path):
+        """Test one render is written to every encoder"""
+        renderer = synth.NumpySynth(8000, 2000)
+        wav_path = str(tmp_path / 'piece.wav')
+        raw_path = str(tmp_path / 'piece.raw')
+        stats = export.export_stream(export.pcm_chunks(self.midi_data, renderer),
+                                     [export.WaveEncoder(wav_path), PipeEncoder(raw_path)])
+        expected = renderer.render_pcm(self.midi_data)
+        assert stats['frames'] == len(expected)
+        with wave.open(wav_path, 'rb') as audio:
+            assert audio.getframerate() == 8000
+            assert audio.readframes(audio.getnframes()) == expected.tobytes()
+        with open(raw_path, 'rb') as raw:
+            assert raw.read() == expected.tobytes()
+  
+    def test_two(self, tmp_path):
+        """Test a slow encoder holds back the producer through the bounded queue"""
+        produced = []
+        def chunks():
+            yield 8000, 1
+            for i in range(30):
+                produced.append(i)
+                yield np.full((10, 1), i, dtype = np.int16)
+        encoder = SlowEncoder(str(tmp_path / 'slow.wav'))
+        stats = export.export_stream(chunks(), [encoder], queue_size = 2)
+        assert stats['frames'] == 300
+        assert stats['waited'] > 0
+        with wave.open(encoder.path, 'rb') as audio:
+            frames = np.frombuffer(audio.readframes(300), dtype = np.int16)
+        assert (frames == np.repeat(np.arange(30), 10)).all()
+  
+    def test_three(self, tmp_path):
+        """Test encoder failures are raised and unknown formats rejected"""
+        for script in ['import sys; sys.exit(3)',
+                       'import sys; sys.stdin.buffer.read(); sys.exit(3)']:
+            failing = PipeEncoder(str(tmp_path / 'fail.raw'), script)
+            with pytest.raises(ms.render.RenderError):
+                export.export_stream(export.pcm_chunks(self.midi_data, synth.NumpySynth(8000)),
+                                     [export.WaveEncoder(str(tmp_path / 'piece.wav')), failing])
+        assert isinstance(export.encoder_for('piece.mp3'), export.CommandEncoder)
+        assert export.encoder_for('piece.ogg').codec == export.FFMPEG_CODECS['ogg']
+        with pytest.raises(ValueError):
+            export.encoder_for('piece.xyz')
+  
+    def test_four(self, tmp_path):
+        """Test encoders are closed when one fails partway or cannot start"""
+        def chunks():
+            yield 8000, 1
+            for i in range(10):
+                yield np.full((10, 1), i, dtype = np.int16)
+        failing = FailingEncoder(str(tmp_path / 'fail.wav'))
+        healthy = export.WaveEncoder(str(tmp_path / 'piece.wav'))
+        with pytest.raises(OSError):
+            export.export_stream(chunks(), [failing, healthy], queue_size = 2)
+        assert failing.audio is None and healthy.audio is None
+        #The failed file is finished with the chunks written before the failure
+        with wave.open(failing.path, 'rb') as audio:
+            assert audio.getnframes() == 20
+        with wave.open(healthy.path, 'rb') as audio:
+            assert audio.getnframes() == 100
+    
+        started = export.WaveEncoder(str(tmp_path / 'started.wav'))
+        missing = export.CommandEncoder(str(tmp_path / 'piece.mp3'), [], 'missing-encoder')
+        with pytest.raises(ms.render.RenderError):
+            export.export_stream(chunks(), [started, missing])
+        assert started.audio is None
+  
+    def test_five(self, tmp_path):
+        """Test fluidsynth output is encoded while synthesis is still running"""
+        finished = str(tmp_path / 'finished')
+        binary = tmp_path / 'fluidsynth'
+        binary.write_text(f'#!{sys.executable}\n' +
+                          'import sys, time\n' +
+                          'args = sys.argv[1:]\n' +
+                          'assert args[args.index("-T") + 1] == "raw"\n' +
+                          'assert args[args.index("-F") + 1] == "-"\n' +
+                          'for i in range(5):\n' +
+                          '    sys.stdout.buffer.write(bytes([i]) * 4 * 100)\n' +
+                          '    sys.stdout.buffer.flush()\n' +
+                          '    time.sleep(0.1)\n' +
+                          f'open({finished!r}, "w").close()\n')
+        binary.chmod(0o755)
+        renderer = ms.render.FluidSynthRenderer(binary = str(binary), sample_rate = 8000)
+        encoder = ProbeEncoder(str(tmp_path / 'piece.wav'), finished)
+        stats = export.export_stream(export.pcm_chunks(self.midi_data, renderer), [encoder])
+        assert encoder.flag_seen == False and os.path.exists(finished)
+        assert stats['frames'] == 500
+        with wave.open(encoder.path, 'rb') as audio:
+            assert audio.getnchannels() == 2 and audio.getframerate() == 8000
+            assert audio.readframes(500) == b''.join(bytes([i]) * 400 for i in range(5))
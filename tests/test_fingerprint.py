@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import modules.music_sequencer as ms
+import modules.fingerprint as fingerprint
+import modules.cli as cli
+
+class TestFingerprint():
+    """Test transposition-invariant chord fingerprints"""
+
+    def test_one(self):
+        """Test n-grams do not depend on the key"""
+        masks = np.array([0b10010001, 0b1000100001, 0b10010000100, 0b10010001], dtype = np.uint16)
+        moved = ((masks.astype(np.int64) << 5) | (masks.astype(np.int64) >> 7)) & 0xFFF
+        grams = fingerprint.pitch_class_ngrams(masks, 2)
+        assert len(grams) == 3
+        assert np.array_equal(grams, fingerprint.pitch_class_ngrams(moved, 2))
+        assert len(fingerprint.pitch_class_ngrams(masks[:1])) == 1
+        assert len(fingerprint.pitch_class_ngrams(masks[:0])) == 0
+
+    def test_two(self):
+        """Test pieces differing only in key and stored form have equal signatures"""
+        one = ms.Pop('One', 'C', 'major', 6, seed = 4)
+        two = ms.Pop('Two', 'A', 'major', 6, seed = 4)
+        one.sequence(compact = True, play = False)
+        two.sequence(play = False)
+        assert np.array_equal(fingerprint.fingerprint(one), fingerprint.fingerprint(two))
+        expanded = ms.Genre('Three', 'C', 'major', 6)
+        expanded.store_sequence(one.note_events(raw = True), one.note_events(), compact = True)
+        assert np.array_equal(fingerprint.fingerprint(one), fingerprint.fingerprint(expanded))
+
+    def test_three(self):
+        """Test the index finds duplicates and ranks similar pieces"""
+        index = fingerprint.FingerprintIndex()
+        pieces = []
+        for seed in range(30):
+            music_piece = ms.Country(f'Piece {seed}', 'G', 'major', 8, seed = seed)
+            music_piece.sequence(compact = True, play = False)
+            index.add(seed, music_piece)
+            pieces.append(music_piece)
+        assert len(index) == 30 and 4 in index
+        matches = index.query(pieces[4], limit = 5)
+        assert matches[0] == (4, 1.0)
+        assert [similarity for name, similarity in matches] == \
+            sorted((similarity for name, similarity in matches), reverse = True)
+        moved = ms.Country('Moved', 'Eb', 'major', 8, seed = 4)
+        moved.sequence(compact = True, play = False)
+        assert index.duplicate_of(moved) == 4
+        index.remove(4)
+        assert 4 not in index and index.duplicate_of(moved, 1.0) is None
+
+    def test_four(self, tmp_path, capsys):
+        """Test the command line skips rendering pieces repeating an earlier one"""
+        #Specs following an option are read as specs, not as option values
+        status = cli.main(['pop:C:major:2:4', '--render', 'wav', 'pop:F:major:2:4',
+                           '--skip-duplicates', '0.9', 'pop:G:major:2:4', '-o', str(tmp_path)])
+        output = capsys.readouterr()
+        assert status == 0
+        assert (tmp_path / 'piece_0.wav').exists()
+        for index in [1, 2]:
+            assert (tmp_path / f'piece_{index}.mid').exists()
+            assert not (tmp_path / f'piece_{index}.wav').exists()
+            assert f'piece_{index} repeats piece_0' in output.err
+        #Without rendering there is nothing to skip, so the option is rejected
+        with pytest.raises(SystemExit) as exit_info:
+            cli.main(['pop:C:major:2:4', '-o', str(tmp_path), '--skip-duplicates', '0.9'])
+        assert exit_info.value.code == 2
+        assert '--skip-duplicates requires --render' in capsys.readouterr().err
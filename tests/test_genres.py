@@ -0,0 +1,93 @@
+import pickle
+import numpy as np
+import pytest
+import modules.music_sequencer as ms
+import modules.genres as genres
+import modules.batch as batch
+
+#Genre defined only as data
+BLUES = {
+    'progressions': [[1, 4, 1, 5], [1, 1, 4, 4, 1, 1, 5, 4, 1, 5]],
+    'qualities': {1: '7', 4: '7', 5: '7'},
+    'leading': {5: ('dim7', -1)},
+    'stop_low': 4,
+}
+
+class TestGenreRules():
+    """Test compiled progression tables"""
+
+    def test_one(self):
+        """Test built-in rules compile degrees and chord types to lookup tables"""
+        jazz = genres.get_rules('Jazz')
+        assert jazz.progressions.shape == (5, 4)
+        assert list(jazz.counts) == [5, 3]
+        major, minor = genres.MODES.index('major'), genres.MODES.index('minor')
+        assert genres.QUALITIES[jazz.quality[minor, 5]] == 'M7'
+        assert genres.ALTERATIONS[jazz.alteration[minor, 5]] == 'b9'
+        assert genres.ALTERATIONS[jazz.alteration[major, 5]] is None
+        assert jazz.quality[major, 4] == 0
+        country = genres.get_rules('country')
+        assert genres.QUALITIES[country.leading_quality[2]] == 'dim7'
+        assert country.leading_shift[2] == -1
+
+    def test_two(self):
+        """Test plans follow the rules of every genre"""
+        generator = np.random.default_rng(4)
+        plans = list(genres.get_rules('country').plan(generator, 30, 'major'))
+        assert len(plans) == 31
+        for chords, stop_lows, transpose, state in plans:
+            assert state is None and transpose == 0 and len(stop_lows) == len(chords)
+            for k, (degree, quality, alteration, shift) in enumerate(chords):
+                if quality == 'dim7':
+                    assert chords[k + 1] == (2, 'minor', None, 0) and shift == -1
+        plans = list(genres.get_rules('jazz').plan(generator, 30, 'minor', change_key = True))
+        #Key moved two progressions before the end, progression 28 of 0-30
+        assert all(state[1] == -2 for chords, stop_lows, transpose, state in plans[-3:])
+        assert all(state[1] == 0 for chords, stop_lows, transpose, state in plans[:-3])
+        plans = list(genres.get_rules('pop').plan(generator, 30, 'major', 0, 4))
+        assert all(plan[0] == plans[0][0] for plan in plans)
+
+    def test_three(self):
+        """Test invalid rules are rejected when compiled"""
+        with pytest.raises(ValueError):
+            genres.register_genre('broken', {'progressions': [[1, 9]]})
+        with pytest.raises(ValueError):
+            genres.register_genre('broken', {'progressions': [[1]], 'qualities': {1: 'M13'}})
+        with pytest.raises(ValueError):
+            genres.get_rules('broken')
+
+class TestDataGenre():
+    """Test genres added as data"""
+
+    genres.register_genre('blues', BLUES)
+
+    def test_one(self):
+        """Test a registered genre sequences, regenerates and is deterministic in its seed"""
+        blues = ms.genre_class('Blues')
+        assert blues is ms.genre_class('blues') and issubclass(blues, ms.DataGenre)
+        one = blues('One', 'E', 'major', 6, seed = 3)
+        two = blues('Two', 'E', 'major', 6, seed = 3)
+        assert one.sequence(play = False) == two.sequence(play = False)
+        assert len(one.progression_bounds) == 8
+        one.regenerate(2, 4, play = False)
+        assert one.raw_chords[:one.progression_bounds[2]] == \
+            two.raw_chords[:two.progression_bounds[2]]
+
+    def test_two(self):
+        """Test registered genres work with batch specs and pickling"""
+        music_piece = batch.sequence_spec({'genre': 'blues', 'key_chord': 'A',
+                                           'variation': 3, 'seed': 1})
+        assert type(music_piece) == ms.genre_class('blues')
+        copy = pickle.loads(pickle.dumps(music_piece))
+        assert type(copy) == type(music_piece)
+        assert np.array_equal(copy.track_events.notes, music_piece.track_events.notes)
+        with pytest.raises(ValueError):
+            batch.build_piece({'genre': 'polka', 'key_chord': 'A', 'variation': 3})
+
+    def test_three(self):
+        """Test a registered genre sequenced as lists returns note events when asked"""
+        music_piece = ms.genre_class('blues')('One', 'E', 'major', 4, seed = 3)
+        chords = music_piece.sequence(play = False)
+        output = music_piece.sequence(compact = True, play = False)
+        assert type(output) == ms.events.NoteEvents
+        assert output.to_chords() == chords
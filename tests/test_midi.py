@@ -0,0 +1,94 @@
+import io
+import musicpy
+import numpy as np
+import modules.music_sequencer as ms
+import modules.midi as midi
+
+try:
+    import mido
+except ImportError:
+    import mido_fix as mido
+
+def read_events(data):
+    """Reads a MIDI file into absolute-time events per track"""
+    midi_file = mido.MidiFile(file = io.BytesIO(data))
+    tracks = []
+    for track in midi_file.tracks:
+        time = 0
+        messages = []
+        for msg in track:
+            time += msg.time
+            #Note-on with velocity 0 and note-off are the same event
+            if msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+                messages.append((time, 'note_off', msg.channel, msg.note))
+            elif msg.type == 'note_on':
+                messages.append((time, 'note_on', msg.channel, msg.note, msg.velocity))
+            elif msg.type == 'program_change':
+                messages.append((time, 'program_change', msg.channel, msg.program))
+            elif msg.type == 'control_change':
+                messages.append((time, 'control_change', msg.channel, msg.control, msg.value))
+            elif msg.type == 'set_tempo':
+                messages.append((time, 'set_tempo', msg.tempo))
+        tracks.append(messages)
+    return midi_file.ticks_per_beat, tracks
+
+class TestEncodeMidi():
+    """Test encode_midi() round-trips against musicpy write()"""
+  
+    piece = ms.Jazz('Lovers Blues', 'Db', 'minor', 6, seed = 5)
+    piece.sequence(play = False)
+  
+    def test_one(self):
+        """Test sequenced chord tracks encode like musicpy write()"""
+        expected = musicpy.write(self.piece.chord_tracks, bpm = 100, instrument = 25,
+                                 save_as_file = False).getvalue()
+        output = ms.midi_bytes(self.piece.chord_tracks, False, True)
+        assert read_events(output) == read_events(expected)
+        assert len(output) < len(expected)
+  
+    def test_two(self):
+        """Test symphony pieces keep instruments, channels and volumes"""
+        chord_list = musicpy.concat(self.piece.chord_tracks)
+        symph = musicpy.piece(tracks = [chord_list] * 3, instruments = [1, 27, 52],
+                              bpm = 120, start_times = [0, 0, 0])
+        for i, volume in enumerate([85, 75, 70]):
+            symph.add_volume(volume, i, mode = 'percentage', start_time = 0)
+        expected = musicpy.write(symph, save_as_file = False).getvalue()
+        assert read_events(ms.midi_bytes(symph, True)) == read_events(expected)
+  
+    def test_three(self):
+        """Test running status and long delta times"""
+        events = ms.events.arpeggio_events(musicpy.get_chord('C', 'major'), 2, 3,
+                                           durations = 40, intervals = 20)
+        output = midi.encode_midi([midi.MidiTrack(events, 3, 2, 90)], bpm = 90)
+        ticks_per_beat, tracks = read_events(output)
+        assert tracks[0][:3] == [(0, 'set_tempo', 666667), (0, 'program_change', 2, 2),
+                                 (0, 'control_change', 2, 7, 90)]
+        assert tracks[0][-1] == (20 * 2 * 3840 + 40 * 3840, 'note_off', 2, 43)
+        #One status byte for all notes of a single channel
+        assert output.count(bytes([0x92])) == 1
+  
+    def test_four(self):
+        """Test MidiStreamWriter output equals encoding all blocks at once"""
+        blocks = list(ms.Country('Piece', 'G', 'major', 5, seed = 2).stream(2))
+        output = io.BytesIO()
+        with midi.MidiStreamWriter(output, 25, bpm = 100) as writer:
+            for block in blocks:
+                writer.write(block)
+        expected = midi.encode_midi([midi.MidiTrack(ms.events.concat_events(blocks), 25)],
+                                    bpm = 100)
+        assert output.getvalue() == expected
+  
+    def test_five(self):
+        """Test decode_midi() reads back encoded note events and settings"""
+        events = ms.events.NoteEvents.from_chords(self.piece.chord_tracks)
+        output = midi.encode_midi([midi.MidiTrack(events, 25, 3, 90)], bpm = 100)
+        tracks, bpm = midi.decode_midi(output)
+        assert bpm == 100
+        assert (tracks[0].instrument, tracks[0].channel, tracks[0].volume) == (25, 3, 90)
+        order = np.lexsort((events.notes['pitch'], events.notes['start']))
+        decoded = tracks[0].events.notes
+        decoded = decoded[np.lexsort((decoded['pitch'], decoded['start']))]
+        assert (decoded['pitch'] == events.notes['pitch'][order]).all()
+        assert np.allclose(decoded['start'], events.notes['start'][order])
+        assert np.allclose(decoded['duration'], events.notes['duration'][order])
@@ -0,0 +1,82 @@
+import threading
+import numpy as np
+import modules.music_sequencer as ms
+import modules.playback as playback
+
+class RecordingSink():
+    """Sink keeping every message with the time it was sent"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+  
+    def send(self, message):
+        self.sent.append((self.clock(), message))
+
+class TestSchedule():
+    """Test conversion of tracks to scheduled messages"""
+  
+    def test_one(self):
+        """Test messages carry settings first and notes in time order"""
+        piece = ms.Jazz('Piece', 'C', 'major', 2, seed = 1)
+        tracks, bpm = ms.midi_tracks(piece.sequence(compact = True, play = False), False)
+        messages = playback.schedule(tracks, bpm)
+        assert tuple(messages[0])[1:] == (0xC0, 0, 0)
+        assert (np.diff(messages['time']) >= 0).all()
+        ons = messages[(messages['status'] & 0xF0 == 0x90) & (messages['data_2'] > 0)]
+        assert len(ons) == len(tracks[0].events)
+        notes = tracks[0].events.notes
+        end = (notes['start'] + notes['duration']).max()
+        assert np.isclose(messages['time'][-1], end * 240 / bpm, atol = 0.01)
+  
+    def test_two(self):
+        """Test the ring buffer wraps around and blocks while full"""
+        ring = playback.RingBuffer(4)
+        messages = np.zeros(10, dtype = playback.MESSAGE_DTYPE)
+        messages['time'] = np.arange(10)
+        producer = threading.Thread(target = ring.put, args = (messages,))
+        producer.start()
+        received = []
+        while len(received) < 10:
+            batch = ring.get(3)
+            assert len(batch) <= 3
+            received.extend(batch['time'])
+        producer.join()
+        assert received == list(range(10))
+        ring.close()
+        assert len(ring.get(3)) == 0
+
+class TestScheduler():
+    """Test real-time dispatch of scheduled messages"""
+  
+    messages = np.zeros(40, dtype = playback.MESSAGE_DTYPE)
+    messages['time'] = np.arange(40) * 0.005
+    messages['status'] = 0x90
+    messages['data_1'] = 60 + np.arange(40) % 12
+    messages['data_2'] = 100
+  
+    def test_one(self):
+        """Test every message is sent in order close to its due time"""
+        scheduler = playback.Scheduler(None, lookahead = 0.02, capacity = 8)
+        sink = RecordingSink(scheduler.clock)
+        scheduler.sink = sink
+        stats = scheduler.play(self.messages)
+        assert stats['messages'] == 40
+        assert [message[1][1] for message in sink.sent] == [60 + i % 12 for i in range(40)]
+        assert stats['start_latency'] < 0.05
+        assert 0 <= stats['mean_jitter'] <= stats['max_jitter']
+        times = np.array([time for time, message in sink.sent])
+        assert abs((times[-1] - times[0]) - 0.195) < 0.05
+  
+    def test_two(self):
+        """Test stop() ends background playback and silences the channel"""
+        messages = self.messages.copy()
+        messages['time'] *= 100
+        scheduler = playback.Scheduler(None)
+        sink = RecordingSink(scheduler.clock)
+        scheduler.sink = sink
+        scheduler.start(messages)
+        while not sink.sent:
+            pass
+        stats = scheduler.stop()
+        assert stats['messages'] < 40
+        assert sink.sent[-1][1] == bytes([0xB0, 123, 0])
@@ -1,4 +1,25 @@
+import os
+import subprocess
+import sys
+import wave
+import musicpy
+import numpy as np
 import modules.music_sequencer as ms
+import modules.synth as synth
+from modules.music_sequencer import Genre
+
+def assert_valid_symph(music_piece):
+    """Generates the symphony of a piece and checks it is a valid musicpy piece"""
+    previous = ms.render.set_renderer(synth.NumpySynth(8000))
+    try:
+        symph = music_piece.generate_symph()
+    finally:
+        ms.render.set_renderer(previous)
+    assert type(symph) == musicpy.structures.piece
+    assert all(isinstance(track, musicpy.structures.chord) for track in symph.tracks)
+    assert 'piece' in repr(symph)
+    assert musicpy.write(symph, save_as_file = False).getvalue()[:4] == b'MThd'
+    return symph
 
 class TestJazzSequence():
     """Test sequence() method of Jazz Class"""
@@ -6,8 +27,8 @@ class TestJazzSequence():
     #Test instances
     jazz_one = ms.Jazz('Lovers Blues', 'Db', 'minor', 6)
     jazz_two = ms.Jazz('World of Wonder', 'F#', 'major', 4)
-    output_one = jazz_one.sequence()
-    output_two = jazz_two.sequence()
+    output_one = jazz_one.sequence(play = False)
+    output_two = jazz_two.sequence(play = False)
   
     def test_one(self):
         """Test type of output of sequence()"""
@@ -30,16 +51,361 @@ class TestJazzSequence():
         new_output = self.jazz_two.sequence(rerun = True)
         assert new_output != self.output_two
 
+class TestCompactSequence():
+    """Test compact note events emitted by sequence()"""
+  
+    def test_one(self):
+        """Test compact sequences convert back to the same chords"""
+        for genre in [ms.Jazz, ms.Pop, ms.Country]:
+            expected = genre('Piece', 'Eb', 'major', 5, seed = 18).sequence()
+            compact = genre('Piece', 'Eb', 'major', 5, seed = 18)
+            output = compact.sequence(compact = True)
+            if genre == ms.Pop:
+                assert type(output) == ms.events.PatternEvents
+            else:
+                assert type(output) == ms.events.NoteEvents
+            assert compact._chord_tracks is None
+            assert output.segment_count == len(expected)
+            assert compact.chord_tracks == expected
+      
+    def test_two(self):
+        """Test compact sequences are not overwritten without rerun"""
+        piece = ms.Country('Piece', 'A', 'major', 3)
+        output = piece.sequence(compact = True)
+        assert piece.sequence(compact = True) is output
+        assert len(piece.raw_chords) == piece.raw_events.segment_count
+  
+    def test_three(self):
+        """Test sequences stored as lists are returned as note events when asked"""
+        for genre, variation in [(ms.Jazz, 4), (ms.Country, 4), (ms.Pop, 1)]:
+            piece = genre('Piece', 'C', 'major', variation, seed = 6)
+            chords = piece.sequence(play = False)
+            output = piece.sequence(compact = True, play = False)
+            assert type(output) == ms.events.NoteEvents
+            assert output.to_chords() == chords
+            assert piece.sequence(play = False) is chords
+
+class TestPatternSequence():
+    """Test pop sequences stored as a pattern with a repeat count"""
+  
+    def test_one(self):
+        """Test memory and MIDI writing stay proportional to one repetition"""
+        short = ms.Pop('Piece', 'G', 'major', 2, seed = 8)
+        long = ms.Pop('Piece', 'G', 'major', 1000, seed = 8)
+        short.sequence(play = False)
+        output = long.sequence(compact = True, play = False)
+        assert output.nbytes == short.track_events.nbytes
+        assert output.segment_count == 1000 * output.pattern.segment_count
+        assert long.chord_tracks[0] is long.chord_tracks[output.pattern.segment_count]
+        expected = ms.midi.encode_midi([ms.midi.MidiTrack(output.expand(), 1)], bpm = 100)
+        assert ms.midi_bytes(output, False) == expected
+    
+    def test_two(self):
+        """Test repeated pattern bytes equal the expanded events for any repeat count"""
+        pattern = ms.Pop('Piece', 'E', 'major', 1, seed = 3).sequence(compact = True,
+                                                                      play = False)
+        for times in range(1, 7):
+            for start_time in [0, 1.5]:
+                output = ms.events.PatternEvents(pattern, times)
+                tracks = [ms.midi.MidiTrack(output, 5, 3, 90, start_time)]
+                expanded = [ms.midi.MidiTrack(output.expand(), 5, 3, 90, start_time)]
+                assert ms.midi.encode_midi(tracks) == ms.midi.encode_midi(expanded)
+  
+    def test_three(self):
+        """Test generate_symph() carries the pattern into MIDI writing"""
+        class SilentRenderer():
+            def available(self):
+                return False
+        previous = ms.render.set_renderer(SilentRenderer())
+        try:
+            for times in [50, 1000]:
+                music = ms.Pop('Piece', 'D', 'major', times, seed = 2)
+                output = music.sequence(compact = True, play = False)
+                symph = ms.Genre.generate_symph(music)
+                track = symph.tracks[0]
+                assert all(other is track for other in symph.tracks)
+                assert track.events is output and not track.is_built()
+                tracks = ms.piece_tracks(symph)
+                assert all(t.events is output for t in tracks)
+                expanded = [ms.midi.MidiTrack(output.expand(), t.instrument, t.channel,
+                                              t.volume, t.start_time) for t in tracks]
+                assert ms.midi_bytes(symph, True) == \
+                    ms.midi.encode_midi(expanded, bpm = symph.bpm)
+        finally:
+            ms.render.set_renderer(previous)
+        #Musicpy builds the notes only when asked for them
+        assert len(track) == len(output) and track.is_built()
+        assert track == output.to_chord()
+  
+class TestStreamSequence():
+    """Test stream() generator of Genre subclasses"""
+  
+    def test_one(self):
+        """Test streamed blocks concatenate to the sequence of the same seed"""
+        for genre in [ms.Jazz, ms.Pop, ms.Country]:
+            expected = genre('Piece', 'Bb', 'minor', 7, seed = 4).sequence(compact = True)
+            if genre == ms.Pop:
+                expected = expected.expand()
+            for window in [1, 3]:
+                blocks = list(genre('Piece', 'Bb', 'minor', 7, seed = 4).stream(window))
+                output = ms.events.concat_events(blocks)
+                assert (output.notes == expected.notes).all()
+                assert (output.ends == expected.ends).all()
+  
+    def test_two(self, tmp_path):
+        """Test render_stream() writes the MIDI file and overlaps rendered windows"""
+        import wave
+        import numpy as np
+    
+        class ToneRenderer():
+            """Renderer writing a minute of constant stereo audio"""
+            def available(self):
+                return True
+      
+            def render(self, midi_path, audio_path):
+                with wave.open(audio_path, 'wb') as audio_out:
+                    audio_out.setnchannels(2)
+                    audio_out.setsampwidth(2)
+                    audio_out.setframerate(100)
+                    audio_out.writeframes(np.full((6000, 2), 100, np.int16).tobytes())
+                return ms.render.RenderResult(midi_path, audio_path)
+    
+        piece = ms.Jazz('Piece', 'C', 'major', 4, seed = 9)
+        previous = ms.render.set_renderer(ToneRenderer())
+        try:
+            name = str(tmp_path / 'stream')
+            chunks = list(ms.render_stream(piece.stream(), name = name))
+        finally:
+            ms.render.set_renderer(previous)
+        expected = piece.sequence(compact = True, play = False)
+        with open(name + '.mid', 'rb') as midi_in:
+            assert midi_in.read() == ms.midi_bytes(expected, False)
+        #Windows are shorter than a minute, so their audio overlaps
+        audio = np.concatenate(chunks)
+        assert audio.max() > 100
+        with wave.open(name + '.wav', 'rb') as audio_in:
+            assert audio_in.getnframes() == len(audio)
+  
+class TestRegenerate():
+    """Test regenerate() method of Genre subclasses"""
+  
+    def test_one(self):
+        """Test only the chosen progressions change, in both stored forms"""
+        for genre in [ms.Jazz, ms.Pop, ms.Country]:
+            for compact in [False, True]:
+                piece = genre('Piece', 'Ab', 'minor', 8, seed = 12)
+                if genre == ms.Jazz:
+                    piece.sequence(change_key = True, compact = compact, play = False)
+                else:
+                    piece.sequence(compact = compact, play = False)
+                before = list(piece.raw_chords)
+                bounds = piece.progression_bounds.copy()
+                output = piece.regenerate(2, 5, play = False)
+                if compact == True or genre == ms.Pop:
+                    assert type(output) == ms.events.NoteEvents
+                else:
+                    assert type(output) == list
+                after = piece.raw_chords
+                assert after[:bounds[2]] == before[:bounds[2]]
+                assert after[len(after) - len(before) + bounds[5]:] == before[bounds[5]:]
+                assert piece.progression_bounds[-1] == len(after) == len(piece.chord_tracks)
+                #Every progression can be regenerated again from the stored states
+                piece.regenerate(0, len(piece.progression_bounds) - 1, play = False)
+  
+    def test_two(self):
+        """Test kept jazz progressions are entered in the chord type they were built in"""
+        piece = ms.Jazz('Piece', 'C', 'major', 9, seed = 1)
+        piece.sequence(play = False)
+        states = list(piece.progression_states)
+        for start in range(9):
+            piece.regenerate(start, start + 1, play = False)
+            assert piece.progression_states[start + 1] == states[start + 1]
+  
+    def test_three(self, tmp_path):
+        """Test the spliced render equals rendering the whole new sequence"""
+        import wave
+        import numpy as np
+        try:
+            import mido
+        except ImportError:
+            import mido_fix as mido
+    
+        class BoxRenderer():
+            """Renderer adding a box with a release tail per note, linear in the notes"""
+            def available(self):
+                return True
+      
+            def render(self, midi_path, audio_path):
+                midi_file = mido.MidiFile(midi_path)
+                audio = np.zeros((int(midi_file.length * 100) + 40, 2), np.int16)
+                time = 0
+                sounding = {}
+                for msg in midi_file:
+                    time += msg.time
+                    if msg.type == 'note_on' and msg.velocity > 0:
+                        sounding.setdefault(msg.note, []).append(time)
+                    elif msg.type == 'note_on':
+                        begin = int(round(sounding[msg.note].pop(0) * 100))
+                        audio[begin:int(round(time * 100)) + 20] += msg.note
+                with wave.open(audio_path, 'wb') as audio_out:
+                    audio_out.setnchannels(2)
+                    audio_out.setsampwidth(2)
+                    audio_out.setframerate(100)
+                    audio_out.writeframes(audio.tobytes())
+                return ms.render.RenderResult(midi_path, audio_path)
+    
+        previous = ms.render.set_renderer(BoxRenderer())
+        try:
+            #A symphony played in between must not be spliced into
+            for symph, start, stop in [(False, 3, 6), (True, 2, 4)]:
+                piece = ms.Country('Piece', 'D', 'major', 10, seed = 6)
+                piece.sequence()
+                if symph == True:
+                    piece.generate_symph()
+                piece.regenerate(start, stop)
+                assert piece.last_render is piece.sequence_render
+                spliced = ms.read_audio(piece.last_render.audio_path)[1]
+                #Rendered whole without the cache, which holds the spliced audio
+                previous_cache = ms.cache.set_cache(None)
+                whole = ms.render_music(piece.chord_tracks, False, True,
+                                        str(tmp_path / f'whole_{start}'))
+                ms.cache.set_cache(previous_cache)
+                expected = ms.read_audio(whole.audio_path)[1]
+                assert spliced.shape == expected.shape
+                assert (spliced == expected).all()
+      
+            #Sequences changed without playback are rendered whole again
+            piece.regenerate(0, 2, play = False)
+            assert piece.sequence_render is None
+        finally:
+            ms.render.set_renderer(previous)
+  
+class TestSeededSequence():
+    """Test sequence() and generate_symph() are deterministic in the seed"""
+  
+    def test_one(self):
+        """Test equal seeds give equal sequences and symphonies"""
+        for genre in [ms.Jazz, ms.Pop, ms.Country]:
+            one = genre('One', 'D', 'minor', 6, seed = 7)
+            two = genre('Two', 'D', 'minor', 6, seed = 7)
+            assert one.sequence() == two.sequence()
+            assert one.raw_chords == two.raw_chords
+        symph_one = ms.Genre('One', 'C', 'major', 2, seed = 3)
+        symph_two = ms.Genre('Two', 'C', 'major', 2, seed = 3)
+        symph_one.chord_tracks = symph_two.chord_tracks = one.chord_tracks
+        assert symph_one.generate_symph().instruments == symph_two.generate_symph().instruments
+  
+    def test_two(self):
+        """Test rerun derives a new seed deterministically"""
+        one = ms.Jazz('One', 'E', 'major', 6, seed = 11)
+        two = ms.Jazz('Two', 'E', 'major', 6, seed = 11)
+        one.sequence()
+        two.sequence()
+        assert one.sequence(rerun = True) == two.sequence(rerun = True)
+        assert one.seed == two.seed != 11
+
+class TestVoicingCache():
+    """Test voicing cache shared by Genre instances"""
+  
+    def test_one(self):
+        """Test cached voicings equal chords built with get_chord()"""
+        key_scale = musicpy.scale('Db', 'minor')
+        expected = musicpy.get_chord(key_scale.get_note_from_degree(5), 'M7')('b9')
+        assert ms.voicings.voicing_chord('Db', 'minor', 5, 'M7', 'b9') == expected
+        expected = musicpy.get_chord(key_scale.down(2).get_note_from_degree(2).down(), 'dim7')
+        assert ms.voicings.voicing_chord('Db', 'minor', 2, 'dim7', transpose = -2,
+                                         root_shift = -1) == expected
+    
+    def test_two(self):
+        """Test repeated sequencing hits the cache instead of rebuilding voicings"""
+        ms.voicings.clear_voicing_cache()
+        ms.Country('One', 'G', 'major', 20).sequence()
+        first = ms.voicings.voicing_cache_info()
+        ms.Country('Two', 'G', 'major', 20).sequence()
+        second = ms.voicings.voicing_cache_info()
+        #Country in one key has at most six distinct voicings
+        assert second.currsize <= 6
+        assert second.hits - first.hits >= 20
+
 class TestGenerateSymph():
     """Test generate_symph() method of Genre superclass"""
   
     #Test instances
     music = ms.Genre('Music', 'C#', 'major', 4)
-    music.chord_tracks = ms.Pop('Pop', 'C#', 'major', 4).sequence()
+    music.chord_tracks = ms.Pop('Pop', 'C#', 'major', 4).sequence(play = False)
     
     def test_one(self):
         """Test type of output of generate_symph()"""
         assert type(self.music.generate_symph()) == musicpy.structures.piece
+  
+    def test_two(self):
+        """Test all tracks share one chord equal to concatenating chord_tracks"""
+        symph = self.music.generate_symph()
+        assert all(track is symph.tracks[0] for track in symph.tracks)
+        assert symph.tracks[0] == musicpy.concat(self.music.chord_tracks)
+        assert [v[0].value for v in symph.volume] == [int(127 * v / 100)
+                                                       for v in [80, 80, 70, 70, 70]]
+  
+    def test_three(self, tmp_path):
+        """Test render_tracks() mixes tracks like one render and reuses cached tracks"""
+        class CountingSynth(synth.NumpySynth):
+            renders = 0
+            def render(self, midi_path, audio_path):
+                CountingSynth.renders += 1
+                return super().render(midi_path, audio_path)
+    
+        symph = musicpy.piece(tracks = [self.music.chord_tracks[0]] * 3, instruments = [1, 20, 41],
+                              bpm = 120, start_times = [0, 0, 0], channels = [0, 1, 2])
+        previous = ms.render.set_renderer(CountingSynth(8000, gain = 0.02))
+        previous_cache = ms.cache.set_cache(ms.cache.RenderCache(str(tmp_path / 'cache')))
+        try:
+            result = ms.render_tracks(symph, str(tmp_path / 'mix'), workers = 2)
+            params, mixed = ms.read_audio(result.audio_path)
+            assert CountingSynth.renders == 3
+      
+            #Synthesis is linear, so the mix is the whole piece scaled to MIX_PEAK
+            whole = synth.NumpySynth(8000, gain = 0.02).synthesize(ms.piece_tracks(symph), 120)
+            whole = whole.astype(np.float32) * ms.MIX_PEAK * 32767 / np.abs(whole).max()
+            assert mixed.shape == whole.shape
+            assert np.abs(mixed - whole).max() < 0.01 * 32767
+      
+            #Only the track with a new instrument is rendered again
+            symph.instruments[2] = 42
+            ms.render_tracks(symph, str(tmp_path / 'mix'))
+            assert CountingSynth.renders == 4
+      
+            #Identical tracks on different channels share one render, drums do not
+            same = musicpy.piece(tracks = [self.music.chord_tracks[0]] * 4,
+                                 instruments = [30] * 4, bpm = 120, start_times = [0] * 4,
+                                 channels = [3, 4, 5, 9])
+            ms.render_tracks(same, str(tmp_path / 'same'))
+            assert CountingSynth.renders == 6
+            symph.channels = [5, 6, 7]
+            ms.render_tracks(symph, str(tmp_path / 'mix'))
+            assert CountingSynth.renders == 6
+        finally:
+            ms.render.set_renderer(previous)
+            ms.cache.set_cache(previous_cache)
+  
+    def test_four(self):
+        """Test symphonies of compact pop pieces hold musicpy chords that musicpy can write"""
+        music_piece = ms.Pop('Pop', 'D', 'major', 4, seed = 2)
+        music_piece.sequence(compact = True, play = False)
+        assert type(music_piece.track_events) == ms.events.PatternEvents
+        symph = assert_valid_symph(music_piece)
+        assert symph.tracks[0] == musicpy.concat(music_piece.chord_tracks)
+  
+    def test_five(self):
+        """Test symphonies of pieces stored as compact note events are valid musicpy pieces"""
+        jazz = ms.Jazz('Jazz', 'Bb', 'major', 5, seed = 7)
+        jazz.sequence(play = False)
+        music_piece = ms.Genre('Music', 'Bb', 'major', 5)
+        music_piece.store_sequence(jazz.note_events(raw = True), jazz.note_events(),
+                                   compact = True)
+        assert type(music_piece.track_events) == ms.events.NoteEvents
+        symph = assert_valid_symph(music_piece)
+        assert all(track is symph.tracks[0] for track in symph.tracks)
+        assert symph.tracks[0] == musicpy.concat(jazz.chord_tracks)
         
 class TestMixPieces():
     """Test mix_pieces() function"""
@@ -47,8 +413,8 @@ class TestMixPieces():
     #Test instances
     piece_1 = ms.Jazz('Lacrimost', 'G', 'major', 6)
     piece_2 = ms.Pop('Iraet', 'F', 'major', 5)
-    piece_1.sequence()
-    piece_2.sequence()
+    piece_1.sequence(play = False)
+    piece_2.sequence(play = False)
     
     def test_one(self):
         """Test type of output of mix_pieces()"""
@@ -66,3 +432,241 @@ class TestMixPieces():
         output = ms.mix_pieces(self.piece_1, self.piece_2)
         assert type(output.name) == str
         assert output.name == self.piece_1.name + ' + ' + self.piece_2.name
+  
+    def test_four(self):
+        """Test mixed chords against transposing and matching chord by chord"""
+        for key_2 in ['F', 'A', 'G']:
+            piece_1 = ms.Jazz('One', 'G', 'major', 12, seed = 5)
+            piece_2 = ms.Country('Two', key_2, 'major', 12, seed = 6)
+            piece_1.sequence(play = False)
+            piece_2.sequence(compact = True, play = False)
+            transpose = musicpy.N('G').degree - musicpy.N(key_2).degree
+            expected = []
+            switch_bool = True
+            for c1, c2 in zip(piece_1.raw_chords, piece_2.raw_chords):
+                c2 = c2.up(transpose) if transpose > 0 else c2.down(-transpose)
+                expected.append(c1 if switch_bool == True else c2)
+                if {n.degree % 12 for n in c1.notes} == {n.degree % 12 for n in c2.notes}:
+                    switch_bool = not switch_bool
+            output = ms.mix_pieces(piece_1, piece_2)
+            assert output.raw_chords == expected
+            assert len(output.chord_tracks) == len(expected)
+  
+    def test_five(self):
+        """Test symphonies of mixed pieces, stored compact, are valid musicpy pieces"""
+        piece_1 = ms.Jazz('One', 'G', 'major', 6, seed = 5)
+        piece_2 = ms.Country('Two', 'A', 'major', 6, seed = 6)
+        piece_1.sequence(play = False)
+        piece_2.sequence(compact = True, play = False)
+        output = ms.mix_pieces(piece_1, piece_2)
+        assert output.track_events is not None
+        symph = assert_valid_symph(output)
+        assert symph.tracks[0] == musicpy.concat(output.chord_tracks)
+
+class TestMergePieces():
+    """Test merge_pieces() function"""
+  
+    pieces = [ms.Jazz('One', 'G', 'major', 8, seed = 1), ms.Country('Two', 'A', 'major', 4, seed = 2),
+              ms.Pop('Three', 'E', 'major', 3, seed = 3)]
+    for music_piece in pieces:
+        music_piece.sequence(compact = True, play = False)
+  
+    def test_one(self):
+        """Test pieces are carried on until the longest one ends"""
+        output = ms.merge_pieces(self.pieces, rule = ms.round_robin, play = False)
+        lengths = [music_piece.raw_events.segment_count for music_piece in self.pieces]
+        assert output.raw_events.segment_count == max(lengths)
+        assert output.name == 'One + Two + Three'
+        #Round robin takes the first chords from every piece in turn, in key of G
+        raws = [music_piece.note_events(raw = True) for music_piece in self.pieces]
+        expected = [raws[0].segments(0, 1), raws[1].transpose(-2).segments(1, 2),
+                    raws[2].transpose(3).segments(2, 3)]
+        output_notes = output.raw_events.segments(0, 3).notes
+        assert (output_notes == ms.events.concat_events(expected).notes).all()
+  
+    def test_two(self):
+        """Test two pieces with truncation equal mix_pieces()"""
+        output = ms.merge_pieces(self.pieces[:2], key = None, truncate = True, play = False)
+        expected = ms.mix_pieces(self.pieces[0], self.pieces[1], change_key = False)
+        assert output.raw_chords == expected.raw_chords
+        assert output.chord_tracks == expected.chord_tracks
+        assert output.seed == expected.seed
+  
+    def test_three(self):
+        """Test symphonies of merged pieces, stored compact, are valid musicpy pieces"""
+        output = ms.merge_pieces(self.pieces, play = False)
+        assert output.track_events is not None
+        symph = assert_valid_symph(output)
+        assert symph.tracks[0] == musicpy.concat(output.chord_tracks)
+  
+class TestRenderMusic():
+    """Test headless render_music() function"""
+  
+    class FakeRenderer():
+        """Renderer writing an empty waveform audio file"""
+        calls = 0
+      
+        def available(self):
+            return True
+      
+        def render(self, midi_path, audio_path):
+            self.calls += 1
+            with wave.open(audio_path, 'wb') as audio:
+                audio.setnchannels(2)
+                audio.setsampwidth(2)
+                audio.setframerate(44100)
+            return ms.render.RenderResult(midi_path, audio_path)
+  
+    def test_one(self, tmp_path):
+        """Test render_music() returns artifacts from the swapped renderer"""
+        previous = ms.render.set_renderer(self.FakeRenderer())
+        previous_cache = ms.cache.set_cache(None)
+        try:
+            name = str(tmp_path / 'piece')
+            result = ms.render_music([ms.get_chord('C', 'major')], False, name = name)
+        finally:
+            ms.render.set_renderer(previous)
+            ms.cache.set_cache(previous_cache)
+        assert result.midi_path == name + '.mid'
+        assert result.audio_path == name + '.wav'
+  
+    def test_three(self, tmp_path):
+        """Test unchanged pieces are served from the render cache"""
+        renderer = self.FakeRenderer()
+        previous = ms.render.set_renderer(renderer)
+        previous_cache = ms.cache.set_cache(ms.cache.RenderCache(str(tmp_path / 'cache')))
+        try:
+            piece = ms.Jazz('Piece', 'C', 'major', 3)
+            first = piece.sequence()
+            piece.sequence()
+            assert renderer.calls == 1
+            assert piece.last_render.audio_path.startswith(str(tmp_path / 'cache'))
+            piece.sequence(rerun = True)
+            assert renderer.calls == 2
+            #Symphonies render once per track, then come from the cache
+            piece.generate_symph()
+            piece.generate_symph()
+            assert renderer.calls == 7
+        finally:
+            ms.render.set_renderer(previous)
+            ms.cache.set_cache(previous_cache)
+  
+    def test_four(self, tmp_path):
+        """Test least recently used files are evicted above max_bytes"""
+        render_cache = ms.cache.RenderCache(str(tmp_path), max_bytes = 25)
+        for key in ['a0', 'b0', 'c0']:
+            render_cache.put(key, '.mid', b'0123456789')
+            os.utime(render_cache.path(key, '.mid'), (0, {'a0': 2, 'b0': 1, 'c0': 3}[key]))
+        render_cache.evict()
+        assert render_cache.get('b0', '.mid') is None
+        assert render_cache.get('a0', '.mid') is not None
+        assert render_cache.size() == 20
+  
+    def test_two(self):
+        """Test play_music() does not prompt outside a notebook"""
+        assert ms.in_notebook() == False
+  
+    def test_five(self):
+        """Test renders without a name get their own files and map their frames"""
+        previous = ms.render.set_renderer(synth.NumpySynth(8000))
+        previous_cache = ms.cache.set_cache(None)
+        try:
+            chords = [ms.get_chord('C', 'major'), ms.get_chord('A', 'minor')]
+            first = ms.render_music(chords, False)
+            second = ms.render_music(chords[::-1], False)
+            assert len({first.audio_path, second.audio_path, 'output.wav'}) == 3
+            assert first.audio_path.startswith(ms.render.output_folder())
+            sample_rate, frames = first.samples()
+            assert isinstance(frames, np.memmap)
+            assert sample_rate == 8000
+            assert (frames == ms.read_audio(first.audio_path)[1]).all()
+      
+            #Renderers with render_pcm() hand back a buffer without an audio file
+            output = ms.render_music(chords, False, in_memory = True)
+            assert output.audio_path is None
+            assert (output.samples()[1] == frames).all()
+        finally:
+            ms.render.set_renderer(previous)
+            ms.cache.set_cache(previous_cache)
+  
+    def test_six(self):
+        """Test renders without a name are removed when the process exits"""
+        script = ('import modules.music_sequencer as ms, modules.synth as synth\n'
+                  'ms.render.set_renderer(synth.NumpySynth(8000))\n'
+                  'result = ms.render_music([ms.get_chord("C", "major")], False)\n'
+                  'print(ms.render.output_folder(), result.audio_path)\n')
+        #Renders are written to the output folder only with the render cache disabled
+        output = subprocess.run([sys.executable, '-c', script], capture_output = True,
+                                text = True, check = True,
+                                cwd = os.path.dirname(os.path.dirname(__file__)),
+                                env = dict(os.environ, **{ms.cache.CACHE_VARIABLE: ''}))
+        folder, audio_path = output.stdout.split()
+        assert audio_path.startswith(folder)
+        assert not os.path.exists(folder)
+  
+    def test_seven(self, tmp_path):
+        """Test named renders write their files whether the render cache holds them or not"""
+        renderer = self.FakeRenderer()
+        previous = ms.render.set_renderer(renderer)
+        try:
+            chords = [ms.get_chord('C', 'major')]
+            for name in ['first', 'second']:
+                result = ms.render_music(chords, False, name = str(tmp_path / name))
+                assert result.midi_path == str(tmp_path / name) + '.mid'
+                assert result.audio_path == str(tmp_path / name) + '.wav'
+                with open(result.midi_path, 'rb') as midi_in:
+                    assert midi_in.read() == ms.midi_bytes(chords, False)
+                assert os.path.exists(result.audio_path)
+            assert renderer.calls == 1
+        finally:
+            ms.render.set_renderer(previous)
+  
+    def test_eight(self, tmp_path, monkeypatch):
+        """Test storing renders walks the cache folder only to evict files"""
+        render_cache = ms.cache.RenderCache(str(tmp_path / 'cache'), max_bytes = 55)
+        scans = []
+        entries = render_cache._entries
+        monkeypatch.setattr(render_cache, '_entries', lambda: scans.append(1) or entries())
+        source = tmp_path / 'take.mid'
+        source.write_bytes(b'0123456789')
+        for key in ['a0', 'b0', 'c0', 'd0', 'e0']:
+            render_cache.store(key, ms.render.RenderResult(str(source), None))
+        assert len(scans) == 1 and render_cache.size() == 50
+        render_cache.store('f0', ms.render.RenderResult(str(source), None))
+        assert len(scans) == 2 and render_cache.size() <= 55
+        assert render_cache.size() == sum(entry[2] for entry in entries())
+  
+    def test_nine(self, tmp_path, monkeypatch):
+        """Test the default render cache lives in the per-user cache folder"""
+        monkeypatch.delenv(ms.cache.CACHE_VARIABLE)
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        assert ms.cache.default_directory() == str(tmp_path / 'music_sequencer')
+        monkeypatch.setenv(ms.cache.CACHE_VARIABLE, str(tmp_path / 'elsewhere'))
+        assert ms.cache.default_directory() == str(tmp_path / 'elsewhere')
+        monkeypatch.setenv(ms.cache.CACHE_VARIABLE, '')
+        assert ms.cache.default_directory() is None
+  
+    def test_ten(self, tmp_path, monkeypatch):
+        """Test download links of unnamed renders point below the working directory"""
+        import types
+        import IPython.display
+        shown = []
+        monkeypatch.setattr(IPython.display, 'display', shown.append)
+        monkeypatch.setitem(sys.modules, 'modules.interface',
+                            types.SimpleNamespace(take_user_input = lambda *args: 'Y'))
+        (tmp_path / 'notebook').mkdir()
+        monkeypatch.chdir(tmp_path / 'notebook')
+        previous = ms.render.set_renderer(synth.NumpySynth(8000))
+        try:
+            result = ms.render_music([ms.get_chord('C', 'major')], False)
+            assert not result.audio_path.startswith(os.getcwd())
+            ms.show_music(result, True)
+        finally:
+            ms.render.set_renderer(previous)
+        link = shown[-1]
+        assert isinstance(link, IPython.display.FileLink)
+        assert not os.path.isabs(link.path) and link.path.endswith('.wav')
+        with open(link.path, 'rb') as copy, open(result.audio_path, 'rb') as audio:
+            assert copy.read() == audio.read()
+        #Files already below the working directory are linked where they are
+        assert ms.download_copy(link.path) == link.path
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pytest
+import modules.music_sequencer as ms
+import modules.events as events
+import modules.session as session
+
+def sequenced_pieces():
+    """Pieces covering every stored form of a sequence"""
+    jazz = ms.Jazz('Lovers Blues', 'Db', 'minor', 4, seed = 5)
+    jazz.sequence(change_key = True, compact = True, play = False)
+    pop = ms.Pop('Summer Lights', 'C', 'major', 2, seed = 7)
+    pop.sequence(compact = True, play = False)
+    country = ms.Country('Open Road', 'G', 'major', 2, seed = 3)
+    country.sequence(play = False)
+    mixed = ms.merge_pieces([jazz, country], key = None, truncate = True, play = False)
+    empty = ms.Jazz('Blank Page', 'E', 'major', 4, seed = 1)
+    return {'jazz': jazz, 'pop': pop, 'country': country, 'mixed': mixed, 'empty': empty}
+
+def same_events(first, second):
+    """Compares two note events arrays by arrays"""
+    assert type(first) == type(second)
+    if isinstance(first, events.PatternEvents):
+        assert first.times == second.times
+        first, second = first.pattern, second.pattern
+    assert np.array_equal(first.notes, second.notes)
+    assert np.array_equal(first.bounds, second.bounds)
+    assert np.array_equal(first.ends, second.ends)
+
+class TestSession():
+    """Test save_session() and load_session()"""
+
+    pieces = sequenced_pieces()
+
+    def test_one(self, tmp_path):
+        """Test every piece round-trips with its parameters and events"""
+        path = str(tmp_path / 'session.msq')
+        session.save_session(path, self.pieces)
+        loaded = session.load_session(path)
+        assert list(loaded) == list(self.pieces)
+        for name, music_piece in self.pieces.items():
+            output = loaded[name]
+            assert type(output) == type(music_piece)
+            assert (output.name, output.key_chord, output.add_to_chord, output.variation,
+                    output.seed) == (music_piece.name, music_piece.key_chord,
+                                     music_piece.add_to_chord, music_piece.variation,
+                                     music_piece.seed)
+            assert output.is_sequenced() == music_piece.is_sequenced()
+            if music_piece.is_sequenced():
+                same_events(output.note_events(), music_piece.note_events())
+                same_events(output.note_events(raw = True), music_piece.note_events(raw = True))
+        same_events(loaded['pop'].track_events, self.pieces['pop'].track_events)
+        assert loaded['jazz'].progression_states == self.pieces['jazz'].progression_states
+        assert np.array_equal(loaded['jazz'].progression_bounds,
+                              self.pieces['jazz'].progression_bounds)
+        assert loaded['country'].chord_tracks == self.pieces['country'].chord_tracks
+        assert ms.midi_bytes(loaded['pop'].playback_tracks(), False) == \
+            ms.midi_bytes(self.pieces['pop'].playback_tracks(), False)
+
+    def test_two(self, tmp_path):
+        """Test pieces are decoded on access from views of the file"""
+        path = str(tmp_path / 'session.msq')
+        session.save_session(path, self.pieces)
+        loaded = session.load_session(path)
+        assert len(loaded) == len(self.pieces) and 'jazz' in loaded
+        assert loaded._pieces == {}
+        track_events = loaded['jazz'].track_events
+        assert list(loaded._pieces) == ['jazz']
+        assert not track_events.notes.flags.owndata
+        assert loaded['jazz'] is loaded['jazz']
+        with pytest.raises(KeyError):
+            loaded['missing']
+
+    def test_three(self, tmp_path):
+        """Test loaded pieces regenerate like the pieces they were saved from"""
+        path = str(tmp_path / 'session.msq')
+        session.save_session(path, {'jazz': self.pieces['jazz']})
+        loaded = session.load_session(path)['jazz']
+        expected = ms.Jazz('Lovers Blues', 'Db', 'minor', 4, seed = 5)
+        expected.sequence(change_key = True, compact = True, play = False)
+        same_events(loaded.regenerate(1, 3, play = False),
+                    expected.regenerate(1, 3, play = False))
+
+    def test_four(self, tmp_path):
+        """Test added, replaced and removed pieces are saved"""
+        path = str(tmp_path / 'session.msq')
+        session.save_session(path, self.pieces)
+        loaded = session.load_session(path)
+        del loaded['mixed']
+        loaded['jazz'] = self.pieces['country']
+        loaded['new'] = self.pieces['pop']
+        loaded.save()
+        reloaded = session.load_session(path)
+        assert list(reloaded) == ['jazz', 'pop', 'country', 'empty', 'new']
+        assert reloaded['jazz'].name == 'Open Road'
+        same_events(reloaded['new'].track_events, self.pieces['pop'].track_events)
+        assert [name for name in os.listdir(tmp_path)] == ['session.msq']
+
+    def test_five(self, tmp_path):
+        """Test other files are rejected"""
+        path = tmp_path / 'other.msq'
+        path.write_bytes(b'MThd' + bytes(60))
+        with pytest.raises(ValueError):
+            session.load_session(str(path))
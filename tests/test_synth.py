@@ -0,0 +1,64 @@
+import wave
+import numpy as np
+import modules.music_sequencer as ms
+import modules.midi as midi
+import modules.render as render
+import modules.synth as synth
+
+def single_note(instrument = 1, duration = 0.5):
+    """Returns a track of one A4 note at full velocity"""
+    notes = np.array([(69, 0.0, duration, 127, -1)], dtype = ms.events.NOTE_DTYPE)
+    events = ms.events.NoteEvents(notes, np.array([0, 1]), np.array([duration]))
+    return [midi.MidiTrack(events, instrument, volume = 127)]
+
+class TestNumpySynth():
+    """Test the NumPy fallback synthesizer"""
+  
+    def test_one(self):
+        """Test audio does not depend on the chunk size"""
+        tracks = [midi.MidiTrack(ms.Jazz('Piece', 'C', 'major', 2, seed = 1)
+                                 .sequence(compact = True, play = False))]
+        expected = synth.NumpySynth(8000).synthesize(tracks, 100)
+        for chunk_frames in [1000, 4321]:
+            output = synth.NumpySynth(8000, chunk_frames).synthesize(tracks, 100)
+            assert (output == expected).all()
+        assert expected.shape[1] == 2
+        assert np.abs(expected).max() > 0
+  
+    def test_two(self):
+        """Test the envelope of a single note rises, sustains and releases"""
+        synthesizer = synth.NumpySynth(8000)
+        output = synthesizer.synthesize(single_note(41), 120)
+        attack, decay, sustain, release = synth.FAMILIES[5][1]
+        #Half a bar at 120 bpm lasts one second, followed by the release
+        assert len(output) == 8000 + int(np.ceil(release * 8000))
+        held = np.abs(output[int(0.8 * 8000):8000, 0]).max()
+        assert abs(held / 32767 - sustain * synthesizer.gain) < 0.01
+        assert np.abs(output[:int(attack * 8000 / 4), 0]).max() < held / 2
+        assert np.abs(output[-20:, 0]).max() < held / 20
+  
+    def test_three(self, tmp_path):
+        """Test render() writes a MIDI file to a waveform audio file"""
+        midi_path = str(tmp_path / 'note.mid')
+        audio_path = str(tmp_path / 'note.wav')
+        with open(midi_path, 'wb') as midi_file:
+            midi_file.write(midi.encode_midi(single_note(), bpm = 120))
+        result = synth.NumpySynth(8000, 1000).render(midi_path, audio_path)
+        assert result.audio_path == audio_path
+        with wave.open(audio_path, 'rb') as audio:
+            assert audio.getnchannels() == 2
+            assert audio.getframerate() == 8000
+            frames = audio.readframes(audio.getnframes())
+        assert frames == synth.NumpySynth(8000).synthesize(single_note(), 120).tobytes()
+  
+    def test_four(self):
+        """Test the default renderer falls back to the NumPy synthesizer"""
+        previous = render.set_renderer(None)
+        try:
+            renderer = render.get_renderer()
+            if render.FluidSynthRenderer().available():
+                assert isinstance(renderer, render.FluidSynthRenderer)
+            else:
+                assert isinstance(renderer, synth.NumpySynth)
+        finally:
+            render.set_renderer(previous)
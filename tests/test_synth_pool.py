@@ -0,0 +1,101 @@
+import os
+import signal
+import wave
+import pytest
+import modules.synth_pool as sp
+
+class SilentEngine():
+    """Engine rendering one chunk of silence per job"""
+    def load(self):
+        self.jobs = 0
+  
+    def render(self, midi_bytes):
+        self.jobs += 1
+        return (1, 2, 8000), iter([b'\x00\x00' * 800, self.jobs.to_bytes(2, 'little')])
+
+class FlagEngine(SilentEngine):
+    """Engine failing to load while its flag file exists"""
+    def __init__(self, flag):
+        self.flag = flag
+  
+    def load(self):
+        if os.path.exists(self.flag):
+            raise RuntimeError('Engine disabled')
+        super().load()
+
+class TestSynthPool():
+    """Test SynthPool rendering, health checks and restarts"""
+  
+    def test_one(self, tmp_path):
+        """Test render() writes streamed chunks to a waveform audio file"""
+        midi_path = str(tmp_path / 'job.mid')
+        audio_path = str(tmp_path / 'job.wav')
+        open(midi_path, 'wb').close()
+        with sp.SynthPool(1, engine = SilentEngine(), timeout = 10) as pool:
+            pool.render(midi_path, audio_path)
+            result = pool.render(midi_path, audio_path)
+        assert result.audio_path == audio_path
+        with wave.open(audio_path, 'rb') as audio:
+            assert audio.getframerate() == 8000
+            assert audio.getnframes() == 801
+            #Engine state survives between jobs in the same worker
+            assert audio.readframes(801)[-2:] == (2).to_bytes(2, 'little')
+  
+    def test_two(self):
+        """Test health() restarts a crashed worker"""
+        with sp.SynthPool(2, engine = SilentEngine(), timeout = 10) as pool:
+            status = pool.health()
+            assert [s['alive'] for s in status] == [True, True]
+            os.kill(status[0]['pid'], signal.SIGKILL)
+            pool._workers[0].process.join()
+            status = pool.health()
+            assert sorted(s['restarts'] for s in status) == [0, 1]
+            assert all(s['alive'] or s['restarts'] == 1 for s in status)
+  
+    def test_three(self):
+        """Test a job is retried on a restarted worker after a crash"""
+        with sp.SynthPool(1, engine = SilentEngine(), timeout = 10) as pool:
+            pool.available()
+            pool._workers[0].process.kill()
+            pool._workers[0].process.join()
+            chunks = list(pool.stream(b''))
+        assert chunks[0] == (1, 2, 8000)
+        assert len(chunks) == 3
+  
+    def test_four(self):
+        """Test pools with different SoundFonts or sample rates get different cache keys"""
+        import modules.music_sequencer as ms
+        keys = {ms.render_key(b'MThd', sp.SynthPool(1, soundfont, sample_rate))
+                for soundfont in ['one.sf2', 'two.sf2'] for sample_rate in [22050, 44100]}
+        assert len(keys) == 4
+        assert ms.render_key(b'MThd', sp.SynthPool(1, 'one.sf2')) == \
+            ms.render_key(b'MThd', sp.SynthPool(2, 'one.sf2'))
+  
+    def test_five(self, tmp_path):
+        """Test a worker failing to restart after a crash leaves the pool"""
+        flag = str(tmp_path / 'disabled')
+        with sp.SynthPool(1, engine = FlagEngine(flag), timeout = 10) as pool:
+            pool.available()
+            open(flag, 'w').close()
+            pool._workers[0].process.kill()
+            pool._workers[0].process.join()
+            with pytest.raises(sp.render.RenderError):
+                list(pool.stream(b''))
+            assert pool._workers == [] and pool._idle.empty()
+            #A new worker takes its place once the engine loads again
+            os.unlink(flag)
+            assert len(list(pool.stream(b''))) == 3
+            assert len(pool._workers) == 1
+  
+    def test_six(self, tmp_path, monkeypatch):
+        """Test engines resolve a default SoundFont for the warm synthesizer"""
+        soundfont = str(tmp_path / 'piano.sf2')
+        monkeypatch.setenv(sp.render.SOUNDFONT_VARIABLE, soundfont)
+        assert sp.FluidSynthEngine().soundfont == soundfont
+        assert sp.SynthPool(1).engine.soundfont == soundfont
+        monkeypatch.delenv(sp.render.SOUNDFONT_VARIABLE)
+        monkeypatch.setattr(sp.render, 'SOUNDFONT_PATHS', [str(tmp_path / 'missing.sf2'),
+                                                           soundfont])
+        open(soundfont, 'wb').close()
+        assert sp.FluidSynthEngine().soundfont == soundfont
+        assert sp.FluidSynthEngine('other.sf2').soundfont == 'other.sf2'